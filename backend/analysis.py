@@ -0,0 +1,320 @@
+"""analysis.py
+
+Moteur d'analyse partagé par l'API (main.py), l'import en direct (live.py)
+et l'analyse de cohorte hors ligne (batch.py) : détection des pics R, HRV
+par domaine et classification des battements.
+
+Le modèle Keras est chargé à la première classification (`get_model`), une
+fois par processus : les workers de batch.py ne le chargent que s'ils
+classent des battements.
+
+Versions des artefacts
+----------------------
+Chaque résultat mis en cache (pics R, HRV, classification, vue d'ensemble)
+est estampillé par `artifact_version(type)` : l'empreinte de ce qui le
+détermine (hash du fichier du modèle, versions de NeuroKit / SciPy /
+scikit-learn / Keras, méthodes et paramètres).  Un artefact estampillé
+autrement est obsolète : il est traité comme absent et recalculé.
+`versions()` donne le détail, `register_artifact` déclare les artefacts
+propres à l'application.
+
+Regroupement des battements
+---------------------------
+Avec `ECG_BEAT_CLUSTERING=<seuil>` (ex. 0.98), `classify_signal` ne passe
+pas tous les battements au modèle : les battements rééchantillonnés sont
+regroupés par corrélation avec des modèles courants (`cluster_beats`), seul
+le battement modèle de chaque groupe est classé (ainsi que les battements
+isolés) et sa classe est propagée aux battements du groupe.  Sur un Holter,
+où la plupart des battements sont normaux et presque identiques, le modèle
+ne voit plus que quelques centaines de battements.  Le seuil fait partie de
+la version de la classification ; `benchmarks/bench_clustering.py` mesure
+l'accord avec la classification complète et le débit.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from importlib import metadata
+from pathlib import Path
+from typing import Optional
+
+import neurokit2 as nk
+import numpy as np
+import pandas as pd
+from scipy.signal import resample
+from sklearn.preprocessing import MinMaxScaler
+
+import metrics
+
+MODEL_PATH = "best_model.h5"
+BEAT_SAMPLES = 186  # entrée du modèle de classification
+BEAT_LABELS = {
+    0: "Battement normal",
+    1: "Battement ectopique supraventriculaire",
+    2: "Battement ectopique ventriculaire",
+    3: "Battement de fusion",
+    4: "Battement inconnu",
+}
+
+# Paramètres des algorithmes (inclus dans les versions des artefacts)
+CLEAN_METHOD = "neurokit"
+PEAK_METHOD = "neurokit"
+# Regroupement des battements avant classification (None : tous les battements sont classés)
+CLUSTER_THRESHOLD = float(os.environ.get("ECG_BEAT_CLUSTERING") or 0) or None
+CLUSTER_AMPLITUDE = 0.1  # écart relatif d'amplitude toléré avec le modèle du groupe
+CLUSTER_CHUNK = 4096   # battements comparés d'un bloc aux modèles existants
+MAX_TEMPLATES = 1000   # au-delà, les formes nouvelles sont classées une à une
+
+_model = None
+_model_lock = threading.Lock()
+_versions: Optional[dict[str, dict]] = None
+_extra_versions: dict[str, dict] = {}
+
+
+def get_model():
+    """Modèle de classification, chargé une seule fois par processus."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from keras import models
+
+                _model = models.load_model(MODEL_PATH)
+    return _model
+
+
+def _package_version(name: str) -> Optional[str]:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _file_hash(path: str) -> Optional[str]:
+    sha = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                sha.update(chunk)
+    except OSError:
+        return None
+    return sha.hexdigest()
+
+
+def register_artifact(kind: str, **params) -> None:
+    """Déclare la version d'un artefact propre à l'application (vue d'ensemble…)."""
+    _extra_versions[kind] = params
+
+
+def versions() -> dict[str, dict]:
+    """Ce qui détermine chaque type d'artefact (calculé une fois par processus)."""
+    global _versions
+    if _versions is None:
+        rpeaks = {
+            "neurokit2": _package_version("neurokit2"),
+            "clean": CLEAN_METHOD,
+            "method": PEAK_METHOD,
+        }
+        _versions = {
+            "rpeaks": rpeaks,
+            "hrv": {**rpeaks, "hrv_normalize": False},
+            "classification": {
+                "model": _file_hash(MODEL_PATH),
+                "model_file": Path(MODEL_PATH).name,
+                "keras": _package_version("keras"),
+                "tensorflow": _package_version("tensorflow"),
+                "neurokit2": _package_version("neurokit2"),
+                "scipy": _package_version("scipy"),
+                "scikit-learn": _package_version("scikit-learn"),
+                "beat_samples": BEAT_SAMPLES,
+                "labels": BEAT_LABELS,
+            },
+        }
+        if CLUSTER_THRESHOLD is not None:
+            _versions["classification"]["clustering"] = {
+                "threshold": CLUSTER_THRESHOLD, "amplitude": CLUSTER_AMPLITUDE,
+            }
+    return {**_versions, **_extra_versions}
+
+
+def fingerprint(params: dict) -> str:
+    key = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+
+def artifact_version(kind: str) -> str:
+    """Empreinte courte de la version d'un type d'artefact."""
+    return fingerprint(versions()[kind])
+
+
+def detect_r_peaks(values: np.ndarray, fs: int, ecg_id: Optional[int] = None) -> np.ndarray:
+    """Index des pics R (nettoyage + méthode neurokit)."""
+    with metrics.stage("clean", ecg_id=ecg_id, n_samples=len(values)):
+        clean = nk.ecg_clean(values, sampling_rate=fs, method=CLEAN_METHOD)
+    with metrics.stage("peaks", ecg_id=ecg_id, n_samples=len(values)) as span:
+        _, info = nk.ecg_peaks(clean, sampling_rate=fs, method=PEAK_METHOD)
+        span.set(n_peaks=len(info["ECG_R_Peaks"]))
+    return np.asarray(info["ECG_R_Peaks"], dtype=int)
+
+
+def hrv_metrics(r_idx: np.ndarray, fs: int) -> dict:
+    """HRV temporelle, fréquentielle et non linéaire d'une suite de pics R."""
+    with metrics.stage("hrv_time", n_peaks=len(r_idx)):
+        hrv_time = nk.hrv_time(r_idx, sampling_rate=fs, show=False)
+    with metrics.stage("hrv_frequency", n_peaks=len(r_idx)):
+        hrv_freq = nk.hrv_frequency(r_idx, sampling_rate=fs, show=False, normalize=False)
+    with metrics.stage("hrv_nonlinear", n_peaks=len(r_idx)):
+        hrv_nl = nk.hrv_nonlinear(r_idx, sampling_rate=fs, show=False)
+    return {
+        "time_domain": {c: float(hrv_time[c].iloc[0]) for c in hrv_time.columns},
+        "frequency_domain": {c: float(hrv_freq[c].iloc[0]) for c in hrv_freq.columns},
+        "non_linear_domain": {c: float(hrv_nl[c].iloc[0]) for c in hrv_nl.columns},
+    }
+
+
+def classify_beats(beats: np.ndarray) -> list[str]:
+    """Libellés du modèle pour des battements déjà rééchantillonnés (n × 186)."""
+    metrics.MODEL_BATCH_SIZE.observe(len(beats))
+    with metrics.stage("predict", batch_size=len(beats)):
+        y_pred = np.argmax(get_model().predict(np.expand_dims(beats, axis=2), verbose=0), axis=1)
+    return [BEAT_LABELS.get(int(k), "Inconnu") for k in y_pred]
+
+
+def cluster_beats(beats: np.ndarray, threshold: float) -> tuple[np.ndarray, np.ndarray]:
+    """Regroupe les battements de forme quasi identique.
+
+    Un battement rejoint le groupe dont le battement modèle lui est le plus
+    corrélé (Pearson ≥ `threshold`, amplitude à `CLUSTER_AMPLITUDE` près : la
+    corrélation seule ignore l'amplitude, que le modèle voit), sinon il
+    devient le modèle d'un nouveau groupe.  Les battements sont comparés par
+    blocs aux modèles existants (un produit matriciel) ; seules les formes
+    nouvelles sont traitées une à une.  Les battements plats forment un seul
+    groupe.
+
+    Retourne le groupe de chaque battement (-1 : isolé, au-delà de
+    `MAX_TEMPLATES` groupes) et l'indice du battement modèle de chaque groupe.
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Seuil de corrélation hors de ]0, 1] : {threshold}")
+    n, length = beats.shape
+    centered = beats - beats.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centered, axis=1, keepdims=True)
+    unit = np.divide(centered, norms, out=np.zeros_like(centered), where=norms > 0)
+    amplitude = norms[:, 0]
+
+    assign = np.full(n, -1)
+    templates = np.zeros((MAX_TEMPLATES, length))  # vecteurs unitaires : produit scalaire = corrélation
+    exemplars: list[int] = []
+
+    def best_match(corr: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Modèle le plus corrélé parmi ceux d'amplitude proche
+        reference = amplitude[exemplars]
+        close = np.abs(amplitude[rows, None] - reference) <= CLUSTER_AMPLITUDE * reference
+        corr = np.where(close, corr, -np.inf)
+        best = corr.argmax(axis=1)
+        return best, corr[np.arange(len(rows)), best] >= threshold
+
+    flat = np.flatnonzero(amplitude == 0)
+    if len(flat):  # modèle nul : corrélation 0 avec tout battement non plat
+        assign[flat] = 0
+        exemplars.append(int(flat[0]))
+
+    for start in range(0, n, CLUSTER_CHUNK):
+        stop = min(start + CLUSTER_CHUNK, n)
+        todo = start + np.flatnonzero(assign[start:stop] < 0)
+        if exemplars and len(todo):
+            best, matched = best_match(unit[todo] @ templates[:len(exemplars)].T, todo)
+            assign[todo[matched]] = best[matched]
+            todo = todo[~matched]
+        # Formes nouvelles, y compris proches d'un modèle créé dans ce bloc
+        for i in todo:
+            if exemplars:
+                best, matched = best_match((templates[:len(exemplars)] @ unit[i])[None], np.array([i]))
+                if matched[0]:
+                    assign[i] = best[0]
+                    continue
+            if len(exemplars) < MAX_TEMPLATES:
+                templates[len(exemplars)] = unit[i]
+                assign[i] = len(exemplars)
+                exemplars.append(int(i))
+    return assign, np.asarray(exemplars, dtype=np.int64)
+
+
+def classify_clustered(beats: np.ndarray, threshold: float) -> tuple[list[str], dict]:
+    """Classe les modèles des groupes et les battements isolés, propage aux groupes.
+
+    Retourne les libellés de tous les battements et les chiffres du regroupement.
+    """
+    with metrics.stage("cluster", n_beats=len(beats)) as span:
+        assign, exemplars = cluster_beats(beats, threshold)
+        span.set(n_clusters=len(exemplars))
+    isolated = np.flatnonzero(assign < 0)
+    selected = np.concatenate([exemplars, isolated])
+    predicted = np.asarray(classify_beats(beats[selected]) if len(selected) else [], dtype=object)
+    labels = np.empty(len(beats), dtype=object)
+    grouped = assign >= 0
+    labels[grouped] = predicted[:len(exemplars)][assign[grouped]]
+    labels[isolated] = predicted[len(exemplars):]
+    return labels.tolist(), {
+        "threshold": threshold,
+        "n_clusters": len(exemplars),
+        "n_isolated": len(isolated),
+        "n_classified": len(selected),
+    }
+
+
+def resampled_beats(
+    values: np.ndarray, fs: int, ecg_id: Optional[int] = None
+) -> tuple[list, np.ndarray, np.ndarray]:
+    """Battements d'un enregistrement prêts pour le modèle.
+
+    Retourne les clés d'epoch NeuroKit, la matrice des battements
+    rééchantillonnés (n × BEAT_SAMPLES) et les pics R détectés.
+    """
+    # Normalisation des données
+    scaler = MinMaxScaler()
+    normalized = scaler.fit_transform(np.asarray(values).reshape(-1, 1)).flatten()
+
+    # Traitement ECG avec NeuroKit (nettoyage, pics, délinéation)
+    with metrics.stage("process", ecg_id=ecg_id, n_samples=len(normalized)):
+        signals, info = nk.ecg_process(normalized, sampling_rate=fs, method="neurokit")
+    with metrics.stage("epoching", ecg_id=ecg_id) as span:
+        epochs = nk.ecg_segment(signals["ECG_Clean"], rpeaks=None, sampling_rate=fs, show=False)
+        span.set(n_beats=len(epochs))
+
+    # Préparation des données pour le modèle
+    with metrics.stage("resample", n_beats=len(epochs)):
+        beats = pd.concat(
+            [pd.Series(resample(epochs[i]["Signal"], BEAT_SAMPLES)) for i in epochs.keys()], axis=1
+        ).T.to_numpy()
+    return list(epochs.keys()), beats, np.asarray(info["ECG_R_Peaks"], dtype=np.int64)
+
+
+def classify_signal(
+    values: np.ndarray, fs: int, ecg_id: Optional[int] = None,
+    cluster_threshold: Optional[float] = CLUSTER_THRESHOLD,
+) -> dict:
+    """Classification de tous les battements d'un enregistrement.
+
+    Retourne `nombre_de_battements`, `beatsPrediction` ([clé d'epoch NeuroKit,
+    libellé]) et `beatsSample` (pic R de chaque epoch, en échantillons), comme
+    l'analyse enregistrée par l'API ; avec `cluster_threshold`, les chiffres
+    du regroupement (`clustering`).
+    """
+    keys, beats, peaks = resampled_beats(values, fs, ecg_id)
+    if cluster_threshold:
+        labels, clustering = classify_clustered(beats, cluster_threshold)
+    else:
+        labels, clustering = classify_beats(beats), None
+    result = {
+        "nombre_de_battements": len(keys),
+        "beatsPrediction": [[str(key), label] for key, label in zip(keys, labels)],
+    }
+    # Epochs découpés sur les pics détectés par ecg_process (même nettoyage, même méthode)
+    if len(peaks) == len(keys):
+        result["beatsSample"] = [int(p) for p in peaks]
+    if clustering is not None:
+        result["clustering"] = clustering
+    return result
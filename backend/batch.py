@@ -0,0 +1,265 @@
+"""batch.py
+
+Analyse hors ligne d'une cohorte : classification des battements et HRV de
+chaque enregistrement, avec le moteur de l'API (analysis.py), en parallèle
+sur tous les cœurs.
+
+Usage (depuis backend/) :
+    python batch.py                          # tous les ECG de la base
+    python batch.py --dir data_csv --fs 360  # tous les CSV d'un répertoire
+    python batch.py --workers 4 --no-classify --out resultats
+    python batch.py --cluster 0.98           # regroupement des battements (voir analysis.py)
+
+Sources
+-------
+* base (défaut) : chaque ECG, avec son signal binaire (converti au besoin
+  comme au premier accès par l'API) et ses pics R en cache ;
+* `--dir` : chaque CSV du répertoire, lu directement (rien n'est écrit à
+  côté) ; la fréquence vient de la colonne de temps, sinon de `--fs`.
+
+Résultats (Parquet, nécessite pyarrow)
+--------------------------------------
+* `<out>/records/<clé>.beats.parquet` : un battement par ligne (epoch,
+  classe) ;
+* `<out>/records/<clé>.summary.parquet` : une ligne par enregistrement
+  (durée, pics R, fréquence moyenne, nombre de battements par classe, HRV
+  temporelle / fréquentielle / non linéaire, statut, durée de calcul) ;
+* `<out>/cohort.parquet` : toutes les lignes de résumé.
+
+Reprise : un enregistrement dont le résumé existe déjà pour la même version
+du contenu (hash, ou taille et date du CSV) et du moteur (versions des
+artefacts HRV et classification, voir analysis.py) est sauté ; `--force`
+recalcule tout.  Les erreurs sont consignées dans le résumé et retentées au lancement
+suivant.
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+import analysis
+import signal_store
+from sniff import PREFERRED_LEAD, SNIFF_SIZE, sniff_csv
+
+try:  # dépendance optionnelle : écriture Parquet
+    import pyarrow  # noqa: F401
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+
+# ---------------------------------------------------------------------------
+# Enregistrements à traiter
+# ---------------------------------------------------------------------------
+def jobs_from_db(lead: Optional[str]) -> Iterator[dict]:
+    from sqlalchemy import select
+
+    from ecg_database import ECGRecord, Session, ensure_schema
+    from registry import fill_signal_info, meta_from_record
+
+    ensure_schema()
+    with Session() as db:
+        for record in db.scalars(select(ECGRecord).order_by(ECGRecord.id)):
+            if fill_signal_info(record):
+                db.commit()
+            meta = meta_from_record(record)
+            yield {
+                "key": f"ecg{meta.ecg_id}",
+                "ecg_id": meta.ecg_id,
+                "patient_id": meta.patient_id,
+                "source": record.fichier_csv,
+                "base": meta.storage_path,
+                "csv": None,
+                "lead": lead or meta.default_lead,
+                "fs": meta.fs,
+                "version": meta.content_hash or "",
+            }
+
+
+def jobs_from_dir(root: Path, fs: Optional[int], lead: Optional[str]) -> Iterator[dict]:
+    for path in sorted(root.rglob("*.csv")):
+        stat = path.stat()
+        yield {
+            "key": str(path.relative_to(root).with_suffix("")).replace(os.sep, "__"),
+            "ecg_id": None,
+            "patient_id": None,
+            "source": str(path),
+            "base": None,
+            "csv": str(path),
+            "lead": lead,
+            "fs": fs,
+            "version": f"{stat.st_size}-{stat.st_mtime_ns}",
+        }
+
+
+# ---------------------------------------------------------------------------
+# Travail par enregistrement (dans un worker)
+# ---------------------------------------------------------------------------
+def read_csv_lead(path: str, lead: Optional[str]) -> tuple[np.ndarray, str, Optional[float]]:
+    with open(path, "rb") as f:
+        fmt = sniff_csv(f.read(SNIFF_SIZE))
+    lead = lead or fmt.default_lead
+    if lead not in fmt.leads:
+        raise LookupError(f"Dérivation '{lead}' absente ({', '.join(fmt.leads)})")
+    # Même lecture que signal_store.SignalWriter
+    col = fmt.columns.index(lead)
+    table = pd.read_csv(
+        path, header=None, skiprows=1 if fmt.has_header else 0,
+        sep=r"\s+" if fmt.delimiter == " " else fmt.delimiter, usecols=[col], dtype=np.float64,
+    )
+    return table[col].to_numpy(), lead, fmt.sampling_rate
+
+
+def analyze_record(job: dict, classify: bool, out_dir: str, cluster: Optional[float] = None) -> dict:
+    """Analyse un enregistrement, écrit ses fichiers et retourne son résumé."""
+    start = time.perf_counter()
+    summary = {k: job[k] for k in ("key", "ecg_id", "patient_id", "source", "version")}
+    summary.update(status="ok", error=None)
+    try:
+        fs = job["fs"]
+        if job["base"] is not None:
+            lead = job["lead"] or PREFERRED_LEAD
+            values = signal_store.load_signal(job["base"], lead)
+            version = analysis.artifact_version("rpeaks")
+            r_idx = signal_store.load_artifact(job["base"], lead, "rpeaks", version)
+            if r_idx is None:
+                r_idx = analysis.detect_r_peaks(values, fs, job["ecg_id"])
+                signal_store.save_artifact(job["base"], lead, "rpeaks", r_idx, version)
+        else:
+            values, lead, detected_fs = read_csv_lead(job["csv"], job["lead"])
+            fs = int(round(detected_fs)) if detected_fs else fs
+            if not fs:
+                raise ValueError("Fréquence inconnue : pas de colonne de temps, utiliser --fs")
+            r_idx = analysis.detect_r_peaks(values, fs)
+
+        rr = np.diff(r_idx) / fs
+        summary.update(
+            lead=lead, fs=fs, n_samples=len(values), duration_s=len(values) / fs,
+            n_rpeaks=len(r_idx), mean_hr_bpm=float(60 / rr.mean()) if len(rr) else None,
+        )
+        if len(r_idx) >= 3:
+            for domain in analysis.hrv_metrics(r_idx, fs).values():
+                summary.update(domain)
+
+        records = Path(out_dir) / "records"
+        if classify:
+            result = analysis.classify_signal(
+                values, fs, job["ecg_id"], cluster or analysis.CLUSTER_THRESHOLD
+            )
+            beats = pd.DataFrame(result["beatsPrediction"], columns=["epoch", "label"])
+            beats.insert(0, "key", job["key"])
+            _write(beats, records / f"{job['key']}.beats.parquet")
+            summary["n_beats"] = result["nombre_de_battements"]
+            if "clustering" in result:  # battements passés au modèle
+                summary["n_classified"] = result["clustering"]["n_classified"]
+            for label in analysis.BEAT_LABELS.values():
+                summary[f"n_{label}"] = int((beats["label"] == label).sum())
+    except Exception as exc:  # consigné dans le résumé, retenté au prochain lancement
+        summary.update(status="error", error=f"{type(exc).__name__}: {exc}")
+    summary["elapsed_s"] = time.perf_counter() - start
+    _write(pd.DataFrame([summary]), Path(out_dir) / "records" / f"{job['key']}.summary.parquet")
+    return summary
+
+
+def _write(df: pd.DataFrame, path: Path) -> None:
+    # Écriture puis renommage : un fichier présent est toujours complet
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def previous_summary(job: dict, out_dir: Path) -> Optional[dict]:
+    path = out_dir / "records" / f"{job['key']}.summary.parquet"
+    if not path.exists():
+        return None
+    try:
+        row = pd.read_parquet(path).iloc[0].to_dict()
+    except Exception:
+        return None
+    if row.get("status") != "ok" or row.get("version") != job["version"]:
+        return None
+    return row
+
+
+# ---------------------------------------------------------------------------
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Analyse hors ligne de tous les enregistrements")
+    parser.add_argument("--dir", type=Path, help="Répertoire de CSV (par défaut : la base)")
+    parser.add_argument("--fs", type=int, help="Fréquence des CSV sans colonne de temps (Hz)")
+    parser.add_argument("--lead", help="Dérivation (par défaut MLII ou la première)")
+    parser.add_argument("--out", type=Path, default=Path("batch_results"), help="Répertoire de sortie")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processus en parallèle")
+    parser.add_argument("--no-classify", action="store_true", help="HRV seulement, sans le modèle")
+    parser.add_argument("--cluster", type=float, metavar="SEUIL",
+                        help="Regroupe les battements (corrélation ≥ SEUIL) et ne classe que les modèles")
+    parser.add_argument("--force", action="store_true", help="Recalcule même les résultats existants")
+    parser.add_argument("--limit", type=int, help="Nombre maximal d'enregistrements")
+    args = parser.parse_args(argv)
+
+    if pyarrow is None:
+        sys.exit("pyarrow est requis pour écrire les résultats Parquet : pip install pyarrow")
+
+    jobs = list(jobs_from_dir(args.dir, args.fs, args.lead) if args.dir else jobs_from_db(args.lead))
+    jobs = jobs[:args.limit] if args.limit else jobs
+    engine = analysis.artifact_version("hrv")
+    if not args.no_classify:
+        engine += "-" + analysis.artifact_version("classification")
+        if args.cluster:
+            engine += f"-c{args.cluster:g}"
+    for job in jobs:
+        job["version"] = f"{job['version']}:{engine}"
+    summaries: dict[str, dict] = {}
+    todo = []
+    for job in jobs:
+        previous = None if args.force else previous_summary(job, args.out)
+        if previous is not None:
+            summaries[job["key"]] = previous
+        else:
+            todo.append(job)
+    print(f"{len(jobs)} enregistrement(s), {len(jobs) - len(todo)} déjà analysé(s), "
+          f"{len(todo)} à traiter sur {args.workers} processus", flush=True)
+
+    start = time.perf_counter()
+    failed = 0
+    if todo:
+        # « spawn » : chaque worker importe le moteur et charge son propre modèle
+        with ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = [
+                pool.submit(analyze_record, job, not args.no_classify, str(args.out), args.cluster)
+                for job in todo
+            ]
+            for done, future in enumerate(as_completed(futures), 1):
+                summary = future.result()
+                summaries[summary["key"]] = summary
+                failed += summary["status"] != "ok"
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed * 60
+                remaining = (len(todo) - done) / rate if rate else 0
+                detail = summary["error"] or f"{summary.get('n_rpeaks', 0)} pics R"
+                print(f"[{done}/{len(todo)}] {summary['key']} {summary['status']} "
+                      f"({summary['elapsed_s']:.1f} s, {detail}) — {rate:.1f} enr./min, "
+                      f"reste ~{remaining:.1f} min", flush=True)
+
+    elapsed = time.perf_counter() - start
+    cohort = pd.DataFrame([summaries[job["key"]] for job in jobs if job["key"] in summaries])
+    if not cohort.empty:
+        _write(cohort, args.out / "cohort.parquet")
+    rate = len(todo) / elapsed * 60 if todo and elapsed else 0
+    print(f"{len(todo)} enregistrement(s) traité(s) en {elapsed:.1f} s ({rate:.1f} enr./min), "
+          f"{failed} en erreur ; résumé : {args.out / 'cohort.parquet'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""bench_clustering.py
+
+Regroupement des battements avant classification (`analysis.cluster_beats`) :
+pour chaque seuil, accord des libellés avec la classification complète
+(global et par classe) et débit de la classification.
+
+Usage (depuis backend/, avec le modèle best_model.h5) :
+    python benchmarks/bench_clustering.py [fichier.csv ...] [--thresholds 0.95 0.98 0.99]
+"""
+import argparse
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import analysis  # noqa: E402
+from batch import read_csv_lead  # noqa: E402
+
+
+def bench_file(csv_path: Path, fs: int, thresholds: list[float]):
+    values, lead, detected_fs = read_csv_lead(str(csv_path), None)
+    fs = int(round(detected_fs)) if detected_fs else fs
+    t = time.perf_counter()
+    _, beats, _ = analysis.resampled_beats(values, fs)
+    t_prep = time.perf_counter() - t
+    print(f"\n{csv_path} ({lead}, {len(values) / fs / 60:.1f} min, {len(beats)} battements, "
+          f"préparation {t_prep:.1f} s)")
+
+    t = time.perf_counter()
+    full = np.asarray(analysis.classify_beats(beats), dtype=object)
+    t_full = time.perf_counter() - t
+    print(f"  complet      : {len(beats):6d} battements classés, {t_full:6.2f} s "
+          f"({len(beats) / t_full:8.0f} batt./s)")
+    counts = Counter(full)
+
+    for threshold in thresholds:
+        t = time.perf_counter()
+        labels, stats = analysis.classify_clustered(beats, threshold)
+        t_cluster = time.perf_counter() - t
+        labels = np.asarray(labels, dtype=object)
+        agree = float(np.mean(labels == full)) if len(beats) else 1.0
+        print(f"  seuil {threshold:<6g} : {stats['n_classified']:6d} battements classés "
+              f"({stats['n_clusters']} groupes, {stats['n_isolated']} isolés), {t_cluster:6.2f} s "
+              f"({len(beats) / t_cluster:8.0f} batt./s, ×{t_full / t_cluster:.1f}), "
+              f"accord {agree:.2%}")
+        for label, n in counts.most_common():
+            same = int(np.sum((full == label) & (labels == label)))
+            print(f"      {label:<42} {same:6d}/{n:<6d} ({same / n:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("csv", nargs="*", type=Path, help="CSV (par défaut ceux de data_csv)")
+    parser.add_argument("--fs", type=int, default=360, help="Fréquence des CSV sans colonne de temps")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.95, 0.98, 0.99])
+    args = parser.parse_args()
+    paths = args.csv or sorted(Path("data_csv").rglob("*.csv"))
+    for path in paths:
+        bench_file(path, args.fs, args.thresholds)
+
+
+if __name__ == "__main__":
+    main()
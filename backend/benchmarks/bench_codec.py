@@ -0,0 +1,84 @@
+"""bench_codec.py
+
+Vérifie l'aller-retour sans perte du codec `.ecgz` sur les CSV fournis et
+mesure taille / vitesse par compresseur disponible.
+
+Usage (depuis backend/) :
+    python benchmarks/bench_codec.py [fichier.csv ...]
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import codec  # noqa: E402
+from sniff import SNIFF_SIZE, sniff_csv  # noqa: E402
+
+N_RANDOM_READS = 1000
+WINDOW = 3600  # 10 s à 360 Hz
+
+
+def bench_file(csv_path: Path, tmp_dir: Path):
+    with csv_path.open("rb") as f:
+        fmt = sniff_csv(f.read(SNIFF_SIZE))
+    df = pd.read_csv(
+        csv_path, sep=fmt.delimiter, header=0 if fmt.has_header else None,
+        names=None if fmt.has_header else fmt.columns,
+    )
+    csv_size = csv_path.stat().st_size
+    print(f"\n{csv_path} ({csv_size / 1e6:.2f} Mo CSV)")
+    rng = np.random.default_rng(0)
+    for lead in fmt.leads:
+        values = df[lead].to_numpy(dtype=np.float64)
+        try:
+            q, decimals, step = codec.quantize(values)
+        except ValueError as exc:
+            print(f"  {lead}: ignoré ({exc})")
+            continue
+        print(f"  {lead}: {len(values)} échantillons, {decimals} décimales, pas {step}, "
+              f"f64 {values.nbytes / 1e6:.2f} Mo")
+        for name in codec.available_compressors():
+            path = tmp_dir / f"{csv_path.stem}.{lead}.{name}.ecgz"
+            t = time.perf_counter()
+            codec.write(path, values, compressor=name)
+            t_enc = time.perf_counter() - t
+
+            t = time.perf_counter()
+            decoded = codec.read(path)
+            t_dec = time.perf_counter() - t
+            assert np.array_equal(decoded, values), f"aller-retour faux ({lead}, {name})"
+
+            signal = codec.CompressedSignal(path)
+            starts = rng.integers(0, max(len(values) - WINDOW, 1), N_RANDOM_READS)
+            t = time.perf_counter()
+            for s in starts:
+                window = signal[int(s):int(s) + WINDOW]
+            t_win = (time.perf_counter() - t) / N_RANDOM_READS
+            assert np.array_equal(window, values[int(s):int(s) + WINDOW])
+
+            size = path.stat().st_size
+            print(f"    {name:5s} {size / 1e3:8.0f} Ko  ×{csv_size / size:5.1f} vs CSV  "
+                  f"×{values.nbytes / size:5.1f} vs f64  "
+                  f"enc {t_enc * 1e3:6.1f} ms  dec {t_dec * 1e3:5.1f} ms  "
+                  f"fenêtre {t_win * 1e6:6.0f} µs")
+            path.unlink()
+
+
+def main():
+    import tempfile
+
+    files = [Path(p) for p in sys.argv[1:]] or sorted(Path("data_csv").rglob("*.csv"))
+    if not files:
+        sys.exit("Aucun fichier CSV trouvé")
+    with tempfile.TemporaryDirectory() as tmp:
+        for csv_path in files:
+            bench_file(csv_path, Path(tmp))
+    print("\nAller-retour sans perte vérifié.")
+
+
+if __name__ == "__main__":
+    main()
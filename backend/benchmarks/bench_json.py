@@ -0,0 +1,103 @@
+"""bench_json.py
+
+Micro-benchmark de sérialisation d'un segment de 180 s (`/segment`) :
+ancienne chaîne (listes Python → sanitize → jsonable_encoder → json) contre
+serialization.dumps sur tableaux NumPy en une passe.
+
+Usage (depuis backend/) :
+    python benchmarks/bench_json.py [fichier.csv]
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import serialization  # noqa: E402
+from sniff import SNIFF_SIZE, sniff_csv  # noqa: E402
+
+FS = 360
+DURATION = 180
+REPEAT = 20
+
+
+def build_arrays(values: np.ndarray):
+    n = FS * DURATION
+    times = np.arange(n) / FS
+    values = values[:n]
+    r_idx = np.arange(FS // 2, n, int(0.8 * FS))  # ~75 bpm
+    r_times = r_idx / FS
+    metrics = {"time_domain": {"HRV_MeanNN": 800.0, "HRV_SDANN1": float("nan")},
+               "frequency_domain": {"HRV_ULF": float("nan"), "HRV_LF": 0.012},
+               "non_linear_domain": {"HRV_SD1": 20.5, "HRV_DFA_alpha2": float("inf")}}
+    return times, values, r_idx, r_times, metrics
+
+
+def sanitize(obj):
+    """Ancien nettoyage récursif (retiré de utils.py), conservé comme référence."""
+    if isinstance(obj, dict):
+        return {k: sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [sanitize(v) for v in obj]
+    if isinstance(obj, (np.integer, int)):
+        return int(obj)
+    if isinstance(obj, (np.floating, float)):
+        return None if np.isnan(obj) or np.isinf(obj) else float(obj)
+    if hasattr(obj, "tolist"):
+        return sanitize(obj.tolist())
+    return obj
+
+
+def old_payload(times, values, r_idx, r_times, metrics):
+    ecg_data = [[float(t), float(v)] for t, v in zip(times, values)]
+    r_peaks = np.column_stack((r_times, values[r_idx])).tolist()
+    rr = [[float(t), float(i)] for t, i in zip(r_times[1:], np.diff(r_times))]
+    result = {"ecg_data": ecg_data, "r_peaks": r_peaks, "rr_intervals": rr, "metrics": metrics}
+    return JSONResponse(content=jsonable_encoder(sanitize(result))).body
+
+
+def new_payload(times, values, r_idx, r_times, metrics):
+    result = {
+        "ecg_data": np.column_stack((times, values)),
+        "r_peaks": np.column_stack((r_times, values[r_idx])),
+        "rr_intervals": np.column_stack((r_times[1:], np.diff(r_times))),
+        "metrics": metrics,
+    }
+    return serialization.dumps(result)
+
+
+def timed(fn, args) -> tuple[float, bytes]:
+    best = float("inf")
+    for _ in range(REPEAT):
+        t = time.perf_counter()
+        body = fn(*args)
+        best = min(best, time.perf_counter() - t)
+    return best, body
+
+
+def main():
+    csv_path = Path(sys.argv[1]) if len(sys.argv) > 1 else next(Path("data_csv").rglob("*.csv"))
+    with csv_path.open("rb") as f:
+        fmt = sniff_csv(f.read(SNIFF_SIZE))
+    df = pd.read_csv(csv_path, sep=fmt.delimiter, header=0 if fmt.has_header else None,
+                     names=None if fmt.has_header else fmt.columns)
+    values = df[fmt.default_lead].to_numpy(dtype=np.float64)
+    args = build_arrays(values)
+    t_old, body_old = timed(old_payload, args)
+    t_new, body_new = timed(new_payload, args)
+    assert json.loads(body_old) == json.loads(body_new), "contenus différents"
+    backend = "orjson" if serialization.orjson is not None else "json (repli)"
+    print(f"Segment {DURATION} s à {FS} Hz ({len(args[0])} points), meilleur de {REPEAT}")
+    print(f"  sanitize + jsonable_encoder + json : {t_old * 1e3:7.1f} ms  {len(body_old) / 1e3:7.0f} Ko")
+    print(f"  serialization.dumps [{backend}]    : {t_new * 1e3:7.1f} ms  {len(body_new) / 1e3:7.0f} Ko")
+    print(f"  gain ×{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
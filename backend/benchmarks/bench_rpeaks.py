@@ -0,0 +1,100 @@
+"""bench_rpeaks.py
+
+Compare le détecteur incrémental (`rpeaks.StreamingRPeakDetector`) à la
+détection batch (`nk.ecg_clean` + `nk.ecg_peaks`, méthode neurokit) sur les
+CSV fournis : concordance des pics (sensibilité / valeur prédictive à
+±TOLERANCE, part des pics identiques à l'échantillon près et à ±2
+échantillons), latence d'émission, taille de l'état et débit en
+échantillons/s selon la taille des blocs.
+
+Usage (depuis backend/) :
+    python benchmarks/bench_rpeaks.py [fichier.csv ...]
+"""
+import sys
+import time
+from pathlib import Path
+
+import neurokit2 as nk
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from rpeaks import StreamingRPeakDetector  # noqa: E402
+from sniff import SNIFF_SIZE, sniff_csv  # noqa: E402
+
+FS = 360
+TOLERANCE = 0.05       # s
+CHUNKS = (0.1, 1.0, 10.0)  # s par bloc
+
+
+def load_lead(csv_path: Path) -> np.ndarray:
+    with csv_path.open("rb") as f:
+        fmt = sniff_csv(f.read(SNIFF_SIZE))
+    df = pd.read_csv(csv_path, sep=fmt.delimiter, header=0 if fmt.has_header else None,
+                     names=None if fmt.has_header else fmt.columns)
+    return df[fmt.default_lead].to_numpy(dtype=np.float64)
+
+
+def batch(signal: np.ndarray) -> tuple[np.ndarray, float]:
+    t = time.perf_counter()
+    clean = nk.ecg_clean(signal, sampling_rate=FS)
+    _, info = nk.ecg_peaks(clean, sampling_rate=FS, method="neurokit")
+    return np.asarray(info["ECG_R_Peaks"], dtype=np.int64), time.perf_counter() - t
+
+
+def stream(signal: np.ndarray, chunk: int):
+    """Pics, durée, latence (échantillons reçus après le pic avant son émission), état max."""
+    detector = StreamingRPeakDetector(FS)
+    peaks, latency, state = [], [], 0
+    t = time.perf_counter()
+    for i in range(0, len(signal), chunk):
+        found = detector.process(signal[i:i + chunk])
+        received = min(i + chunk, len(signal))
+        peaks.extend(found)
+        latency.extend(received - found)
+        state = max(state, detector.state_size)
+    peaks.extend(detector.flush())
+    elapsed = time.perf_counter() - t
+    return np.asarray(peaks, dtype=np.int64), elapsed, np.asarray(latency), state
+
+
+def agreement(reference: np.ndarray, found: np.ndarray, tolerance: int) -> dict:
+    if not len(reference) or not len(found):
+        return {"se": 0.0, "ppv": 0.0, "exact": 0.0, "near": 0.0}
+    pos = np.clip(np.searchsorted(found, reference), 1, len(found) - 1)
+    nearest = np.where(
+        np.abs(found[pos] - reference) < np.abs(found[pos - 1] - reference), found[pos], found[pos - 1]
+    )
+    gap = np.abs(nearest - reference)
+    matched = int(np.sum(gap <= tolerance))
+    return {
+        "se": matched / len(reference),
+        "ppv": min(matched, len(found)) / len(found),
+        "exact": float(np.mean(gap == 0)),
+        "near": float(np.mean(gap <= 2)),
+    }
+
+
+def main():
+    paths = [Path(p) for p in sys.argv[1:]] or sorted(Path("data_csv").rglob("*.csv"))
+    tolerance = int(TOLERANCE * FS)
+    for path in paths:
+        signal = load_lead(path)
+        reference, t_batch = batch(signal)
+        print(f"{path.name} : {len(signal)} échantillons, {len(reference)} pics (batch)")
+        print(f"  batch               : {len(signal) / t_batch / 1e6:6.2f} M éch./s")
+        for seconds in CHUNKS:
+            chunk = int(seconds * FS)
+            found, elapsed, latency, state = stream(signal, chunk)
+            score = agreement(reference, found, tolerance)
+            print(
+                f"  flux, blocs {seconds:>4} s : {len(signal) / elapsed / 1e6:6.2f} M éch./s  "
+                f"Se {score['se']:.2%}  VPP {score['ppv']:.2%}  "
+                f"identiques {score['exact']:.1%} (±2 éch. {score['near']:.1%})  "
+                f"latence max {latency.max() / FS:.2f} s  état max {state} éch."
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""codec.py
+
+Codec d'archivage des signaux ECG (`.ecgz`).
+
+Principe
+--------
+1. Quantification sans perte en int16 à la résolution de la source : les
+   valeurs issues d'un CSV ont un nombre fini de décimales (ex. `-0.345`),
+   on les ramène à des entiers `round(x * 10**d) / pas` dont la division
+   redonne exactement les mêmes float64.  Un signal qui ne se quantifie pas
+   exactement (ou qui dépasse l'int16) est refusé (`ValueError`).
+2. Codage delta par blocs, en arithmétique int16 modulaire : le cumul
+   inverse retombe exactement sur les valeurs même en cas de débordement.
+3. Compression bloc par bloc (zstd, sinon lz4, sinon zlib) avec un index
+   des blocs : une lecture de fenêtre ne décompresse que les blocs touchés.
+
+Format du fichier
+-----------------
+    b"ECGZ" | longueur en-tête (uint32) | en-tête JSON | blocs compressés
+    | index des blocs (uint64 × (n_blocs + 1)) | position de l'index (uint64)
+"""
+from __future__ import annotations
+
+import json
+import struct
+import zlib
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+try:  # dépendances optionnelles
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover
+    lz4_frame = None
+
+MAGIC = b"ECGZ"
+VERSION = 1
+BLOCK_SIZE = 16384  # échantillons par bloc (~45 s à 360 Hz)
+MAX_DECIMALS = 6
+CACHED_BLOCKS = 8  # blocs décompressés gardés par CompressedSignal
+INDEX_DTYPE = np.dtype("<u8")
+QUANT_DTYPE = np.dtype("<i2")
+
+
+def available_compressors() -> list[str]:
+    names = []
+    if zstandard is not None:
+        names.append("zstd")
+    if lz4_frame is not None:
+        names.append("lz4")
+    names.append("zlib")
+    return names
+
+
+DEFAULT_COMPRESSOR = available_compressors()[0]
+
+
+def _compress(name: str, data: bytes) -> bytes:
+    if name == "zstd":
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    if name == "lz4":
+        return lz4_frame.compress(data, compression_level=9)
+    return zlib.compress(data, 6)
+
+
+def _decompress(name: str, data: bytes) -> bytes:
+    if name == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Le module 'zstandard' est requis pour lire ce fichier")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if name == "lz4":
+        if lz4_frame is None:
+            raise RuntimeError("Le module 'lz4' est requis pour lire ce fichier")
+        return lz4_frame.decompress(data)
+    return zlib.decompress(data)
+
+
+# -----------------------------------------------------------------------------
+# Quantification
+# -----------------------------------------------------------------------------
+def quantize(values: np.ndarray) -> tuple[np.ndarray, int, int]:
+    """Retourne (entiers int16, décimales, pas) tels que `q * pas / 10**d == values`."""
+    values = np.asarray(values, dtype=np.float64)
+    if not np.all(np.isfinite(values)):
+        raise ValueError("Signal non quantifiable : valeurs non finies")
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10.0 ** decimals
+        ints = np.round(values * scale)
+        if np.max(np.abs(ints), initial=0) >= 2 ** 53:
+            break
+        if not np.array_equal(ints / scale, values):
+            continue
+        ints = ints.astype(np.int64)
+        step = int(np.gcd.reduce(ints)) if ints.any() else 1
+        q = ints // step
+        if q.min(initial=0) < np.iinfo(np.int16).min or q.max(initial=0) > np.iinfo(np.int16).max:
+            raise ValueError("Signal non quantifiable en int16 à sa résolution d'origine")
+        return q.astype(QUANT_DTYPE), decimals, step
+    raise ValueError("Signal non quantifiable : résolution décimale introuvable")
+
+
+def dequantize(q: np.ndarray, decimals: int, step: int) -> np.ndarray:
+    return (q.astype(np.float64) * step) / (10.0 ** decimals)
+
+
+# -----------------------------------------------------------------------------
+# Écriture / lecture
+# -----------------------------------------------------------------------------
+def encode(values: np.ndarray, compressor: str = DEFAULT_COMPRESSOR,
+           block_size: int = BLOCK_SIZE) -> bytes:
+    q, decimals, step = quantize(values)
+    header = json.dumps({
+        "version": VERSION,
+        "n_samples": int(len(q)),
+        "block_size": block_size,
+        "decimals": decimals,
+        "step": step,
+        "compressor": compressor,
+    }).encode("utf-8")
+    parts = [MAGIC, struct.pack("<I", len(header)), header]
+    offset = sum(len(p) for p in parts)
+    index = [offset]
+    for start in range(0, len(q), block_size):
+        block = q[start:start + block_size]
+        # Delta int16 modulaire : le premier delta est la valeur absolue du bloc
+        deltas = np.diff(block, prepend=QUANT_DTYPE.type(0))
+        payload = _compress(compressor, deltas.astype(QUANT_DTYPE).tobytes())
+        parts.append(payload)
+        offset += len(payload)
+        index.append(offset)
+    parts.append(np.asarray(index, dtype=INDEX_DTYPE).tobytes())
+    parts.append(struct.pack("<Q", offset))
+    return b"".join(parts)
+
+
+def write(path: Path | str, values: np.ndarray, compressor: str = DEFAULT_COMPRESSOR) -> Path:
+    import signal_store  # import local : signal_store importe codec
+
+    path = Path(path)
+    data = encode(values, compressor)
+    # Nom temporaire unique : deux archivages concurrents du même fichier ne se marchent pas dessus
+    with signal_store.atomic_open(path) as f:
+        f.write(data)
+    return path
+
+
+class CompressedSignal:
+    """Accès en lecture à un `.ecgz` : longueur, tranches et index entiers.
+
+    Se comporte comme un tableau 1-D en lecture seule (comme `np.memmap`)
+    pour les usages de l'API : `len(s)`, `s[i0:i1]`, `s[indices]`.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            if f.read(4) != MAGIC:
+                raise ValueError(f"{self.path} n'est pas un fichier ECGZ")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(header_len))
+            f.seek(-8, 2)
+            (index_offset,) = struct.unpack("<Q", f.read(8))
+            n_blocks = -(-self.header["n_samples"] // self.header["block_size"])
+            f.seek(index_offset)
+            self.index = np.frombuffer(f.read(INDEX_DTYPE.itemsize * (n_blocks + 1)), dtype=INDEX_DTYPE)
+        self.n_samples = self.header["n_samples"]
+        self.block_size = self.header["block_size"]
+        self._cache: dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.n_samples
+
+    @property
+    def shape(self) -> tuple[int]:
+        return (self.n_samples,)
+
+    def _block(self, b: int, f) -> np.ndarray:
+        cached = self._cache.get(b)
+        if cached is not None:
+            return cached
+        start, end = int(self.index[b]), int(self.index[b + 1])
+        f.seek(start)
+        raw = _decompress(self.header["compressor"], f.read(end - start))
+        q = np.cumsum(np.frombuffer(raw, dtype=QUANT_DTYPE), dtype=QUANT_DTYPE)
+        block = dequantize(q, self.header["decimals"], self.header["step"])
+        if len(self._cache) >= CACHED_BLOCKS:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[b] = block
+        return block
+
+    def read(self, i0: int, i1: int) -> np.ndarray:
+        """Échantillons [i0, i1) ; seuls les blocs concernés sont décompressés."""
+        i0, i1 = max(int(i0), 0), min(int(i1), self.n_samples)
+        if i1 <= i0:
+            return np.empty(0, dtype=np.float64)
+        b0, b1 = i0 // self.block_size, (i1 - 1) // self.block_size
+        with self.path.open("rb") as f:
+            blocks = [self._block(b, f) for b in range(b0, b1 + 1)]
+        data = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+        offset = b0 * self.block_size
+        return data[i0 - offset:i1 - offset]
+
+    def take(self, indices: np.ndarray) -> np.ndarray:
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty(len(indices), dtype=np.float64)
+        if not len(indices):
+            return out
+        blocks = indices // self.block_size
+        with self.path.open("rb") as f:
+            for b in np.unique(blocks):
+                sel = blocks == b
+                out[sel] = self._block(int(b), f)[indices[sel] - b * self.block_size]
+        return out
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, stride = key.indices(self.n_samples)
+            if stride == 1:
+                return self.read(start, stop)
+            return self.to_array()[key]
+        if isinstance(key, (int, np.integer)):
+            key = int(key) + (self.n_samples if key < 0 else 0)
+            return self.read(key, key + 1)[0]
+        return self.take(key)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.to_array()
+        return data if dtype is None else data.astype(dtype)
+
+    def to_array(self) -> np.ndarray:
+        return self.read(0, self.n_samples)
+
+
+def read(path: Path | str, i0: int = 0, i1: Optional[int] = None) -> np.ndarray:
+    signal = CompressedSignal(path)
+    return signal.read(i0, signal.n_samples if i1 is None else i1)
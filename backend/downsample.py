@@ -0,0 +1,79 @@
+"""downsample.py
+
+Sous-échantillonnage d'un tracé pour l'affichage : Largest-Triangle-Three-
+Buckets (LTTB, S. Steinarsson 2013).
+
+Le signal est découpé en `n_out - 2` paquets ; dans chaque paquet on garde
+le point qui forme le plus grand triangle avec le paquet précédent et la
+moyenne du paquet suivant.  Contrairement à une enveloppe min/max, la forme
+de l'onde (P, QRS, T) est conservée.
+
+Le sommet « précédent » est la moyenne du paquet précédent et non le point
+qu'on y a retenu : les paquets deviennent indépendants et tout se calcule en
+bloc (sommes cumulées pour les moyennes, `np.maximum.reduceat` pour le
+meilleur point de chaque paquet), sans boucle Python sur les paquets.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+
+
+def _lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1], dtype=np.int64)[:max(n_out, 1)]
+
+    # n_out - 2 paquets intérieurs sur [1, n - 1) ; premier et dernier points fixes
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Moyennes des paquets ; le « suivant » du dernier paquet est le dernier point
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    width = ends - starts
+    avg_x = (cx[ends] - cx[starts]) / width
+    avg_y = (cy[ends] - cy[starts]) / width
+    next_x = np.append(avg_x[1:], x[n - 1])
+    next_y = np.append(avg_y[1:], y[n - 1])
+
+    # Sommet précédent : moyenne du paquet précédent (premier point pour le premier)
+    prev_x = np.insert(avg_x[:-1], 0, x[0])
+    prev_y = np.insert(avg_y[:-1], 0, y[0])
+
+    # Double de l'aire du triangle (précédent, candidat, moyenne du paquet suivant)
+    bucket = np.repeat(np.arange(n_out - 2), width)
+    px, py = prev_x[bucket], prev_y[bucket]
+    xs, ys = x[1:n - 1], y[1:n - 1]
+    area = np.abs((px - next_x[bucket]) * (ys - py) - (px - xs) * (next_y[bucket] - py))
+
+    # Premier point d'aire maximale de chaque paquet
+    best = np.flatnonzero(area == np.maximum.reduceat(area, starts - 1)[bucket])
+    first = best[np.unique(bucket[best], return_index=True)[1]]
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    out[1:-1] = first + 1
+    return out
+
+def lttb(
+    x: np.ndarray, y: np.ndarray, n_out: int, keep: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Indices (croissants) des points retenus, au plus ~`n_out`.
+
+    Les indices `keep` (pics R…) sont toujours conservés ; ils sont pris sur
+    le budget de points, qui n'est dépassé que s'ils sont plus nombreux que
+    `n_out`.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    keep = np.unique(np.asarray(keep if keep is not None else (), dtype=np.int64))
+    keep = keep[(keep >= 0) & (keep < n)]
+    selected = _lttb(x, y, max(n_out - len(keep), 2))
+    return np.union1d(selected, keep)
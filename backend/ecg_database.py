@@ -27,6 +27,28 @@ ecg_records
     lieu                TEXT     (lieu où l’ECG a été réalisé)
     frequence_hz        INTEGER  (fréquence d’échantillonnage, en Hz)
     date_prise          DATETIME (optionnel – date de l’examen)
+    nb_echantillons     INTEGER  (nombre d’échantillons par dérivation)
+    derivations         TEXT     (noms des dérivations, séparés par des virgules)
+    fichier_signal      TEXT     (préfixe des fichiers binaires <base>.<dérivation>.f64)
+    hash_contenu        TEXT     (SHA-256 du CSV importé)
+    format_csv          TEXT     (JSON : séparateur, en-tête, colonnes, temps… détectés à l’import)
+    precalcul           TEXT     (JSON : état des étapes de précalcul après l’import, voir precompute.py)
+    en_direct           BOOLEAN  (import en direct en cours, voir live.py)
+
+analysis_jobs           (file d’attente des workers d’analyse, voir jobqueue.py)
+    id                  INTEGER  primary‑key, auto‑incremented
+    kind                TEXT     NOT NULL (classification, precompute…)
+    ecg_id              INTEGER  (ECG concerné ; pas de clé étrangère : la tâche survit à sa suppression)
+    lead                TEXT     (dérivation, NULL = dérivation principale)
+    force               BOOLEAN  (recalcul même si le résultat existe)
+    state               TEXT     NOT NULL (queued, running, done, error)
+    attempts            INTEGER  (nombre de prises par un worker)
+    worker              TEXT     (identifiant du dernier worker)
+    error               TEXT
+    traceparent         TEXT     (trace de la requête d’origine)
+    params              TEXT     (JSON : paramètres, ex. fenêtre d’une HRV)
+    result              TEXT     (JSON : résultat des tâches sur une fenêtre)
+    created / started / heartbeat / finished  DATETIME
 
 Usage rapide
 ------------
@@ -58,9 +80,12 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     create_engine,
+    inspect,
+    text,
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 
@@ -99,6 +124,11 @@ class Patient(Base):
         cascade="all, delete-orphan",
     )
 
+    __table_args__ = (
+        # Sert au tri / filtrage par nom et à la pagination par curseur (nom, id)
+        Index("ix_patients_nom_prenom_id", "nom", "prenom", "id"),
+    )
+
     def __repr__(self):
         return (
             f"<Patient(id={self.id}, nom='{self.nom}', prenom='{self.prenom}', "
@@ -110,17 +140,31 @@ class ECGRecord(Base):
     __tablename__ = "ecg_records"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False)
+    patient_id = Column(
+        Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True
+    )
 
     fichier_csv = Column(String, nullable=False)
     analyse_fichier_csv = Column(String)
     lieu = Column(String)
     frequence_hz = Column(Integer)  # Fréquence d’échantillonnage (Hz)
     date_prise = Column(Date, default=datetime.utcnow)
+    nb_echantillons = Column(Integer)  # Nombre d’échantillons (rempli à l’import)
+    derivations = Column(String)       # Ex. "MLII,V5"
+    fichier_signal = Column(String)    # Signal binaire (voir signal_store.py)
+    hash_contenu = Column(String(64), index=True)  # SHA-256 du fichier importé
+    format_csv = Column(String)        # Format détecté à l’import (voir sniff.py)
+    precalcul = Column(String)         # État du précalcul (voir precompute.py)
+    en_direct = Column(Boolean, default=False)  # Import en direct en cours (voir live.py)
 
     # Relation vers Patient
     patient = relationship("Patient", back_populates="ecg_records")
 
+    @property
+    def lead_names(self) -> list[str]:
+        """Dérivations stockées (colonne `derivations`)."""
+        return [lead for lead in (self.derivations or "").split(",") if lead]
+
     def __repr__(self):
         return (
             f"<ECGRecord(id={self.id}, patient_id={self.patient_id}, "
@@ -128,10 +172,65 @@ class ECGRecord(Base):
         )
 
 
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    ecg_id = Column(Integer, index=True)
+    lead = Column(String)
+    force = Column(Boolean, default=False)
+    state = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, default=0)
+    worker = Column(String)
+    error = Column(String)
+    traceparent = Column(String)
+    params = Column(String)      # JSON : paramètres (fenêtre, battement…)
+    result = Column(String)      # JSON : résultat des tâches sur une fenêtre
+    created = Column(DateTime, default=datetime.utcnow)
+    started = Column(DateTime)
+    heartbeat = Column(DateTime)  # bail renouvelé par le worker pendant le calcul
+    finished = Column(DateTime)
+
+    __table_args__ = (
+        # Prise de la plus ancienne tâche en attente
+        Index("ix_analysis_jobs_state_id", "state", "id"),
+    )
+
+    def __repr__(self):
+        return (
+            f"<AnalysisJob(id={self.id}, kind='{self.kind}', ecg_id={self.ecg_id}, "
+            f"state='{self.state}')>"
+        )
+
+
 # -----------------------------------------------------------------------------
-# Initialisation de la base
+# Initialisation / mise à niveau de la base
 # -----------------------------------------------------------------------------
+def ensure_schema():
+    """Crée les tables manquantes et ajoute les colonnes ajoutées depuis.
+
+    `create_all` ne modifie pas une table existante : les colonnes absentes
+    d’une base SQLite plus ancienne sont donc ajoutées par ALTER TABLE, et
+    les index manquants sont créés.
+    """
+    Base.metadata.create_all(engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'
+                ))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
 if __name__ == "__main__":
     print("→ Création des tables (si elles n’existent pas déjà)…")
-    Base.metadata.create_all(engine)
+    ensure_schema()
     print("Base de données prête : ecg_data.db")
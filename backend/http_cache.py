@@ -0,0 +1,146 @@
+"""http_cache.py
+
+Validation et compression HTTP des réponses d'analyse (segment, battement,
+analyse, classification).
+
+Un enregistrement ne change plus après l'import : une réponse est
+entièrement déterminée par le hash du contenu, la fréquence, l'endpoint,
+ses paramètres, la version des artefacts dont elle est tirée (pics R, HRV…,
+voir `analysis.artifact_version`) et, pour les analyses, la version du
+fichier d'analyse.
+L'ETag (forte) est l'empreinte de ces éléments : elle est calculée avant
+tout traitement, un `If-None-Match` correspondant renvoie 304 sans rien
+recalculer.
+
+Cache-Control
+-------------
+* par défaut `private, no-cache` : le navigateur garde la réponse et la
+  revalide (304) à chaque vue ;
+* `private, max-age=31536000, immutable` si l'URL porte `v=<hash_contenu>`,
+  suivi pour les réponses tirées d'artefacts de leurs versions
+  (`v=<hash_contenu>.<version pics R>.<version HRV>`, voir
+  `content_version` et `/api/admin/artifacts`) : l'URL désigne alors un
+  contenu précis (les id d'ECG peuvent être réutilisés par SQLite après une
+  suppression, l'URL seule ne suffit pas) et change quand les artefacts
+  sont recalculés par une nouvelle version.
+Les données patient ne doivent pas être gardées par un proxy partagé, d'où
+`private`.
+
+Compression
+-----------
+Au-delà de `MIN_COMPRESS_SIZE`, le JSON est compressé en brotli (si le
+module `brotli` est installé) ou gzip selon `Accept-Encoding`.  Chaque
+variante a sa propre ETag (suffixe `-br` / `-gzip`) puisque les octets
+diffèrent.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+import metrics
+from serialization import dumps
+
+try:  # dépendance optionnelle
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+CACHE_VERSION = "1"  # à incrémenter quand le format d'une réponse change
+MIN_COMPRESS_SIZE = 1024
+IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """ETag forte : empreinte des éléments qui déterminent la réponse."""
+    key = "|".join(str(p) for p in (CACHE_VERSION, *parts))
+    return '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def content_version(content_hash: Optional[str], *versions: str) -> Optional[str]:
+    """Valeur de `v=` qui rend une réponse immuable : hash du contenu et
+    versions des artefacts dont elle est tirée, séparés par des points."""
+    if not content_hash:
+        return None
+    return ".".join((content_hash, *versions))
+
+
+def cache_control(request: Request, content_hash: Optional[str], *versions: str) -> str:
+    version = request.query_params.get("v")
+    if version and version == content_version(content_hash, *versions):
+        return IMMUTABLE
+    return REVALIDATE
+
+
+def _matching_tag(request: Request, etag: str) -> Optional[str]:
+    """Tag de `If-None-Match` correspondant à `etag` ou à une variante compressée."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    if header.strip() == "*":
+        return etag
+    base = etag.strip('"')
+    for tag in header.split(","):
+        tag = tag.strip()
+        value = tag.removeprefix("W/").strip('"')
+        if value == base or value.startswith(base + "-"):
+            return tag
+    return None
+
+
+def not_modified(request: Request, etag: str, control: str) -> Optional[Response]:
+    """Réponse 304 si le client possède déjà cette version, sinon None."""
+    tag = _matching_tag(request, etag)
+    if "if-none-match" in request.headers:  # seules les revalidations comptent
+        metrics.cache_result("http", tag is not None)
+    if tag is None:
+        return None
+    return Response(
+        status_code=304,
+        headers={"ETag": tag, "Cache-Control": control, "Vary": "Accept-Encoding"},
+    )
+
+
+def _negotiate(request: Request) -> Optional[str]:
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def respond(request: Request, content, etag: str, control: str) -> Response:
+    """Réponse JSON avec ETag, Cache-Control et compression négociée.
+
+    `content` peut contenir des tableaux NumPy (voir serialization.py).
+    """
+    with metrics.stage("serialize") as span:
+        body = dumps(content)
+        span.set(bytes=len(body))
+    headers = {"Cache-Control": control, "Vary": "Accept-Encoding"}
+    encoding = _negotiate(request) if len(body) >= MIN_COMPRESS_SIZE else None
+    if encoding:
+        with metrics.stage("compress"):
+            if encoding == "br":
+                body = brotli.compress(body, quality=5)
+            else:
+                body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = encoding
+        etag = f'{etag[:-1]}-{encoding}"'
+    headers["ETag"] = etag
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,310 @@
+"""ingest.py
+
+Fonctions d'import partagées par l'import unitaire (`/api/import_ecg`) et
+l'import en masse (`/api/import_ecg/bulk`).
+
+Import en masse
+---------------
+Les CSV arrivent soit en pièces jointes multiples, soit dans une archive
+zip / tar(.gz) accompagnée d'un manifeste (`manifest.json` ou
+`manifest.csv`) décrivant, pour chaque fichier, les champs du formulaire
+d'import (firstName, lastName, dateOfBirth, samplingRate, …).  Les champs
+absents du manifeste reprennent les valeurs par défaut envoyées avec la
+requête.
+
+Dans une archive, les fichiers sont identifiés par leur chemin relatif
+(`a/101.csv` et `b/101.csv` sont deux ECG) ; une entrée de manifeste peut
+donner ce chemin ou le seul nom de fichier s'il est unique.  Un même
+chemin reçu deux fois n'est importé qu'une fois, le doublon est signalé
+dans les résultats.
+
+Les archives sont lues membre par membre (tar en mode flux, zip via son
+répertoire central) et chaque membre est recopié par blocs : l'archive
+n'est jamais chargée entièrement en mémoire.  La préparation de chaque
+signal (conversion en binaire, voir signal_store.py) tourne dans un pool de
+processus (`prepare_signal`).
+
+Déduplication
+-------------
+Chaque ECG garde le SHA-256 de son contenu (`hash_contenu`).  Si le même
+contenu est déjà stocké avec la même fréquence, la copie qui vient d'être
+écrite est supprimée et le nouvel ECG pointe sur les fichiers existants
+(CSV, signal binaire, artefacts, analyses) : une ré-importation retrouve
+immédiatement pics R et classification.  Les fichiers partagés ne sont
+supprimés qu'avec le dernier ECG qui les référence.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import multiprocessing
+import shutil
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from sqlalchemy.orm import Session as DBSession
+
+import signal_store
+from ecg_database import ECGRecord, Patient
+
+COPY_CHUNK = 1 << 20
+MANIFEST_NAMES = ("manifest.json", "manifest.csv")
+MAX_WORKERS = None  # None → os.cpu_count()
+
+# Champs du formulaire d'import → conversion de type
+FIELD_TYPES = {
+    "firstName": str,
+    "lastName": str,
+    "dateOfBirth": str,
+    "age": int,
+    "weight": float,
+    "height": float,
+    "address": str,
+    "medicalHistory": str,
+    "medication": lambda v: str(v).strip().lower() in ("1", "true", "oui", "yes"),
+    "allergies": str,
+    "date": str,
+    "location": str,
+    "samplingRate": int,
+}
+REQUIRED_FIELDS = ("firstName", "lastName", "dateOfBirth")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Pool de processus partagé pour la préparation des signaux importés.
+
+    Démarré en mode « spawn » : les workers n'importent que ce module et
+    n'héritent pas du modèle TensorFlow chargé par l'application.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=MAX_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def prepare_signal(path: str, keep_csv: bool = True) -> dict:
+    """Travail par enregistrement exécuté dans le pool : conversion en signal binaire."""
+    info = signal_store.convert_csv(path)
+    if not keep_csv:
+        Path(path).unlink(missing_ok=True)
+    return info
+
+
+def resolve_sampling_rate(declared: Optional[int], info: dict) -> int:
+    """Fréquence retenue : celle déduite de la colonne de temps, sinon celle déclarée."""
+    if info.get("fs"):
+        return int(round(info["fs"]))
+    if not declared:
+        raise ValueError(
+            "Fréquence d'échantillonnage inconnue : pas de colonne de temps et samplingRate absent"
+        )
+    return declared
+
+
+def safe_name(name: str) -> str:
+    """Nom de fichier sans répertoire ni espaces (évite toute traversée de chemin)."""
+    return Path(name.replace("\\", "/")).name.replace(" ", "_")
+
+
+def safe_relpath(name: str) -> str:
+    """Chemin relatif d'un membre d'archive, sans `..` ni racine : `a/101.csv`
+    et `b/101.csv` restent deux fichiers distincts."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+    return "/".join(p.replace(" ", "_") for p in parts)
+
+
+def manifest_entry(manifest: dict[str, dict], name: str, names) -> dict:
+    """Champs du manifeste pour le fichier `name` (chemin relatif dans l'envoi).
+
+    Une entrée donnée par le seul nom de base ne s'applique que s'il ne
+    désigne qu'un fichier de l'envoi.
+    """
+    if name in manifest:
+        return manifest[name]
+    base = name.rsplit("/", 1)[-1]
+    if base == name or base not in manifest:
+        return {}
+    if sum(n.rsplit("/", 1)[-1] == base for n in names) > 1:
+        raise ValueError(f"Entrée de manifeste ambiguë : '{base}' désigne plusieurs fichiers")
+    return manifest[base]
+
+
+def patient_folder(first_name: str, last_name: str, date_of_birth: str) -> str:
+    return f"{first_name}_{last_name}_{date_of_birth}"
+
+
+def unique_path(path: Path) -> Path:
+    """`101.csv` → `101_1.csv`, `101_2.csv`… si le CSV ou son signal existe
+    déjà : un import n'écrase jamais les fichiers d'un ECG existant.
+
+    Les points du nom deviennent des `_` (`101.v2.csv` → `101_v2.csv`) : les
+    fichiers d'un ECG (`<base>.<dérivation>.f64`…) ne peuvent pas se
+    confondre avec ceux d'un autre ECG dont le nom prolonge le sien.
+    """
+    path = path.with_name(path.stem.replace(".", "_") + path.suffix)
+    candidate, n = path, 0
+    while candidate.exists() or signal_store.has_signal(str(signal_store.signal_base(candidate))):
+        n += 1
+        candidate = path.with_name(f"{path.stem}_{n}{path.suffix}")
+    return candidate
+
+
+def coerce_fields(raw: dict) -> dict:
+    """Convertit les valeurs (chaînes du manifeste / du formulaire) vers leur type."""
+    fields = {}
+    for key, value in raw.items():
+        if key not in FIELD_TYPES or value is None or value == "":
+            continue
+        fields[key] = FIELD_TYPES[key](value)
+    missing = [k for k in REQUIRED_FIELDS if k not in fields]
+    if missing:
+        raise ValueError(f"Champs manquants : {', '.join(missing)}")
+    return fields
+
+
+def find_or_create_patient(db: DBSession, fields: dict, dob) -> Patient:
+    """Retrouve le patient (nom, prénom, date de naissance) ou le crée."""
+    patient = db.query(Patient).filter_by(
+        nom=fields["lastName"].strip(),
+        prenom=fields["firstName"].strip(),
+        date_naissance=dob,
+    ).first()
+    if patient is None:
+        patient = Patient(
+            nom=fields["lastName"].strip(),
+            prenom=fields["firstName"].strip(),
+            date_naissance=dob,
+            age=fields.get("age"),
+            poids=fields.get("weight"),
+            taille=fields.get("height"),
+            adresse=fields.get("address", "").strip(),
+            antecedant=fields.get("medicalHistory", "").strip(),
+            prise_medoc=fields.get("medication", False),
+            allergies=fields.get("allergies", "").strip(),
+        )
+        db.add(patient)
+        db.flush()  # génère patient.id
+    return patient
+
+
+# -----------------------------------------------------------------------------
+# Déduplication par contenu
+# -----------------------------------------------------------------------------
+def find_duplicate(db: DBSession, sha256: str, fs: int, exclude_base: str) -> Optional[ECGRecord]:
+    """Premier ECG dont le signal stocké a le même contenu et la même
+    fréquence (les artefacts dérivés dépendent de fs)."""
+    candidates = (
+        db.query(ECGRecord)
+        .filter(
+            ECGRecord.hash_contenu == sha256,
+            ECGRecord.frequence_hz == fs,
+            ECGRecord.fichier_signal.isnot(None),
+            ECGRecord.fichier_signal != exclude_base,
+        )
+        .order_by(ECGRecord.id)
+    )
+    for record in candidates:
+        if signal_store.has_signal(record.fichier_signal, record.lead_names):
+            return record
+    return None
+
+
+def share_signal(db: DBSession, ecg: ECGRecord, csv_path: Path) -> Optional[ECGRecord]:
+    """Fait pointer `ecg` sur les fichiers d'un ECG identique déjà stocké.
+
+    La copie qui vient d'être écrite (signal et CSV) est supprimée. Le CSV
+    d'origine n'est repris que s'il a été conservé. Retourne l'ECG
+    partagé, ou None s'il n'y a pas de doublon.
+    """
+    original = find_duplicate(db, ecg.hash_contenu, ecg.frequence_hz, ecg.fichier_signal)
+    if original is None:
+        return None
+    signal_store.delete_signal(ecg.fichier_signal, ecg.lead_names)
+    ecg.fichier_signal = original.fichier_signal
+    ecg.analyse_fichier_csv = original.analyse_fichier_csv
+    if original.fichier_csv and Path(original.fichier_csv).exists():
+        Path(csv_path).unlink(missing_ok=True)
+        ecg.fichier_csv = original.fichier_csv
+    return original
+
+
+# -----------------------------------------------------------------------------
+# Manifeste et archives
+# -----------------------------------------------------------------------------
+def read_manifest(name: str, fileobj: BinaryIO) -> dict[str, dict]:
+    """Lit un manifeste JSON (liste d'objets ou dict fichier → champs) ou CSV."""
+    text = io.StringIO(fileobj.read().decode("utf-8-sig"))  # manifeste : petit fichier
+    if name.lower().endswith(".json"):
+        data = json.load(text)
+        if isinstance(data, dict):
+            data = [{"file": k, **v} for k, v in data.items()]
+        entries = data
+    else:
+        entries = list(csv.DictReader(text))
+    manifest = {}
+    for entry in entries:
+        file_name = entry.get("file") or entry.get("filename")
+        if not file_name:
+            raise ValueError("Entrée de manifeste sans champ 'file'")
+        manifest[safe_relpath(file_name)] = {k: v for k, v in entry.items() if k not in ("file", "filename")}
+    return manifest
+
+
+def stage_stream(fileobj: BinaryIO, dest: Path) -> Path:
+    with dest.open("wb") as out:
+        shutil.copyfileobj(fileobj, out, COPY_CHUNK)
+    return dest
+
+
+def iter_archive(fileobj: BinaryIO, filename: str) -> Iterator[tuple[str, BinaryIO]]:
+    """Itère sur les fichiers réguliers d'une archive zip ou tar sans la charger."""
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                with zf.open(info) as member:
+                    yield info.filename, member
+        return
+    try:
+        tar = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError as exc:
+        raise ValueError(f"Archive non reconnue : {filename}") from exc
+    with tar:
+        for info in tar:
+            if not info.isfile():
+                continue
+            member = tar.extractfile(info)
+            if member is not None:
+                yield info.name, member
+
+
+def stage_archive(
+    fileobj: BinaryIO, filename: str, staging: Path,
+) -> tuple[list[tuple[str, Path]], dict[str, dict]]:
+    """Décompresse les CSV d'une archive dans `staging` et lit son manifeste.
+
+    Les CSV sont rendus par chemin relatif dans l'archive ; un même chemin
+    présent deux fois est rendu deux fois (l'appelant signale le doublon).
+    """
+    staged: list[tuple[str, Path]] = []
+    manifest: dict[str, dict] = {}
+    for member_name, member in iter_archive(fileobj, filename):
+        name = safe_relpath(member_name)
+        base = name.rsplit("/", 1)[-1]
+        if not base or base.startswith("."):
+            continue
+        if base.lower() in MANIFEST_NAMES:
+            manifest.update(read_manifest(base, member))
+        elif base.lower().endswith(".csv"):
+            staged.append((name, stage_stream(member, staging / f"{len(staged)}_{base}")))
+    return staged, manifest
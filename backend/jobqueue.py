@@ -0,0 +1,290 @@
+"""jobqueue.py
+
+File d'attente durable des analyses lourdes (classification, précalcul),
+pour séparer les processus web des workers d'analyse.
+
+Avec `ECG_ANALYSIS_MODE=queue` :
+
+* les processus de l'API ne chargent ni TensorFlow ni le modèle et ne
+  lancent aucun calcul NeuroKit : ils servent les artefacts partagés
+  (signaux, pics R, vue d'ensemble, analyses… sur le même stockage) et, à
+  défaut, planifient le calcul (`submit`) ; l'endpoint répond alors 202 et
+  la tâche se suit par `/analysis/status` ;
+* les workers (`python worker.py`, autant que de cœurs à consacrer à
+  l'analyse) prennent les tâches (`claim`) et les exécutent avec les
+  fonctions déclarées par l'application (`handler`), comme les étapes de
+  precompute.py :
+
+      @jobqueue.handler("classification")
+      def classification_job(job): ...
+
+La file est la table `analysis_jobs` de la base (partagée par tous les
+processus).  Une tâche `queued` est prise par une mise à jour
+conditionnelle (un seul worker la gagne), reste `running` pendant le
+calcul puis passe à `done` ou `error`.  Une tâche identique (type, ECG,
+dérivation, paramètres) déjà en attente ou en cours n'est pas dupliquée.
+Pendant le calcul, le worker renouvelle son bail toutes les
+`ECG_JOB_LEASE / 3` secondes (`heartbeat`) ; une tâche `running` sans
+signe de vie depuis `ECG_JOB_LEASE` secondes (worker arrêté en cours de
+route) est reprise, au plus `MAX_ATTEMPTS` fois.  Un long Holter n'est donc
+pas relancé pendant qu'il est encore calculé.
+
+Les calculs sur une fenêtre (HRV d'un segment, battement isolé) ne sont
+pas des artefacts : leur tâche porte ses paramètres (`params`) et garde
+son résultat JSON (`result`), que l'API relit ensuite (`result`).
+
+Par défaut (`ECG_ANALYSIS_MODE=inline`), tout est calculé dans le
+processus web, comme avant.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+import metrics
+import serialization
+import tracing
+from ecg_database import AnalysisJob, Session
+
+MODE = os.environ.get("ECG_ANALYSIS_MODE", "inline")
+ENABLED = MODE == "queue"
+LEASE = float(os.environ.get("ECG_JOB_LEASE", "120"))  # s sans renouvellement du bail
+MAX_ATTEMPTS = 3
+ACTIVE = ("queued", "running")
+STATES = ("queued", "running", "done", "error")
+
+_handlers: dict[str, Callable[[dict], Any]] = {}
+WORKER = False  # vrai dans les processus de worker.py
+log = logging.getLogger(__name__)
+
+
+def counts() -> dict[str, int]:
+    """Nombre de tâches par état."""
+    with Session() as db:
+        rows = db.execute(select(AnalysisJob.state, func.count()).group_by(AnalysisJob.state)).all()
+    return {state: 0 for state in STATES} | dict(rows)
+
+
+JOBS = metrics.Gauge(
+    "ecg_jobs", "Tâches de la file d'analyse par état.", ("state",),
+    collect=lambda: {(state,): n for state, n in counts().items()} if ENABLED else {},
+)
+PROCESSED = metrics.Counter(
+    "ecg_jobs_processed_total", "Tâches exécutées par ce worker.", ("kind", "result")
+)
+
+
+def inline() -> bool:
+    """Vrai si ce processus calcule lui-même les analyses (mode inline, ou worker)."""
+    return not ENABLED or WORKER
+
+
+def handler(kind: str):
+    """Déclare la fonction `fonction(job)` qui exécute les tâches `kind`.
+
+    Une valeur retournée (autre que None) est enregistrée comme résultat JSON.
+    """
+    def register(fn: Callable[[dict], Any]):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+def _as_dict(job: AnalysisJob) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "ecg_id": job.ecg_id,
+        "lead": job.lead,
+        "force": bool(job.force),
+        "state": job.state,
+        "attempts": job.attempts,
+        "worker": job.worker,
+        "error": job.error,
+        "traceparent": job.traceparent,
+        "params": json.loads(job.params) if job.params else None,
+        "created": job.created.isoformat() if job.created else None,
+        "started": job.started.isoformat() if job.started else None,
+        "finished": job.finished.isoformat() if job.finished else None,
+    }
+
+
+def _same_lead(lead: Optional[str]):
+    return AnalysisJob.lead.is_(None) if lead is None else AnalysisJob.lead == lead
+
+
+def _encode_params(params: Optional[dict]) -> Optional[str]:
+    return json.dumps(params, sort_keys=True) if params else None
+
+
+def _same_params(encoded: Optional[str]):
+    return AnalysisJob.params.is_(None) if encoded is None else AnalysisJob.params == encoded
+
+
+def submit(
+    kind: str, ecg_id: int, lead: Optional[str] = None, force: bool = False,
+    traceparent: Optional[str] = None, params: Optional[dict] = None,
+) -> dict:
+    """Planifie une tâche (ou retourne la tâche identique en attente / en cours)."""
+    encoded = _encode_params(params)
+    with Session() as db:
+        job = db.scalars(
+            select(AnalysisJob)
+            .where(AnalysisJob.kind == kind, AnalysisJob.ecg_id == ecg_id, _same_lead(lead),
+                   _same_params(encoded), AnalysisJob.state.in_(ACTIVE))
+            .order_by(AnalysisJob.id)
+            .limit(1)
+        ).first()
+        if job is None:
+            job = AnalysisJob(
+                kind=kind, ecg_id=ecg_id, lead=lead, force=force, state="queued",
+                attempts=0, traceparent=traceparent, params=encoded,
+            )
+            db.add(job)
+            db.commit()
+        return _as_dict(job)
+
+
+def result(
+    kind: str, ecg_id: int, lead: Optional[str] = None, params: Optional[dict] = None,
+) -> Optional[dict]:
+    """Dernière tâche terminée (`done` ou `error`) identique, avec son résultat
+    (clé `result`) ; None si elle n'a jamais abouti."""
+    with Session() as db:
+        job = db.scalars(
+            select(AnalysisJob)
+            .where(AnalysisJob.kind == kind, AnalysisJob.ecg_id == ecg_id, _same_lead(lead),
+                   _same_params(_encode_params(params)), AnalysisJob.state.in_(("done", "error")))
+            .order_by(AnalysisJob.id.desc())
+            .limit(1)
+        ).first()
+        if job is None:
+            return None
+        return _as_dict(job) | {"result": json.loads(job.result) if job.result else None}
+
+
+def latest(ecg_id: int, lead: Optional[str] = None) -> Optional[dict]:
+    """Dernière tâche d'un ECG pour une dérivation (None : aucune)."""
+    with Session() as db:
+        job = db.scalars(
+            select(AnalysisJob)
+            .where(AnalysisJob.ecg_id == ecg_id, _same_lead(lead))
+            .order_by(AnalysisJob.id.desc())
+            .limit(1)
+        ).first()
+        return _as_dict(job) if job is not None else None
+
+
+def recent(limit: int = 50, state: Optional[str] = None) -> list[dict]:
+    """Dernières tâches (toutes, ou d'un état)."""
+    query = select(AnalysisJob).order_by(AnalysisJob.id.desc()).limit(limit)
+    if state is not None:
+        query = query.where(AnalysisJob.state == state)
+    with Session() as db:
+        return [_as_dict(job) for job in db.scalars(query)]
+
+
+def _requeue_expired(db) -> None:
+    last_seen = func.coalesce(AnalysisJob.heartbeat, AnalysisJob.started)
+    expired = (AnalysisJob.state == "running") & (
+        last_seen < datetime.utcnow() - timedelta(seconds=LEASE)
+    )
+    db.execute(
+        update(AnalysisJob).where(expired, AnalysisJob.attempts >= MAX_ATTEMPTS)
+        .values(state="error", finished=datetime.utcnow(),
+                error=f"Abandonnée après {MAX_ATTEMPTS} tentatives (worker arrêté ?)")
+    )
+    db.execute(update(AnalysisJob).where(expired).values(state="queued", worker=None))
+    db.commit()
+
+
+def claim(worker: str) -> Optional[dict]:
+    """Prend la plus ancienne tâche en attente (None : file vide)."""
+    with Session() as db:
+        _requeue_expired(db)
+        while True:
+            job_id = db.scalar(
+                select(AnalysisJob.id).where(AnalysisJob.state == "queued")
+                .order_by(AnalysisJob.id).limit(1)
+            )
+            if job_id is None:
+                return None
+            # Mise à jour conditionnelle : un seul worker gagne la tâche
+            won = db.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job_id, AnalysisJob.state == "queued")
+                .values(state="running", worker=worker, started=datetime.utcnow(),
+                        heartbeat=None, attempts=AnalysisJob.attempts + 1)
+            ).rowcount
+            db.commit()
+            if won:
+                return _as_dict(db.get(AnalysisJob, job_id))
+
+
+def finish(job: dict, error: Optional[str] = None, result: Any = None) -> None:
+    """Termine une tâche, sauf si elle a été reprise par un autre worker entre-temps."""
+    with Session() as db:
+        db.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job["id"], AnalysisJob.worker == job["worker"])
+            .values(state="error" if error else "done", error=error, finished=datetime.utcnow(),
+                    result=None if result is None else serialization.dumps(result).decode())
+        )
+        db.commit()
+
+
+def _renew_lease(job: dict, stop: threading.Event) -> None:
+    """Renouvelle le bail d'une tâche jusqu'à la fin de son calcul (thread du worker)."""
+    while not stop.wait(LEASE / 3):
+        try:
+            with Session() as db:
+                db.execute(
+                    update(AnalysisJob)
+                    .where(AnalysisJob.id == job["id"], AnalysisJob.state == "running",
+                           AnalysisJob.worker == job["worker"])
+                    .values(heartbeat=datetime.utcnow())
+                )
+                db.commit()
+        except SQLAlchemyError as exc:
+            log.warning("tâche %s : bail non renouvelé (%s)", job["id"], exc)
+
+
+def run_job(job: dict) -> Optional[str]:
+    """Exécute une tâche prise par `claim` ; retourne l'erreur éventuelle."""
+    error = result = None
+    start = time.perf_counter()
+    stop = threading.Event()
+    lease = threading.Thread(target=_renew_lease, args=(job, stop), daemon=True,
+                             name=f"lease-{job['id']}")
+    lease.start()
+    try:
+        fn = _handlers.get(job["kind"])
+        if fn is None:
+            raise LookupError(f"Type de tâche inconnu : {job['kind']}")
+        with tracing.span("job", traceparent=job["traceparent"], kind=job["kind"],
+                          ecg_id=job["ecg_id"], job_id=job["id"]):
+            with metrics.stage(f"job_{job['kind']}", ecg_id=job["ecg_id"]):
+                result = fn(job)
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+    finally:
+        stop.set()
+        lease.join()
+    finish(job, error, result)
+    PROCESSED.inc(kind=job["kind"], result="error" if error else "done")
+    elapsed = time.perf_counter() - start
+    if error:
+        log.warning("[%s] tâche %s %s ecg=%s erreur : %s (%.1f s)",
+                    job["worker"], job["id"], job["kind"], job["ecg_id"], error, elapsed)
+    else:
+        log.info("[%s] tâche %s %s ecg=%s terminée (%.1f s)",
+                 job["worker"], job["id"], job["kind"], job["ecg_id"], elapsed)
+    return error
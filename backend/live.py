@@ -0,0 +1,235 @@
+"""live.py
+
+Import en direct d'un enregistrement envoyé par un moniteur, par blocs,
+sur WebSocket (`/api/{patient_id}/live`).
+
+Les échantillons reçus sont ajoutés tels quels par le même `SignalWriter`
+qu'un import de fichier (`SignalWriter.append`, sans repasser par du texte
+CSV) : fichiers binaires par dérivation écrits au fil de l'eau (lisibles
+pendant l'enregistrement par `/segment`, `/stream`…), copie CSV
+(`sample #,<dérivations>`) écrite selon `ECG_KEEP_CSV`.  Le SHA-256 porte
+sur les échantillons et non sur le texte CSV.
+
+Tant que l'enregistrement est en cours (`ECGRecord.en_direct`), l'API ne
+calcule ni ne met en cache aucun artefact sur ce signal partiel : `/segment`
+et `/stream` utilisent les pics détectés en direct, les autres analyses
+répondent 409.
+
+Analyse glissante
+-----------------
+Les pics R de la dérivation principale sont détectés au fil des blocs par
+`rpeaks.StreamingRPeakDetector` (travail proportionnel au bloc, état
+borné, pic confirmé environ 0,5 s après la fin de son QRS).  Toutes les
+`ANALYSIS_STEP` secondes de signal reçu, les nouveaux battements suivis
+d'au moins `MARGIN` secondes de signal sont classés sur la fin du signal
+nettoyée (+ `CONTEXT` secondes de contexte) et la HRV temporelle
+recalculée sur les `HRV_WINDOW` dernières secondes.  Ces résultats sont provisoires
+(normalisation sur la fenêtre et non sur l'enregistrement) : les pics
+détectés en direct sont rangés à part (artefact `rpeaks_live`), jamais pris
+pour l'index NeuroKit `rpeaks`.  À la fin, les pics en direct sont effacés
+et l'analyse standard reprend sur l'enregistrement complet.
+
+Protocole
+---------
+* client → serveur : trames binaires d'échantillons entrelacés
+  (`n × nb_dérivations`, dtype `<f4` ou `<f8`) ; texte `{"action": "stop"}`
+  pour terminer ;
+* serveur → client : `{"type": "started", "ecg_id"}`, puis
+  `{"type": "rpeaks", "peaks": [...]}` (échantillon, temps, classe) et
+  `{"type": "hrv", ...}` au fil de l'analyse, `{"type": "finished", ...}`
+  à la fin.  Une déconnexion sans `stop` termine aussi l'enregistrement.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Optional
+
+import neurokit2 as nk
+import numpy as np
+from scipy.signal import resample
+
+import metrics
+import signal_store
+from analysis import BEAT_SAMPLES, artifact_version
+from rpeaks import StreamingRPeakDetector
+from sniff import CSVFormat, check_lead_names
+
+INDEX_COLUMN = "sample #"
+ALLOWED_DTYPES = ("<f4", "<f8")
+ANALYSIS_STEP = 2.0   # s de nouveau signal entre deux analyses
+CONTEXT = 10.0        # s de contexte avant les nouvelles données
+MARGIN = 1.0          # s de signal nécessaires après un pic pour classer son battement
+HRV_WINDOW = 300.0    # s de pics pour la HRV glissante
+HRV_STEP = 10.0       # s de signal entre deux calculs de HRV
+MIN_WINDOW = 4.0      # s minimum pour segmenter les battements (NeuroKit)
+MIN_PEAKS = 4         # pics nécessaires à l'estimation de la fréquence cardiaque
+LIVE_PEAKS = "rpeaks_live"  # artefact des pics provisoires (distinct de l'index `rpeaks`)
+
+
+def live_format(leads: list[str]) -> CSVFormat:
+    check_lead_names(list(leads))
+    return CSVFormat(
+        delimiter=",",
+        has_header=True,
+        columns=[INDEX_COLUMN, *leads],
+        leads=list(leads),
+        index_column=INDEX_COLUMN,
+    )
+
+
+class LiveRecording:
+    """Enregistrement en cours : écriture des blocs et analyse de la fin du signal.
+
+    `classify` reçoit les battements rééchantillonnés (n × BEAT_SAMPLES) et
+    retourne leur libellé ; None désactive la classification.
+    """
+
+    def __init__(
+        self,
+        base: Path,
+        leads: list[str],
+        fs: int,
+        dtype: str = "<f4",
+        csv_copy: Optional[Path] = None,
+        classify: Optional[Callable[[np.ndarray], list[str]]] = None,
+    ):
+        if dtype not in ALLOWED_DTYPES:
+            raise ValueError(f"dtype non supporté : {dtype} (attendu : {', '.join(ALLOWED_DTYPES)})")
+        self.fmt = live_format(leads)
+        self.fs = fs
+        self.dtype = np.dtype(dtype)
+        self.classify = classify
+        self.writer = signal_store.SignalWriter(base, self.fmt, csv_copy=csv_copy)
+        self.lead = self.fmt.default_lead
+        self._pending = b""       # octets d'un échantillon incomplet
+        self.detector = StreamingRPeakDetector(fs)
+        self._lead_col = self.fmt.leads.index(self.lead)
+        self._detected: list[int] = []  # pics confirmés, pas encore analysés
+        self.peaks: list[int] = []
+        self.labels: list[Optional[str]] = []
+        self._last_analysis = 0
+        self._last_hrv = 0
+
+    @property
+    def base(self) -> Path:
+        return self.writer.base
+
+    @property
+    def n_samples(self) -> int:
+        return self.writer.n_samples
+
+    # ------------------------------------------------------------------
+    # Écriture
+    # ------------------------------------------------------------------
+    def append(self, chunk: bytes) -> int:
+        """Ajoute un bloc binaire ; retourne le nombre d'échantillons ajoutés."""
+        data = self._pending + chunk
+        row = self.dtype.itemsize * len(self.fmt.leads)
+        usable = len(data) - len(data) % row
+        self._pending = data[usable:]
+        if not usable:
+            return 0
+        block = np.frombuffer(data[:usable], dtype=self.dtype).reshape(-1, len(self.fmt.leads))
+        if not np.all(np.isfinite(block)):
+            raise ValueError("Valeurs non finies dans le bloc reçu")
+        self.writer.append(block)
+        self._detected.extend(int(p) for p in self.detector.process(block[:, self._lead_col]))
+        return len(block)
+
+    def finish(self) -> dict:
+        """Ferme les fichiers ; métadonnées identiques à celles d'un import."""
+        info = self.writer.close()
+        # Pics provisoires (et tout artefact partiel) : place au précalcul standard
+        for lead in self.fmt.leads:
+            signal_store.delete_artifacts(self.base, lead)
+        return info
+
+    def abort(self) -> None:
+        self.writer.abort()
+
+    # ------------------------------------------------------------------
+    # Analyse glissante
+    # ------------------------------------------------------------------
+    def analyze(self) -> list[dict]:
+        """Analyse la fin du signal si assez de données sont arrivées.
+
+        Retourne les messages à envoyer au client (pics confirmés, HRV).
+        """
+        n = self.n_samples
+        if n - self._last_analysis < ANALYSIS_STEP * self.fs:
+            return []
+        self._last_analysis = n
+        self.writer.flush()
+
+        limit = n - int(MARGIN * self.fs)
+        new = [p for p in self._detected if p < limit]
+        self._detected = self._detected[len(new):]
+
+        messages = []
+        if new:
+            w0 = max(0, new[0] - int(CONTEXT * self.fs))
+            signal = np.fromfile(
+                signal_store.lead_path(self.base, self.lead),
+                dtype=signal_store.SIGNAL_DTYPE, count=n - w0, offset=w0 * signal_store.SIGNAL_DTYPE.itemsize,
+            )
+            labels = self._classify(signal, w0, new)
+            first_index = len(self.peaks)
+            self.peaks.extend(new)
+            self.labels.extend(labels)
+            signal_store.save_artifact(
+                self.base, self.lead, LIVE_PEAKS, np.asarray(self.peaks), artifact_version("rpeaks")
+            )
+            messages.append({
+                "type": "rpeaks",
+                "peaks": [
+                    {"sample": p, "t": p / self.fs, "beat_index": first_index + k, "label": label}
+                    for k, (p, label) in enumerate(zip(new, labels))
+                ],
+            })
+        if n - self._last_hrv >= HRV_STEP * self.fs:
+            self._last_hrv = n
+            hrv = self._hrv()
+            if hrv is not None:
+                messages.append(hrv)
+        return messages
+
+    def _classify(self, signal: np.ndarray, w0: int, new: list[int]) -> list[Optional[str]]:
+        # Tous les pics de la fenêtre servent à estimer la fréquence cardiaque
+        # (largeur des epochs) ; seuls les nouveaux battements sont classés
+        window_peaks = np.asarray(sorted({p for p in self.peaks if p >= w0} | set(new))) - w0
+        if self.classify is None or len(window_peaks) < MIN_PEAKS or len(signal) < MIN_WINDOW * self.fs:
+            return [None] * len(new)
+        with metrics.stage("clean", n_samples=len(signal)):
+            clean = nk.ecg_clean(signal, sampling_rate=self.fs)
+        # Normalisation sur la fenêtre analysée (l'import la fait sur tout l'enregistrement)
+        lo, hi = float(np.min(clean)), float(np.max(clean))
+        normalized = (clean - lo) / (hi - lo) if hi > lo else np.zeros_like(clean)
+        try:
+            with metrics.stage("epoching", n_beats=len(new)):
+                epochs = nk.ecg_segment(normalized, rpeaks=window_peaks, sampling_rate=self.fs, show=False)
+        except ValueError:
+            return [None] * len(new)
+        keys = [str(int(np.searchsorted(window_peaks, p - w0)) + 1) for p in new]
+        signals = [epochs[k]["Signal"].to_numpy() if k in epochs else None for k in keys]
+        if any(s is None or not np.all(np.isfinite(s)) for s in signals):
+            return [None] * len(new)
+        with metrics.stage("resample", n_beats=len(signals)):
+            beats = np.stack([resample(s, BEAT_SAMPLES) for s in signals])
+        return list(self.classify(beats))
+
+    def _hrv(self) -> Optional[dict]:
+        start = self.n_samples - HRV_WINDOW * self.fs
+        peaks = np.asarray([p for p in self.peaks if p >= start])
+        if len(peaks) < 3:
+            return None
+        with metrics.stage("hrv_time", n_peaks=len(peaks)):
+            hrv = nk.hrv_time(peaks, sampling_rate=self.fs, show=False)
+        return {
+            "type": "hrv",
+            "t": self.n_samples / self.fs,
+            "window": min(HRV_WINDOW, self.n_samples / self.fs),
+            "n_peaks": len(peaks),
+            "time_domain": {
+                c: (float(v) if np.isfinite(v) else None) for c, v in hrv.iloc[0].items()
+            },
+        }
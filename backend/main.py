@@ -2,27 +2,45 @@ from __future__ import annotations
 import neurokit2 as nk
 import numpy as np
 import pandas as pd
-from fastapi import FastAPI, HTTPException, Query, Form, Depends
-from fastapi.encoders import jsonable_encoder
+from fastapi import FastAPI, HTTPException, Query, Form, Depends, Request, Response, WebSocket
+from fastapi import WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware   
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 from fastapi import UploadFile, File
 import shutil
+import time
+import uuid
+from sqlalchemy import and_, func, or_, select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import selectinload, Session as DBSession
-from ecg_database import Session, Patient, ECGRecord
-from utils import parse_date_flex, sanitize
-from schemas import PatientOut   
-from tensorflow import keras
-from keras import models
-from scipy.signal import resample
-from sklearn.preprocessing import MinMaxScaler
+from ecg_database import Session, Patient, ECGRecord, ensure_schema
+from registry import REGISTRY, RecordMeta, meta_from_record
+import analysis
+import downsample
+import http_cache
+import ingest
+import jobqueue
+import live
+import metrics
+import morphology
+import playback
+import precompute
+import profiling
+import signal_store
+import singleflight
+import tracing
+from sniff import SNIFF_SIZE, sniff_csv
+from utils import decode_cursor, encode_cursor, parse_date_flex
+from schemas import PatientOut, PatientSummaryOut
+from serialization import NumpyJSONResponse
 import json
 import os
 import requests
+import zipfile
 
 # -----------------------------------------------------------------------------
 app = FastAPI()
@@ -35,12 +53,73 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],            
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "X-Profile-Id", "X-Trace-Id"],
 )
 
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """Latence par route (/metrics), durée des étapes (en-tête Server-Timing)
+    et span racine de la requête (tracing.py)"""
+    timings = metrics.start_request()
+    metrics.REQUESTS_IN_PROGRESS.inc()
+    start = time.perf_counter()
+    status = 500
+    with tracing.span(
+        f"{request.method} {request.url.path}",
+        traceparent=request.headers.get("traceparent"),
+        **{"http.method": request.method, "http.target": str(request.url.path)},
+    ) as span:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.REQUESTS_IN_PROGRESS.dec()
+            route = getattr(request.scope.get("route"), "path", "non trouvée")
+            metrics.REQUEST_DURATION.observe(
+                elapsed, method=request.method, route=route, status=status
+            )
+            span.rename(f"{request.method} {route}")
+            span.set(**{"http.route": route, "http.status_code": status},
+                     **(request.scope.get("path_params") or {}))
+    response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+    if span.trace_id:
+        response.headers["X-Trace-Id"] = span.trace_id
+    return response
+
+async def profile_request(request: Request, call_next):
+    """Profil échantillonné de la requête si demandé (voir profiling.py)"""
+    if not profiling.requested(request):
+        return await call_next(request)
+    profiler = profiling.SamplingProfiler().start()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+    elapsed = time.perf_counter() - start
+    meta = await run_in_threadpool(profiling.save, profiler, request, response.status_code, elapsed)
+    response.headers["X-Profile-Id"] = meta["id"]
+    return response
+
+# Sans ECG_PROFILING=1, le middleware n'est pas installé : aucun surcoût
+if profiling.ENABLED:
+    app.middleware("http")(profile_request)
+
 UPLOAD_DIR = Path("data_csv")
 UPLOAD_DIR.mkdir(exist_ok=True)
 SEGMENT_DURATION = 3 * 60 
-MODEL = models.load_model("best_model.h5")
+OVERVIEW_POINTS = 4000  # points de la vue d'ensemble (tout l'enregistrement)
+BEAT_CLEAN_MARGIN = 10.0  # s de signal nettoyées de part et d'autre d'un battement
+analysis.register_artifact("overview", algorithm="lttb-mean", points=OVERVIEW_POINTS)
+analysis.register_artifact(
+    "morphology", rpeaks=analysis.artifact_version("rpeaks"), clean=analysis.CLEAN_METHOD, **morphology.PARAMS
+)
+# Conserver le CSV d'origine à côté du signal binaire (ECG_KEEP_CSV=0 pour ne garder que le binaire)
+KEEP_ORIGINAL_CSV = os.environ.get("ECG_KEEP_CSV", "1") != "0"
+if not jobqueue.ENABLED:  # en mode file d'attente, seuls les workers chargent le modèle
+    analysis.get_model()  # chargé au démarrage plutôt qu'à la première classification
+ensure_schema()
 
 def get_db():
     db = Session()
@@ -49,6 +128,249 @@ def get_db():
     finally:
         db.close()
 
+def get_record_meta(db: DBSession, patient_id: int, ecg_id: int) -> RecordMeta:
+    """Vérifie l'appartenance ECG ↔ patient via le registre (sans SQL si en cache)"""
+    meta = REGISTRY.load(db, ecg_id)
+    if meta is None or meta.patient_id != patient_id:
+        raise HTTPException(404, f"ECG {ecg_id} introuvable pour le patient {patient_id}")
+    return meta
+
+async def get_record_meta_async(db: DBSession, patient_id: int, ecg_id: int) -> RecordMeta:
+    """get_record_meta pour les handlers async : hors cache, la lecture en base
+    (et la conversion d'un ancien CSV) tourne dans le threadpool"""
+    meta = REGISTRY.get(ecg_id)
+    if meta is None:
+        return await run_in_threadpool(get_record_meta, db, patient_id, ecg_id)
+    metrics.cache_result("registry", True)
+    if meta.patient_id != patient_id:
+        raise HTTPException(404, f"ECG {ecg_id} introuvable pour le patient {patient_id}")
+    return meta
+
+def refresh_analysis_meta(db: DBSession, meta: RecordMeta) -> RecordMeta:
+    """L'analyse principale a pu être enregistrée par un autre processus (worker
+    uvicorn ou d'analyse) ; tant qu'elle manque au registre, la base est relue"""
+    if meta.analysis_path is None:
+        record = db.get(ECGRecord, meta.ecg_id)
+        if record is not None and record.analyse_fichier_csv:
+            return REGISTRY.refresh(record)
+    return meta
+
+def resolve_lead(meta: RecordMeta, lead: Optional[str]) -> str:
+    """Dérivation demandée (ou principale), vérifiée d'après le registre"""
+    if lead is None:
+        return meta.default_lead
+    if meta.leads and lead not in meta.leads:
+        raise HTTPException(400, f"La dérivation '{lead}' n'existe pas dans ce fichier")
+    return lead
+
+def read_signal(meta: RecordMeta, lead: Optional[str] = None, mmap: bool = False) -> np.ndarray:
+    """Charge une dérivation (par défaut la dérivation principale) du signal binaire.
+
+    Avec mmap=True, retourne une vue mémoire : seules les fenêtres indexées sont lues.
+    """
+    lead = lead or meta.default_lead
+    try:
+        with metrics.stage("load", ecg_id=meta.ecg_id, lead=lead, mmap=mmap) as span:
+            if mmap:
+                values = signal_store.open_signal(meta.storage_path, lead)
+            else:
+                values = signal_store.load_signal(meta.storage_path, lead)
+            span.set(n_samples=len(values))
+            return values
+    except LookupError as exc:
+        if lead in meta.leads:
+            raise HTTPException(404, "Fichier signal introuvable sur le disque")
+        raise HTTPException(400, str(exc))
+
+class ArtifactPending(Exception):
+    """Mode file d'attente : artefact absent, dont le calcul est confié à un worker"""
+    def __init__(self, meta: RecordMeta, lead: str, job: dict):
+        super().__init__(f"{job['kind']} en cours de calcul pour l'ECG {meta.ecg_id}")
+        self.meta, self.lead, self.job = meta, lead, job
+
+def check_complete(meta: RecordMeta) -> None:
+    """Aucun artefact n'est calculé sur le signal partiel d'un import en direct en cours"""
+    if meta.recording:
+        raise HTTPException(409, "Enregistrement en direct en cours : analyse disponible à la fin")
+
+def schedule_artifact(kind: str, meta: RecordMeta, lead: str) -> None:
+    """Mode file d'attente : le processus web ne calcule pas un artefact absent,
+    il planifie la tâche `kind` et répond 202 (voir `artifact_pending`)"""
+    if jobqueue.inline():
+        return
+    job = jobqueue.submit(
+        kind, meta.ecg_id, None if lead == meta.default_lead else lead, traceparent=tracing.inject()
+    )
+    raise ArtifactPending(meta, lead, job)
+
+def window_result(kind: str, meta: RecordMeta, lead: str, params: dict, compute):
+    """Calcul sur une fenêtre (non mis en cache sur disque) : fait ici en mode
+    inline ; en mode file d'attente, résultat de la tâche `kind` déjà exécutée
+    avec les mêmes paramètres, sinon tâche planifiée et réponse 202"""
+    if jobqueue.inline() or meta.recording:
+        # Import en direct : résultat provisoire, calculé ici comme l'analyse glissante de live.py
+        return compute()
+    params = {**params, "content_hash": meta.content_hash}  # signal remplacé : nouveau calcul
+    lead_key = None if lead == meta.default_lead else lead
+    done = jobqueue.result(kind, meta.ecg_id, lead_key, params)
+    if done is not None and done["state"] == "done":
+        return done["result"]
+    if done is not None:
+        raise HTTPException(500, f"Calcul impossible : {done['error']}")
+    job = jobqueue.submit(kind, meta.ecg_id, lead_key, params=params, traceparent=tracing.inject())
+    raise ArtifactPending(meta, lead, job)
+
+@app.exception_handler(ArtifactPending)
+async def artifact_pending(request: Request, exc: ArtifactPending):
+    status_url = f"/api/{exc.meta.patient_id}/{exc.meta.ecg_id}/analysis/status?lead={exc.lead}"
+    return JSONResponse(
+        {"patient_id": exc.meta.patient_id, "ecg_id": exc.meta.ecg_id, "lead": exc.lead,
+         "job": exc.job, "status_url": status_url},
+        status_code=202, headers={"Location": status_url},
+    )
+
+def get_r_peaks(meta: RecordMeta, lead: str, values: Optional[np.ndarray] = None) -> np.ndarray:
+    """Index des pics R d'une dérivation, calculés une fois puis mis en cache sur disque"""
+    version = analysis.artifact_version("rpeaks")
+    if meta.recording:
+        # Signal partiel : pics détectés en direct (live.py), rien n'est calculé ni mis en cache
+        r_idx = signal_store.load_artifact(meta.storage_path, lead, live.LIVE_PEAKS, version)
+        return r_idx if r_idx is not None else np.empty(0, dtype=np.int64)
+    lookup = lambda: signal_store.load_artifact(meta.storage_path, lead, "rpeaks", version)
+    r_idx = lookup()
+    metrics.cache_result("rpeaks", r_idx is not None)
+    if r_idx is not None:
+        return r_idx
+    schedule_artifact("rpeaks", meta, lead)
+
+    def compute() -> np.ndarray:
+        signal = values if values is not None else read_signal(meta, lead)
+        r_idx = analysis.detect_r_peaks(signal, meta.fs, meta.ecg_id)
+        signal_store.save_artifact(meta.storage_path, lead, "rpeaks", r_idx, version)
+        return r_idx
+    # Un seul calcul pour les appels concurrents (requêtes, précalcul, autres processus)
+    return singleflight.run(("rpeaks", meta.storage_path, lead, version), compute, lookup)
+
+def check_window(meta: RecordMeta, t0: float, t1: float) -> float:
+    """Valide la fenêtre [t0, t1] et retourne t1 borné à la durée de l'ECG"""
+    if t1 <= t0:
+        raise HTTPException(422, "t1 doit être strictement supérieur à t0")
+    if not meta.n_samples:
+        return t1
+    if t0 >= meta.duration:
+        raise HTTPException(
+            422, f"t0 dépasse la fin de l'enregistrement ({meta.duration:.2f} s)"
+        )
+    return min(t1, meta.duration)
+
+def default_window(meta: RecordMeta) -> tuple[float, float]:
+    """Fenêtre affichée à l'ouverture d'un ECG (get_data)"""
+    t1 = SEGMENT_DURATION
+    if meta.n_samples:
+        t1 = min(t1, meta.duration)
+    return 0, t1
+
+def hrv_artifact(t0: float, t1: float) -> str:
+    return f"hrv_{t0:g}_{t1:g}"
+
+def peaks_in_window(r_idx: np.ndarray, fs: float, t0: float, t1: float) -> np.ndarray:
+    """Masque des pics R compris dans la fenêtre [t0, t1] (s)"""
+    r_times = r_idx / fs
+    return (r_times >= t0) & (r_times <= t1)
+
+def window_hrv(meta: RecordMeta, lead: str, r_seg: np.ndarray, t0: float, t1: float) -> dict:
+    """HRV d'une fenêtre ; celle de la fenêtre par défaut est mise en cache sur disque"""
+    version = analysis.artifact_version("hrv")
+    if (t0, t1) != default_window(meta) or meta.recording:
+        return window_result(
+            "segment_hrv", meta, lead, {"t0": t0, "t1": t1, "version": version},
+            lambda: analysis.hrv_metrics(r_seg, meta.fs),
+        )
+    name = hrv_artifact(t0, t1)
+    lookup = lambda: signal_store.load_json_artifact(meta.storage_path, lead, name, version)
+    hrv = lookup()
+    metrics.cache_result("hrv", hrv is not None)
+    if hrv is not None:
+        return hrv
+    schedule_artifact("hrv", meta, lead)
+
+    def compute() -> dict:
+        hrv = analysis.hrv_metrics(r_seg, meta.fs)
+        signal_store.save_json_artifact(meta.storage_path, lead, name, hrv, version)
+        return hrv
+    return singleflight.run(("hrv", meta.storage_path, lead, name, version), compute, lookup)
+
+def get_overview(meta: RecordMeta, lead: str, values: Optional[np.ndarray] = None) -> np.ndarray:
+    """Indices (LTTB) de la vue d'ensemble d'une dérivation, calculés une fois puis mis en cache sur disque"""
+    version = analysis.artifact_version("overview")
+    lookup = lambda: signal_store.load_artifact(meta.storage_path, lead, "overview", version)
+    kept = lookup()
+    metrics.cache_result("overview", kept is not None)
+    if kept is not None:
+        return kept
+    check_complete(meta)
+    schedule_artifact("overview", meta, lead)
+
+    def compute() -> np.ndarray:
+        signal = values if values is not None else read_signal(meta, lead)
+        with metrics.stage("downsample", n_samples=len(signal), target_points=OVERVIEW_POINTS):
+            kept = downsample.lttb(np.arange(len(signal)), signal, OVERVIEW_POINTS)
+        signal_store.save_artifact(meta.storage_path, lead, "overview", kept, version)
+        return kept
+    return singleflight.run(("overview", meta.storage_path, lead, version), compute, lookup)
+
+def get_morphology(meta: RecordMeta, lead: str) -> dict[str, np.ndarray]:
+    """Caractéristiques de tous les battements d'une dérivation (table en colonnes),
+    calculées une fois puis mises en cache sur disque"""
+    version = analysis.artifact_version("morphology")
+    lookup = lambda: signal_store.load_table_artifact(meta.storage_path, lead, "morphology", version)
+    table = lookup()
+    metrics.cache_result("morphology", table is not None)
+    if table is not None:
+        return table
+    check_complete(meta)
+    schedule_artifact("morphology", meta, lead)
+
+    def compute() -> dict[str, np.ndarray]:
+        values = read_signal(meta, lead)
+        r_idx = get_r_peaks(meta, lead, values)
+        with metrics.stage("clean", ecg_id=meta.ecg_id, n_samples=len(values)):
+            clean = nk.ecg_clean(values, sampling_rate=meta.fs, method=analysis.CLEAN_METHOD)
+        with metrics.stage("morphology", ecg_id=meta.ecg_id, n_beats=len(r_idx)):
+            table = morphology.extract(clean, r_idx, meta.fs)
+        signal_store.save_table_artifact(meta.storage_path, lead, "morphology", table, version)
+        return table
+    return singleflight.run(("morphology", meta.storage_path, lead, version), compute, lookup)
+
+BEAT_MATCH_TOLERANCE = 0.05  # s entre un pic R et le pic d'un battement classé
+
+def beat_labels(meta: RecordMeta, lead: str, r_idx: np.ndarray) -> Optional[np.ndarray]:
+    """Classe de chaque pic R d'après l'analyse enregistrée (None : pas d'analyse).
+
+    Chaque pic reçoit la classe du battement classé le plus proche
+    (`beatsSample`) ; une analyse plus ancienne, sans positions, est alignée
+    dans l'ordre (epoch NeuroKit k = k-ième pic).
+    """
+    saved = load_analysis_from_db(meta, lead)
+    if not saved:
+        return None
+    predicted = np.asarray([label for _, label in saved.get("beatsPrediction", [])], dtype=object)
+    labels = np.full(len(r_idx), None, dtype=object)
+    samples = np.asarray(saved.get("beatsSample", []), dtype=np.int64)
+    if len(samples) != len(predicted):
+        n = min(len(r_idx), len(predicted))
+        labels[:n] = predicted[:n]
+        return labels
+    if len(samples) == 0:
+        return labels
+    # Plus proche battement classé (positions triées), dans la tolérance
+    right = np.minimum(np.searchsorted(samples, r_idx), len(samples) - 1)
+    left = np.maximum(right - 1, 0)
+    nearest = np.where(np.abs(samples[left] - r_idx) <= np.abs(samples[right] - r_idx), left, right)
+    close = np.abs(samples[nearest] - r_idx) <= BEAT_MATCH_TOLERANCE * meta.fs
+    labels[close] = predicted[nearest[close]]
+    return labels
+
 # LLM Mistral 7B -------------------------------------------------------------
 LLM_MODEL_NAME = os.environ.get(
     "LLM_MODEL_NAME",
@@ -108,47 +430,81 @@ def generate_llm_report(metrics: dict) -> str:
     return cleaned_content
 
 
-def get_analysis_cache_path(csv_file_path: Path) -> Path:
+def get_analysis_cache_path(signal_base: Path, lead: Optional[str] = None) -> Path:
     """Retourne le chemin vers le fichier d'analyse basé sur le nom du fichier CSV"""
-    # Extraire le nom du fichier sans extension
-    base_name = csv_file_path.stem  # Pour 101.csv -> 101
+    # Nom du fichier sans extension (101.csv -> 101), suffixé par la dérivation
+    # si ce n'est pas la dérivation principale
+    base_name = signal_base.name if lead is None else f"{signal_base.name}_{lead}"
     # Créer le nom du fichier d'analyse
     analysis_filename = f"{base_name}_analyse.json"
     # Retourner le chemin complet dans le même dossier
-    return csv_file_path.parent / analysis_filename
+    return signal_base.parent / analysis_filename
 
-def save_analysis_to_db(db: DBSession, ecg_record: ECGRecord, analysis_data: dict):
-    """Sauvegarde l'analyse dans la base de données"""
+def save_analysis_to_db(
+    db: DBSession, ecg_record: ECGRecord, analysis_data: dict, lead: Optional[str] = None
+):
+    """Sauvegarde l'analyse (dérivation principale si lead est None) dans la base de données"""
     try:
         # Créer le chemin d'analyse basé sur le fichier CSV
-        csv_path = Path(ecg_record.fichier_csv)
-        analysis_path = get_analysis_cache_path(csv_path)
+        base = Path(ecg_record.fichier_signal or signal_store.signal_base(ecg_record.fichier_csv))
+        analysis_path = get_analysis_cache_path(base, lead)
         
-        # Sauvegarder le fichier JSON
-        with open(analysis_path, 'w', encoding='utf-8') as f:
+        # Sauvegarder le fichier JSON (écriture atomique : jamais de fichier partiel)
+        with signal_store.atomic_open(analysis_path, 'w', encoding='utf-8') as f:
             json.dump(analysis_data, f, ensure_ascii=False, indent=2)
         
-        # Mettre à jour le chemin dans la base
-        ecg_record.analyse_fichier_csv = str(analysis_path)
-        db.commit()
+        # Mettre à jour le chemin dans la base (seule l'analyse principale y est référencée)
+        if lead is None:
+            ecg_record.analyse_fichier_csv = str(analysis_path)
+            db.commit()
+            REGISTRY.publish(ecg_record)
         
     except Exception as e:
         print(f"Erreur lors de la sauvegarde de l'analyse : {e}")
 
-def load_analysis_from_db(ecg_record: ECGRecord) -> Optional[dict]:
+def analysis_path_for(meta: RecordMeta, lead: str) -> Optional[str]:
+    if lead == meta.default_lead:
+        return meta.analysis_path
+    return str(get_analysis_cache_path(Path(meta.storage_path), lead))
+
+def analysis_etag(meta: RecordMeta, lead: str, path: Optional[str]) -> Optional[str]:
+    """ETag d'une analyse : version = date de modification et taille du fichier."""
+    try:
+        stat = Path(path).stat() if path else None
+    except OSError:
+        stat = None
+    if stat is None:
+        return None
+    return http_cache.make_etag(
+        "analysis", meta.content_hash, meta.fs, meta.patient_id, meta.ecg_id, lead,
+        stat.st_mtime_ns, stat.st_size, analysis.artifact_version("classification"),
+    )
+
+def load_analysis_from_db(meta: RecordMeta, lead: Optional[str] = None) -> Optional[dict]:
     """Charge l'analyse depuis le fichier référencé dans la base"""
-    if not ecg_record.analyse_fichier_csv:
+    path = analysis_path_for(meta, lead or meta.default_lead)
+    if not path:
         return None
     
-    analysis_path = Path(ecg_record.analyse_fichier_csv)
+    analysis_path = Path(path)
     if not analysis_path.exists():
         return None
     
     try:
         with open(analysis_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            data = json.load(f)
     except (json.JSONDecodeError, FileNotFoundError):
         return None
+    # Analyse d'une version antérieure (modèle, bibliothèques…) : absente, et
+    # recalculée en arrière-plan pour la dérivation principale
+    if not isinstance(data, dict) or data.get("artifact_version") != analysis.artifact_version("classification"):
+        if (lead or meta.default_lead) == meta.default_lead:
+            precompute.enqueue(meta.ecg_id)
+        return None
+    # Le fichier peut être partagé par plusieurs ECG au contenu identique
+    if "ecg_id" in data:
+        data.update(patient_id=meta.patient_id, ecg_id=meta.ecg_id)
+    return data
 
 @app.post('/api/import_ecg')
 async def import_data(
@@ -164,21 +520,49 @@ async def import_data(
     allergies: str = Form(""),
     date: Optional[str] = Form(None),
     location: str = Form(...),
-    samplingRate: int = Form(...),
+    samplingRate: Optional[int] = Form(None, description="Ignorée si le CSV a une colonne de temps"),
     file: UploadFile = File(...),
     db: DBSession = Depends(get_db)
 ):
-    folder = f'{firstName}_{lastName}_{dateOfBirth}'
+    folder = ingest.patient_folder(firstName, lastName, dateOfBirth)
     target = UPLOAD_DIR / folder
     target.mkdir(exist_ok=True)
 
-    safe_filename = file.filename.replace(" ", "_")
-    dest_path = target / safe_filename
+    dest_path = ingest.unique_path(target / ingest.safe_name(file.filename))
 
+    # Détection du format sur les premiers Kio : un fichier inutilisable est
+    # refusé avant toute écriture
+    head = await file.read(SNIFF_SIZE)
     try:
-        with dest_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        fmt = sniff_csv(head)
+    except ValueError as exc:
+        await file.close()
+        raise HTTPException(422, f"Fichier ECG invalide : {exc}")
+    if fmt.sampling_rate is None and not samplingRate:
+        await file.close()
+        raise HTTPException(422, "samplingRate requis : aucune colonne de temps dans le fichier")
+
+    # Lecture par blocs hors de la boucle d'événements : hachage, copie éventuelle
+    # du CSV et conversion directe en signal binaire au fil de l'eau
+    # (un writer qui échoue à sa création supprime lui-même ses fichiers)
+    writer = None
+    try:
+        writer = signal_store.SignalWriter(
+            signal_store.signal_base(dest_path),
+            fmt,
+            csv_copy=dest_path if KEEP_ORIGINAL_CSV else None,
+        )
+        await run_in_threadpool(writer.feed, head)
+        while chunk := await file.read(signal_store.CHUNK_SIZE):
+            await run_in_threadpool(writer.feed, chunk)
+        info = await run_in_threadpool(writer.close)
+    except ValueError as exc:
+        if writer is not None:
+            writer.abort()
+        raise HTTPException(422, f"Fichier ECG invalide : {exc}")
     except Exception as exc:
+        if writer is not None:
+            writer.abort()
         raise HTTPException(500, f"Erreur sauvegarde fichier : {exc}")
     finally:
         await file.close()
@@ -197,29 +581,18 @@ async def import_data(
             except ValueError as e:
                 raise HTTPException(422, str(e))
 
-        # Rechercher patient existant
-        patient = db.query(Patient).filter_by(
-            nom=lastName.strip(),
-            prenom=firstName.strip(),
-            date_naissance=dob_parsed
-        ).first()
-
-        if not patient:
-            # Créer patient s'il n'existe pas
-            patient = Patient(
-                nom=lastName.strip(),
-                prenom=firstName.strip(),
-                date_naissance=dob_parsed,
-                age=age,
-                poids=weight,
-                taille=height,
-                adresse=address.strip(),
-                antecedant=medicalHistory.strip(),
-                prise_medoc=medication,
-                allergies=allergies.strip(),
-            )
-            db.add(patient)
-            db.flush()  # génère patient.id
+        # Rechercher patient existant (ou le créer)
+        patient = ingest.find_or_create_patient(db, {
+            "firstName": firstName,
+            "lastName": lastName,
+            "age": age,
+            "weight": weight,
+            "height": height,
+            "address": address,
+            "medicalHistory": medicalHistory,
+            "medication": medication,
+            "allergies": allergies,
+        }, dob_parsed)
 
         # Ajouter un ECG pour ce patient
         ecg = ECGRecord(
@@ -227,38 +600,290 @@ async def import_data(
             fichier_csv=str(dest_path),
             analyse_fichier_csv=None,  # Sera rempli lors de la première analyse
             lieu=location.strip(),
-            frequence_hz=samplingRate,
+            frequence_hz=ingest.resolve_sampling_rate(samplingRate, info),
             date_prise=date_ecg_parsed,
+            nb_echantillons=info["n_samples"],
+            derivations=",".join(info["leads"]),
+            fichier_signal=info["signal_base"],
+            hash_contenu=info["sha256"],
+            format_csv=json.dumps(info["format"]),
         )
+        # Contenu déjà stocké : on réutilise ses fichiers et ses analyses
+        original = ingest.share_signal(db, ecg, dest_path)
         db.add(ecg)
         db.commit()
+        REGISTRY.publish(ecg)
+        precompute.enqueue(ecg.id)
 
     except SQLAlchemyError as exc:
         db.rollback()
-        dest_path.unlink(missing_ok=True)
+        writer.abort()
         raise HTTPException(500, f"Erreur base de données : {exc}")
 
     return JSONResponse({
         "status": "ok",
         "patient_id": patient.id,
         "ecg_id": ecg.id,
-        "csv_path": str(dest_path)
+        "csv_path": ecg.fichier_csv,
+        "duplicate_of": original.id if original is not None else None,
+        "n_samples": info["n_samples"],
+        "sha256": info["sha256"],
+        "sampling_rate": ecg.frequence_hz,
+        "leads": info["leads"],
+        "format": info["format"],
     })
 
+@app.post("/api/import_ecg/bulk", summary="Import de plusieurs CSV ou d'archives zip/tar")
+def import_bulk(
+    files: list[UploadFile] = File([], description="Fichiers CSV"),
+    archive: list[UploadFile] = File([], description="Archives zip / tar(.gz) de CSV + manifeste"),
+    manifest: Optional[UploadFile] = File(None, description="manifest.json / manifest.csv"),
+    firstName: Optional[str] = Form(None),
+    lastName: Optional[str] = Form(None),
+    dateOfBirth: Optional[str] = Form(None),
+    age: Optional[int] = Form(None),
+    weight: Optional[float] = Form(None),
+    height: Optional[float] = Form(None),
+    address: str = Form(""),
+    medicalHistory: str = Form(""),
+    medication: bool = Form(False),
+    allergies: str = Form(""),
+    date: Optional[str] = Form(None),
+    location: str = Form(""),
+    samplingRate: Optional[int] = Form(None),
+    db: DBSession = Depends(get_db),
+):
+    """Les champs de formulaire servent de valeurs par défaut ; le manifeste
+    peut les redéfinir fichier par fichier. Endpoint synchrone : les copies
+    et la décompression tournent dans le threadpool, pas dans la boucle."""
+    defaults = {
+        "firstName": firstName, "lastName": lastName, "dateOfBirth": dateOfBirth,
+        "age": age, "weight": weight, "height": height, "address": address,
+        "medicalHistory": medicalHistory, "medication": medication,
+        "allergies": allergies, "date": date, "location": location,
+        "samplingRate": samplingRate,
+    }
+    staging = UPLOAD_DIR / "_staging" / uuid.uuid4().hex
+    staging.mkdir(parents=True)
+    try:
+        # 1) Réception en flux des CSV, de l'archive et du manifeste ---------
+        staged: dict[str, Path] = {}
+        entries: dict[str, dict] = {}
+        results = []
+        # Un même fichier reçu deux fois n'est importé qu'une fois (le premier)
+        def add_staged(name: str, path: Path) -> None:
+            if name in staged:
+                results.append({"file": name, "status": "error",
+                                "detail": "Fichier reçu plusieurs fois : seul le premier est importé"})
+            else:
+                staged[name] = path
+        try:
+            for i, f in enumerate(files):
+                name = ingest.safe_name(f.filename)
+                add_staged(name, ingest.stage_stream(f.file, staging / f"{i}_{name}"))
+            if manifest is not None:
+                entries.update(ingest.read_manifest(manifest.filename, manifest.file))
+            for i, a in enumerate(archive):
+                archive_dir = staging / f"archive_{i}"
+                archive_dir.mkdir()
+                archived, archived_manifest = ingest.stage_archive(a.file, a.filename, archive_dir)
+                for name, path in archived:
+                    add_staged(name, path)
+                entries.update(archived_manifest)
+        except (ValueError, KeyError, OSError, zipfile.BadZipFile) as exc:
+            raise HTTPException(422, f"Import impossible : {exc}")
+        if not staged:
+            raise HTTPException(422, "Aucun fichier CSV reçu")
+
+        # 2) Champs par fichier + déplacement vers le dossier du patient ------
+        items = []
+        for name, staged_path in staged.items():
+            status = {"file": name, "status": "error"}
+            results.append(status)
+            try:
+                fields = ingest.coerce_fields(
+                    {**defaults, **ingest.manifest_entry(entries, name, staged)}
+                )
+                dob = parse_date_flex(fields["dateOfBirth"])
+                date_ecg = parse_date_flex(fields["date"]) if fields.get("date") else None
+            except ValueError as e:
+                status["detail"] = str(e)
+                continue
+            target = UPLOAD_DIR / ingest.patient_folder(
+                fields["firstName"], fields["lastName"], fields["dateOfBirth"]
+            )
+            target.mkdir(exist_ok=True)
+            dest_path = ingest.unique_path(target / Path(name).name)
+            shutil.move(str(staged_path), dest_path)
+            items.append((status, fields, dob, date_ecg, dest_path))
+
+        # 3) Préparation des signaux en parallèle -----------------------------
+        pool = ingest.get_pool()
+        futures = [
+            pool.submit(ingest.prepare_signal, str(item[-1]), KEEP_ORIGINAL_CSV)
+            for item in items
+        ]
+        prepared = []
+        for item, future in zip(items, futures):
+            status, fields, dest_path = item[0], item[1], item[-1]
+            try:
+                info = future.result()
+                info["fs"] = ingest.resolve_sampling_rate(fields.get("samplingRate"), info)
+                prepared.append((item, info))
+                continue
+            except ValueError as exc:
+                status["detail"] = f"Fichier ECG invalide : {exc}"
+            except Exception as exc:
+                status["detail"] = f"Fichier illisible : {exc}"
+            dest_path.unlink(missing_ok=True)
+            signal_store.delete_signal(str(signal_store.signal_base(dest_path)))
+
+        # 4) Patients et ECG créés dans une seule transaction -----------------
+        created = []
+        try:
+            for (status, fields, dob, date_ecg, dest_path), info in prepared:
+                patient = ingest.find_or_create_patient(db, fields, dob)
+                ecg = ECGRecord(
+                    patient_id=patient.id,
+                    fichier_csv=str(dest_path),
+                    analyse_fichier_csv=None,
+                    lieu=fields.get("location", "").strip(),
+                    frequence_hz=info["fs"],
+                    date_prise=date_ecg,
+                    nb_echantillons=info["n_samples"],
+                    derivations=",".join(info["leads"]),
+                    fichier_signal=info["signal_base"],
+                    hash_contenu=info["sha256"],
+                    format_csv=json.dumps(info["format"]),
+                )
+                original = ingest.share_signal(db, ecg, dest_path)
+                db.add(ecg)
+                db.flush()  # visible pour les doublons suivants du même lot
+                status["duplicate_of"] = original.id if original is not None else None
+                created.append((status, patient, ecg))
+            db.commit()
+        except SQLAlchemyError as exc:
+            db.rollback()
+            for (status, *_, dest_path), info in prepared:
+                dest_path.unlink(missing_ok=True)
+                signal_store.delete_signal(info["signal_base"], info["leads"])
+                status.pop("duplicate_of", None)
+                status["detail"] = f"Erreur base de données : {exc}"
+            created = []
+
+        for status, patient, ecg in created:
+            REGISTRY.publish(ecg)
+            precompute.enqueue(ecg.id)
+            status.update(status="ok", patient_id=patient.id, ecg_id=ecg.id,
+                          csv_path=ecg.fichier_csv)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        for f in [*files, *archive, manifest]:
+            if f is not None:
+                f.file.close()
+
+    n_ok = sum(r["status"] == "ok" for r in results)
+    return JSONResponse({
+        "status": "ok" if n_ok == len(results) else "partial" if n_ok else "error",
+        "imported": n_ok,
+        "results": results,
+    })
+
+PATIENT_SORT_COLUMNS = {"id": Patient.id, "nom": Patient.nom, "prenom": Patient.prenom}
+
+def page_patients(
+    query, response: Response, skip: int, limit: int, cursor: Optional[str],
+    sort: str, order: str, q: Optional[str],
+) -> list:
+    """Filtre, trie et pagine une requête sur les patients (liste complète ou résumé).
+
+    Le curseur de la page suivante est renvoyé dans l'en-tête X-Next-Cursor.
+    """
+    sort_col = PATIENT_SORT_COLUMNS[sort]
+    desc = order == "desc"
+
+    if q:
+        # Sous-chaîne du nom complet, dans un sens ou dans l'autre ("anne dup", "dupont a")
+        term = " ".join(q.split()).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"%{term}%"
+        query = query.filter(or_(
+            (Patient.prenom + " " + Patient.nom).ilike(pattern, escape="\\"),
+            (Patient.nom + " " + Patient.prenom).ilike(pattern, escape="\\"),
+        ))
+
+    # Pagination par curseur : on reprend après la clé (tri, id) de la dernière ligne
+    if cursor:
+        try:
+            last_value, last_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(422, str(e))
+        after = (lambda col, v: col < v) if desc else (lambda col, v: col > v)
+        if sort == "id":
+            query = query.filter(after(Patient.id, last_id))
+        else:
+            query = query.filter(or_(
+                after(sort_col, last_value),
+                and_(sort_col == last_value, after(Patient.id, last_id)),
+            ))
+
+    order_by = [sort_col] if sort == "id" else [sort_col, Patient.id]
+    query = query.order_by(*[c.desc() if desc else c.asc() for c in order_by])
+    if skip and not cursor:
+        query = query.offset(skip)
+    rows = query.limit(limit + 1).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor([getattr(last, sort), last.id])
+    return rows
+
 @app.get("/api/patients", response_model=list[PatientOut])
 def list_patients(
-    skip: int = Query(0, ge=0),
+    response: Response,
+    skip: int = Query(0, ge=0, description="Décalage (ancien mode, préférer cursor)"),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Curseur renvoyé dans l'en-tête X-Next-Cursor"),
+    sort: Literal["id", "nom", "prenom"] = Query("id"),
+    order: Literal["asc", "desc"] = Query("asc"),
+    q: Optional[str] = Query(None, description="Filtre sur le nom complet (prénom nom ou nom prénom)"),
     db: DBSession = Depends(get_db),
 ):
-    patients = (
-        db.query(Patient)
-        .options(selectinload(Patient.ecg_records))
-        .offset(skip)
-        .limit(limit)
-        .all()
+    query = db.query(Patient).options(selectinload(Patient.ecg_records))
+    return page_patients(query, response, skip, limit, cursor, sort, order, q)
+
+@app.get("/api/patients/summary", response_model=list[PatientSummaryOut])
+def list_patient_summaries(
+    response: Response,
+    skip: int = Query(0, ge=0, description="Décalage (ancien mode, préférer cursor)"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Curseur renvoyé dans l'en-tête X-Next-Cursor"),
+    sort: Literal["id", "nom", "prenom"] = Query("id"),
+    order: Literal["asc", "desc"] = Query("asc"),
+    q: Optional[str] = Query(None, description="Filtre sur le nom complet (prénom nom ou nom prénom)"),
+    db: DBSession = Depends(get_db),
+):
+    """Liste légère des patients, sans le détail des ECG."""
+    # Nombre d'ECG et date du dernier calculés en SQL (sous-requêtes corrélées,
+    # évaluées uniquement pour les lignes de la page grâce à l'index patient_id)
+    nb_ecg = (
+        select(func.count(ECGRecord.id))
+        .where(ECGRecord.patient_id == Patient.id)
+        .correlate(Patient)
+        .scalar_subquery()
+    )
+    derniere_ecg = (
+        select(func.max(ECGRecord.date_prise))
+        .where(ECGRecord.patient_id == Patient.id)
+        .correlate(Patient)
+        .scalar_subquery()
+    )
+    query = db.query(
+        Patient.id, Patient.nom, Patient.prenom, Patient.date_naissance, Patient.age,
+        nb_ecg.label("nb_ecg"), derniere_ecg.label("derniere_ecg"),
     )
-    return patients
+    rows = page_patients(query, response, skip, limit, cursor, sort, order, q)
+    return [row._asdict() for row in rows]
 
 @app.get("/api/patients/{patient_id}", response_model=PatientOut)
 def get_patient(patient_id: int, db: DBSession = Depends(get_db)):
@@ -271,207 +896,579 @@ def get_patient(patient_id: int, db: DBSession = Depends(get_db)):
         raise HTTPException(404, f"Patient {patient_id} introuvable")
     return patient
 
+# ------------------------------------------------------------------
+#  Profils de requêtes (avant les routes /api/{patient_id}/…) ------
+# ------------------------------------------------------------------
+@app.get("/api/admin/profiles", summary="Profils de requêtes récents (ECG_PROFILING=1)")
+def list_profiles(limit: int = Query(50, ge=1, le=500)):
+    if not profiling.ENABLED:
+        raise HTTPException(404, "Profilage désactivé")
+    return profiling.list_profiles(limit)
+
+@app.get("/api/admin/profiles/{profile_id}", summary="Télécharge un profil (folded stacks)")
+def download_profile(profile_id: str):
+    path = profiling.profile_path(profile_id) if profiling.ENABLED else None
+    if path is None:
+        raise HTTPException(404, f"Profil {profile_id} introuvable")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=path.name)
+
+@app.get("/api/admin/artifacts", summary="Versions des artefacts et ECG obsolètes par type")
+def artifacts_report(db: DBSession = Depends(get_db)):
+    versions = analysis.versions()
+    counts = {kind: {"current": 0, "stale": 0, "missing": 0} for kind in versions}
+    stale_ids = []
+    n_records = 0
+    for record in db.scalars(select(ECGRecord).order_by(ECGRecord.id)):
+        n_records += 1
+        states = artifact_states(meta_from_record(record))
+        for kind, state in states.items():
+            counts[kind][state] += 1
+        if "stale" in states.values():
+            stale_ids.append(record.id)
+    return {
+        "versions": {
+            kind: {"version": analysis.artifact_version(kind), "params": params}
+            for kind, params in versions.items()
+        },
+        "records": n_records,
+        "artifacts": counts,
+        "stale_ecg_ids": stale_ids,
+    }
+
+@app.post("/api/admin/artifacts/recompute", summary="Planifie le recalcul des artefacts obsolètes")
+def recompute_artifacts(
+    missing: bool = Query(False, description="Inclure les ECG dont un artefact n'a jamais été calculé"),
+    db: DBSession = Depends(get_db),
+):
+    wanted = ("stale", "missing") if missing else ("stale",)
+    scheduled = []
+    for record in db.scalars(select(ECGRecord).order_by(ECGRecord.id)):
+        states = artifact_states(meta_from_record(record))
+        if any(state in wanted for state in states.values()) and precompute.enqueue(record.id):
+            scheduled.append(record.id)
+    return {"scheduled": len(scheduled), "ecg_ids": scheduled}
+
+@app.get("/api/admin/jobs", summary="File d'attente des workers d'analyse (ECG_ANALYSIS_MODE=queue)")
+def list_jobs(
+    limit: int = Query(50, ge=1, le=500),
+    state: Optional[Literal["queued", "running", "done", "error"]] = Query(None),
+):
+    return {"mode": jobqueue.MODE, "counts": jobqueue.counts(), "jobs": jobqueue.recent(limit, state)}
+
 # ------------------------------------------------------------------
 #  ECG pour un patient / ECG donné -----------------------
 # ------------------------------------------------------------------
 @app.get("/api/{patient_id}/{ecg_id}")
 async def get_data(
+    request: Request,
     patient_id: int,
     ecg_id: int,
+    lead: Optional[str] = Query(None, description="Dérivation (par défaut MLII ou la première)"),
     db: DBSession = Depends(get_db)
 ):
-    # 1) BD : vérifier appartenance patient / ECG --------------------
-    record = (
-        db.query(ECGRecord)
-        .filter(ECGRecord.id == ecg_id, ECGRecord.patient_id == patient_id)
-        .first()
-    )
-    if record is None:
-        raise HTTPException(
-            404, f"ECG {ecg_id} appartenant au patient {patient_id} introuvable"
-        )
+    # 1) Registre : vérifier appartenance patient / ECG -------------
+    meta = await get_record_meta_async(db, patient_id, ecg_id)
 
-    t0 = 0
-    t1 = t0 + SEGMENT_DURATION
-    return await get_segment(patient_id, ecg_id, t0=t0, t1=t1, db=db)
+    t0, t1 = default_window(meta)
+    return await get_segment(
+        request, patient_id, ecg_id, t0=t0, t1=t1, lead=lead, target_points=None, db=db
+    )
 
 # ------------------------------------------------------------------
 #  SEGMENT d'ECG pour un patient / ECG donné -----------------------
 # ------------------------------------------------------------------
+def compute_segment(
+    meta: RecordMeta, lead: str, t0: float, t1: float, target_points: Optional[int]
+) -> dict:
+    """Segment [t0, t1] d'une dérivation, pics R, RR et HRV de la fenêtre"""
+    FS = meta.fs
+
+    # R-peaks de la dérivation (cache disque), puis lecture de la seule fenêtre
+    r_idx = get_r_peaks(meta, lead)
+    ecg_values = read_signal(meta, lead, mmap=True)
+
+    # Segment du signal 
+    i0 = max(int(np.floor(t0 * FS)) - 1, 0)
+    i1 = min(int(np.ceil(t1 * FS)) + 2, len(ecg_values))
+    times = np.arange(i0, i1) / FS
+    values = np.asarray(ecg_values[i0:i1], dtype=np.float64)
+    mask_sig = (times >= t0) & (times <= t1)
+    times, values = times[mask_sig], values[mask_sig]
+     
+    # Filtre des R-peaks & RR dans la fenêtre
+    r_seg = r_idx[peaks_in_window(r_idx, FS, t0, t1)]
+
+    # Sous-échantillonnage à la largeur du graphique, en gardant les pics R
+    if target_points is not None and len(values) > target_points:
+        first = i0 + int(np.argmax(mask_sig))
+        with metrics.stage("downsample", n_samples=len(values), target_points=target_points):
+            kept = downsample.lttb(times, values, target_points, keep=r_seg - first)
+        times, values = times[kept], values[kept]
+    ecg_data = np.column_stack((times, values))
+    r_times_seg = r_seg / FS
+    r_ampl_seg = np.asarray(ecg_values[r_seg], dtype=np.float64)
+
+    if len(r_seg) < 3:
+        raise HTTPException(400, "Pas assez de R-peaks pour le calcul HRV")
+
+    r_peaks = np.column_stack((r_times_seg, r_ampl_seg))
+
+    rr_int = np.diff(r_times_seg)
+    rr_ts = r_times_seg[1:]
+    rr_seg = np.column_stack((rr_ts, rr_int))
+
+    # HRV sur le segment (précalculée pour la fenêtre par défaut)
+    hrv_metrics = window_hrv(meta, lead, r_seg, t0, t1)
+
+    return {
+        "patient_id": meta.patient_id,
+        "ecg_id": meta.ecg_id,
+        "lead": lead,
+        "sampling_rate": FS,
+        "t0": t0,
+        "t1": t1,
+        "target_points": target_points,
+        "ecg_data": ecg_data,
+        "r_peaks": r_peaks,
+        "rr_intervals": rr_seg,
+        "metrics": hrv_metrics,
+        "segment_length": t1 - t0,
+    }
+
 @app.get(
     "/api/{patient_id}/{ecg_id}/segment",
     summary="Renvoie le segment [t0-t1] et HRV associée"
 )
 async def get_segment(
+    request: Request,
     patient_id: int,
     ecg_id: int,
     t0: float = Query(..., ge=0, description="Début du segment (s)"),
     t1: float = Query(..., gt=0, description="Fin du segment (s)"),
+    lead: Optional[str] = Query(None, description="Dérivation (par défaut MLII ou la première)"),
+    target_points: Optional[int] = Query(
+        None, ge=10, le=100_000,
+        description="Nombre de points voulu (largeur du graphique) : sous-échantillonnage LTTB, pics R conservés",
+    ),
     db: DBSession = Depends(get_db),
 ):
-    if t1 <= t0:
-        raise HTTPException(422, "t1 doit être strictement supérieur à t0")
-
-    # Vérifier que l'ECG appartient bien au patient
-    record = (
-        db.query(ECGRecord)
-        .filter(ECGRecord.id == ecg_id, ECGRecord.patient_id == patient_id)
-        .first()
+    # Vérifier que l'ECG appartient bien au patient et que t0 est dans l'ECG
+    meta = await get_record_meta_async(db, patient_id, ecg_id)
+    t1 = check_window(meta, t0, t1)
+    lead = resolve_lead(meta, lead)
+
+    # Le segment ne dépend que du contenu et des versions des pics R et de la
+    # HRV : revalidation sans recalcul
+    versions = analysis.artifact_version("rpeaks"), analysis.artifact_version("hrv")
+    etag = http_cache.make_etag(
+        "segment", meta.content_hash, meta.fs, patient_id, ecg_id, lead, t0, t1, target_points, *versions
     )
-    if record is None:
-        raise HTTPException(404, f"ECG {ecg_id} introuvable pour le patient {patient_id}")
-
-    FS = record.frequence_hz
-    path = Path(record.fichier_csv)
-    if not path.exists():
-        raise HTTPException(404, "Fichier CSV introuvable sur le disque")
+    control = http_cache.cache_control(request, meta.content_hash, *versions)
+    if (cached := http_cache.not_modified(request, etag, control)) is not None:
+        return cached
 
-    # Lecture CSV et extraction du signal MLII
-    try:
-        df = pd.read_csv(path)
-    except Exception as exc:
-        raise HTTPException(500, f"Erreur lecture CSV : {exc}")
-    if "MLII" not in df.columns:
-        raise HTTPException(400, "La dérivation 'MLII' n'existe pas dans ce fichier")
-
-    values = df["MLII"]
-    times = df.index.to_series() / FS
-    ecg_values = values.values
-
-    # Nettoyage + R-peaks
-    clean = nk.ecg_clean(values, sampling_rate=FS)
-    _, info = nk.ecg_peaks(clean, sampling_rate=FS, method="neurokit")
-    r_idx = np.asarray(info["ECG_R_Peaks"], dtype=int)
-    r_times = r_idx / FS
-    r_ampl = ecg_values[r_idx]
+    # Un même segment demandé en même temps n'est calculé qu'une fois
+    result = await singleflight.run_async(
+        ("segment", etag), lambda: compute_segment(meta, lead, t0, t1, target_points)
+    )
+    return http_cache.respond(request, result, etag, control)
 
-    # Segment du signal 
-    mask_sig = (times >= t0) & (times <= t1)
-    ecg_data = [[float(t), float(v)] for t, v in zip(times[mask_sig], values[mask_sig])]
-     
-    # Filtre des R-peaks & RR dans la fenêtre
-    mask_r = (r_times >= t0) & (r_times <= t1)
-    r_seg = r_idx[mask_r]
-    r_times_seg = r_times[mask_r]
-    r_ampl_seg = r_ampl[mask_r]
+# ------------------------------------------------------------------
+#  VUE D'ENSEMBLE de tout l'enregistrement -------------------------
+# ------------------------------------------------------------------
+@app.get(
+    "/api/{patient_id}/{ecg_id}/overview",
+    summary="Renvoie tout l'enregistrement sous-échantillonné (navigation)"
+)
+async def get_overview_data(
+    request: Request,
+    patient_id: int,
+    ecg_id: int,
+    lead: Optional[str] = Query(None, description="Dérivation (par défaut MLII ou la première)"),
+    db: DBSession = Depends(get_db),
+):
+    meta = await get_record_meta_async(db, patient_id, ecg_id)
+    lead = resolve_lead(meta, lead)
 
-    if len(r_seg) < 3:
-        raise HTTPException(400, "Pas assez de R-peaks pour le calcul HRV")
+    version = analysis.artifact_version("overview")
+    etag = http_cache.make_etag(
+        "overview", meta.content_hash, meta.fs, patient_id, ecg_id, lead, OVERVIEW_POINTS, version
+    )
+    control = http_cache.cache_control(request, meta.content_hash, version)
+    if (cached := http_cache.not_modified(request, etag, control)) is not None:
+        return cached
 
-    r_peaks = np.column_stack((r_times_seg, r_ampl_seg)).tolist()
+    # Indices précalculés (cache disque), puis lecture des seuls points retenus
+    kept = get_overview(meta, lead)
+    ecg_values = read_signal(meta, lead, mmap=True)
+    ecg_data = np.column_stack((kept / meta.fs, np.asarray(ecg_values[kept], dtype=np.float64)))
 
-    rr_int = np.diff(r_times_seg)
-    rr_ts = r_times_seg[1:]
-    rr_seg = [
-        [float(t), float(i)] for t, i in zip(rr_ts, rr_int)
-    ]
-
-    # HRV sur le segment
-    hrv_time = nk.hrv_time(r_seg, sampling_rate=FS, show=False)
-    hrv_freq = nk.hrv_frequency(r_seg, sampling_rate=FS, show=False, normalize=False)
-    hrv_nl = nk.hrv_nonlinear(r_seg, sampling_rate=FS, show=False)
-
-    metrics = {
-        "time_domain": {c: float(hrv_time[c].iloc[0]) for c in hrv_time.columns},
-        "frequency_domain": {c: float(hrv_freq[c].iloc[0]) for c in hrv_freq.columns},
-        "non_linear_domain": {c: float(hrv_nl[c].iloc[0]) for c in hrv_nl.columns},
+    result = {
+        "patient_id": patient_id,
+        "ecg_id": ecg_id,
+        "lead": lead,
+        "sampling_rate": meta.fs,
+        "duration": meta.duration,
+        "points": len(kept),
+        "ecg_data": ecg_data,
     }
+    return http_cache.respond(request, result, etag, control)
+
+# ------------------------------------------------------------------
+#  CARACTÉRISTIQUES morphologiques des battements ------------------
+# ------------------------------------------------------------------
+@app.get(
+    "/api/{patient_id}/{ecg_id}/beats/features",
+    summary="QRS, amplitudes R/Q/S, RR, niveau ST de chaque battement (filtrables)"
+)
+async def get_beat_features(
+    request: Request,
+    patient_id: int,
+    ecg_id: int,
+    t0: float = Query(0, ge=0, description="Début de la plage (s)"),
+    t1: Optional[float] = Query(None, gt=0, description="Fin de la plage (s, par défaut la fin)"),
+    label: Optional[str] = Query(None, description="Classe de battement (libellé de l'analyse)"),
+    lead: Optional[str] = Query(None, description="Dérivation (par défaut MLII ou la première)"),
+    db: DBSession = Depends(get_db),
+):
+    meta = refresh_analysis_meta(db, await get_record_meta_async(db, patient_id, ecg_id))
+    lead = resolve_lead(meta, lead)
+    if t1 is not None:
+        t1 = check_window(meta, t0, t1)
+    if label is not None and label not in analysis.BEAT_LABELS.values():
+        raise HTTPException(422, f"Classe inconnue : {label} ({', '.join(analysis.BEAT_LABELS.values())})")
+
+    # Les classes viennent de l'analyse : revalidation quand elle change
+    etag = http_cache.make_etag(
+        "morphology", meta.content_hash, meta.fs, patient_id, ecg_id, lead, t0, t1, label,
+        analysis.artifact_version("morphology"), analysis_etag(meta, lead, analysis_path_for(meta, lead)),
+    )
+    if (cached := http_cache.not_modified(request, etag, http_cache.REVALIDATE)) is not None:
+        return cached
+
+    # Extraction (signal entier au premier appel) hors de la boucle d'événements
+    table = await run_in_threadpool(get_morphology, meta, lead)
+    labels = await run_in_threadpool(beat_labels, meta, lead, table["sample"])
+    if label is not None and labels is None:
+        raise HTTPException(404, "Aucune analyse : classes des battements inconnues")
+
+    mask = table["t"] >= t0
+    if t1 is not None:
+        mask &= table["t"] <= t1
+    if label is not None:
+        mask &= labels == label
+    features = {column: values[mask] for column, values in table.items()}
+    if labels is not None:
+        features["label"] = labels[mask]
 
     result = {
         "patient_id": patient_id,
         "ecg_id": ecg_id,
-        "sampling_rate": FS,
+        "lead": lead,
+        "sampling_rate": meta.fs,
         "t0": t0,
         "t1": t1,
-        "ecg_data": ecg_data,
-        "r_peaks": r_peaks,
-        "rr_intervals": rr_seg,
-        "metrics": metrics,
-        "segment_length": t1 - t0,
+        "label": label,
+        "n_beats": int(mask.sum()),
+        "columns": list(features),
+        "features": features,
     }
-    return JSONResponse(content=jsonable_encoder(sanitize(result)))
+    return http_cache.respond(request, result, etag, http_cache.REVALIDATE)
 
 # ------------------------------------------------------------------
 #  EXTRACTION d'un battement spécifique ----------------------------
 # ------------------------------------------------------------------
+def extract_beat(meta: RecordMeta, lead: str, r: int, pre: float, post: float) -> np.ndarray:
+    """Battement nettoyé autour du pic R d'index `r` : colonnes temps relatif (s), amplitude"""
+    FS = meta.fs
+
+    # Lecture et nettoyage de la seule fenêtre du battement, avec une marge
+    # pour le régime transitoire du filtre (écart < 1e-3 avec le signal entier)
+    values = read_signal(meta, lead, mmap=True)
+    i0 = max(r - int((pre + BEAT_CLEAN_MARGIN) * FS), 0)
+    i1 = min(r + int((post + BEAT_CLEAN_MARGIN) * FS) + 1, len(values))
+    with metrics.stage("clean", ecg_id=meta.ecg_id, n_samples=i1 - i0):
+        clean = nk.ecg_clean(np.asarray(values[i0:i1], dtype=np.float64), sampling_rate=FS)
+
+    # Création de l'epoch autour du seul R-peak demandé
+    with metrics.stage("epoching", r=r):
+        epochs = nk.epochs_create(
+            clean, events=[r - i0], sampling_rate=FS,
+            epochs_start=-pre, epochs_end=post,
+            baseline_correction=False
+        )
+
+    key = list(epochs.keys())[0]
+    epoch_df = epochs[key]
+
+    return np.column_stack((
+        epoch_df.index.values,       # temps relatifs (s)
+        epoch_df["Signal"].values    # amplitude
+    ))
+
 @app.get(
     "/api/{patient_id}/{ecg_id}/beat",
     summary="Extrait un battement autour du R-peak choisi"
 )
 async def get_beat(
+    request: Request,
     patient_id: int,
     ecg_id: int,
     beat_index: int = Query(..., ge=0, description="Index du R-peak voulu"),
     pre: float = Query(0.2, gt=0, description="Fenêtre avant le pic (s)"),
     post: float = Query(0.4, gt=0, description="Fenêtre après le pic (s)"),
+    lead: Optional[str] = Query(None, description="Dérivation (par défaut MLII ou la première)"),
     db: DBSession = Depends(get_db),
 ):
     # Vérifier appartenance ECG ↔ patient
-    record = (
-        db.query(ECGRecord)
-        .filter(ECGRecord.id == ecg_id, ECGRecord.patient_id == patient_id)
-        .first()
+    meta = await get_record_meta_async(db, patient_id, ecg_id)
+    lead = resolve_lead(meta, lead)
+
+    version = analysis.artifact_version("rpeaks")
+    # Pics R et nettoyage : la version des pics couvre NeuroKit et la méthode
+    etag = http_cache.make_etag(
+        "beat", meta.content_hash, meta.fs, patient_id, ecg_id, lead, beat_index, pre, post, version,
+        BEAT_CLEAN_MARGIN,
     )
-    if record is None:
-        raise HTTPException(404, f"ECG {ecg_id} introuvable pour le patient {patient_id}")
-
-    FS = record.frequence_hz
-    path = Path(record.fichier_csv)
-    if not path.exists():
-        raise HTTPException(404, "Fichier CSV introuvable sur le disque")
-
-    # Lecture signal
-    df = pd.read_csv(path)
-    if "MLII" not in df.columns:
-        raise HTTPException(400, "La dérivation 'MLII' n'existe pas dans ce fichier")
+    control = http_cache.cache_control(request, meta.content_hash, version)
+    if (cached := http_cache.not_modified(request, etag, control)) is not None:
+        return cached
 
-    values = df["MLII"]
-    clean = nk.ecg_clean(values, sampling_rate=FS)
-
-    # Détection R-peaks
-    _, info = nk.ecg_peaks(clean, sampling_rate=FS, method="neurokit")
-    r_idx = np.asarray(info["ECG_R_Peaks"], dtype=int)
+    # R-peaks (cache disque)
+    r_idx = get_r_peaks(meta, lead)
 
     if beat_index >= len(r_idx):
         raise HTTPException(422, "beat_index trop élevé pour cet enregistrement")
 
-    # Création de l'epoch autour du R-peak demandé
-    epochs = nk.epochs_create(
-        clean, events=r_idx, sampling_rate=FS,
-        epochs_start=-pre, epochs_end=post,
-        baseline_correction=False
+    beat = window_result(
+        "beat", meta, lead, {"beat_index": beat_index, "pre": pre, "post": post, "version": version},
+        lambda: extract_beat(meta, lead, int(r_idx[beat_index]), pre, post),
     )
 
-    key = list(epochs.keys())[beat_index]
-    epoch_df = epochs[key]
-
-    beat = np.column_stack((
-        epoch_df.index.values,       # temps relatifs (s)
-        epoch_df["Signal"].values    # amplitude
-    )).tolist()
-
     result = {
         "patient_id": patient_id,
         "ecg_id": ecg_id,
         "beat_index": beat_index,
+        "lead": lead,
         "pre": pre,
         "post": post,
-        "r_time": float(r_idx[beat_index] / FS),
+        "r_time": float(r_idx[beat_index] / meta.fs),
         "beat": beat,
     }
-    return JSONResponse(content=jsonable_encoder(sanitize(result)))
+    return http_cache.respond(request, result, etag, control)
+
+# ------------------------------------------------------------------
+#  LECTURE EN FLUX (WebSocket) -------------------------------------
+# ------------------------------------------------------------------
+def close_reason(text) -> str:
+    """Motif de fermeture WebSocket, limité à 123 octets UTF-8 par le protocole"""
+    return str(text).encode("utf-8")[:123].decode("utf-8", "ignore")
+
+@app.websocket("/api/{patient_id}/{ecg_id}/stream")
+async def stream_ecg(
+    websocket: WebSocket,
+    patient_id: int,
+    ecg_id: int,
+    lead: Optional[str] = Query(None, description="Dérivation (par défaut MLII ou la première)"),
+    t0: float = Query(0, ge=0, description="Position de départ (s)"),
+    speed: float = Query(1.0, gt=0, le=playback.MAX_SPEED, description="Vitesse (1 = temps réel)"),
+    frame_ms: int = Query(100, ge=20, le=2000, description="Durée d'une trame (ms, temps réel)"),
+    window: int = Query(0, ge=0, description="Trames non acquittées max (0 = sans contrôle de flux)"),
+):
+    """Lecture de l'enregistrement en trames binaires ; protocole dans playback.py."""
+    # Session courte : la connexion peut durer toute la lecture
+    db = Session()
+    try:
+        meta = await get_record_meta_async(db, patient_id, ecg_id)
+        lead = resolve_lead(meta, lead)
+    except HTTPException as exc:
+        await websocket.close(code=1008, reason=close_reason(exc.detail))
+        return
+    finally:
+        db.close()
+
+    # Signal et pics R chargés avant d'accepter : une erreur ferme proprement la connexion
+    try:
+        values = read_signal(meta, lead, mmap=True)
+        r_idx = await run_in_threadpool(get_r_peaks, meta, lead)
+        labels = await run_in_threadpool(beat_labels, meta, lead, r_idx)
+    except ArtifactPending as exc:
+        # 1013 : réessayer plus tard, une fois les pics calculés par un worker
+        await websocket.close(code=1013, reason=f"Pics R en cours de calcul (tâche {exc.job['id']})")
+        return
+    except (HTTPException, OSError, ValueError) as exc:
+        # 1011 : fichier signal absent ou illisible
+        detail = exc.detail if isinstance(exc, HTTPException) else f"Signal illisible : {exc}"
+        await websocket.close(code=1011, reason=close_reason(detail))
+        return
+
+    session = playback.PlaybackSession(
+        values,
+        fs=meta.fs,
+        r_idx=r_idx,
+        labels=labels,
+        speed=speed,
+        frame_ms=frame_ms,
+        window=window,
+        position=int(t0 * meta.fs),
+    )
+    await websocket.accept()
+    await websocket.send_json(session.info(lead))
+    metrics.WEBSOCKET_SESSIONS.inc(kind="stream")
+    try:
+        await session.run(websocket)
+    finally:
+        metrics.WEBSOCKET_SESSIONS.dec(kind="stream")
+
+# ------------------------------------------------------------------
+#  IMPORT EN DIRECT (WebSocket) ------------------------------------
+# ------------------------------------------------------------------
+@app.websocket("/api/{patient_id}/live")
+async def live_ingest(
+    websocket: WebSocket,
+    patient_id: int,
+    fs: int = Query(..., gt=0, le=10_000, description="Fréquence d'échantillonnage (Hz)"),
+    leads: str = Query("MLII", description="Dérivations, séparées par des virgules"),
+    dtype: str = Query("<f4", description="Type des échantillons : <f4 ou <f8"),
+    location: str = Query("", description="Lieu de l'enregistrement"),
+):
+    """Enregistrement en direct par blocs binaires ; protocole dans live.py."""
+    lead_names = [l.strip() for l in leads.split(",") if l.strip()]
+    with Session() as db:
+        patient = db.get(Patient, patient_id)
+        if patient is None or not lead_names:
+            reason = f"Patient {patient_id} introuvable" if patient is None else "Aucune dérivation"
+            await websocket.close(code=1008, reason=reason)
+            return
+        target = UPLOAD_DIR / ingest.patient_folder(
+            patient.prenom, patient.nom, str(patient.date_naissance)
+        )
+        target.mkdir(exist_ok=True)
+    started = pd.Timestamp.now()
+    dest_path = ingest.unique_path(target / f"live_{started:%Y%m%d-%H%M%S}.csv")
+    try:
+        recording = live.LiveRecording(
+            signal_store.signal_base(dest_path), lead_names, fs, dtype,
+            csv_copy=dest_path if KEEP_ORIGINAL_CSV else None,
+            # Classification provisoire dans le processus web seulement en mode inline
+            classify=None if jobqueue.ENABLED else analysis.classify_beats,
+        )
+    except ValueError as exc:
+        await websocket.close(code=1008, reason=close_reason(exc))
+        return
+
+    # ECG enregistré une fois la connexion acceptée : un échec de la poignée
+    # de main ne laisse ni ligne orpheline ni fichiers
+    try:
+        await websocket.accept()
+        with Session() as db:
+            ecg = ECGRecord(
+                patient_id=patient_id,
+                fichier_csv=str(dest_path),
+                analyse_fichier_csv=None,
+                lieu=location.strip(),
+                frequence_hz=fs,
+                date_prise=started.date(),
+                nb_echantillons=0,
+                derivations=",".join(lead_names),
+                fichier_signal=str(recording.base),
+                en_direct=True,
+            )
+            db.add(ecg)
+            db.commit()
+            ecg_id = ecg.id
+            meta = REGISTRY.refresh(ecg)
+    except BaseException:
+        recording.abort()
+        raise
+
+    error = None
+    metrics.WEBSOCKET_SESSIONS.inc(kind="live")
+    try:
+        await websocket.send_json({"type": "started", "ecg_id": ecg_id, "lead": recording.lead})
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                await run_in_threadpool(recording.append, message["bytes"])
+                # Registre à jour : l'enregistrement se lit pendant qu'il grandit
+                meta.n_samples = recording.n_samples
+                meta.content_hash = f"live:{recording.n_samples}"
+                for event in await run_in_threadpool(recording.analyze):
+                    await websocket.send_json(event)
+            elif json.loads(message.get("text") or "{}").get("action") == "stop":
+                break
+    except WebSocketDisconnect:
+        pass
+    except Exception as exc:  # bloc invalide ou échec d'analyse : on garde ce qui est reçu
+        error = str(exc)
+    finally:
+        metrics.WEBSOCKET_SESSIONS.dec(kind="live")
+
+    # Fin : métadonnées complètes, comme pour un fichier importé
+    with Session() as db:
+        ecg = db.get(ECGRecord, ecg_id)
+        try:
+            info = await run_in_threadpool(recording.finish)
+        except ValueError:
+            recording.abort()
+            db.delete(ecg)
+            db.commit()
+            REGISTRY.invalidate(ecg_id)
+            info = None
+        else:
+            ecg.nb_echantillons = info["n_samples"]
+            ecg.en_direct = False
+            ecg.hash_contenu = info["sha256"]
+            ecg.format_csv = json.dumps(info["format"])
+            db.commit()
+            REGISTRY.publish(ecg)
+            precompute.enqueue(ecg_id)
+    try:
+        await websocket.send_json({
+            "type": "finished",
+            "ecg_id": ecg_id if info else None,
+            "n_samples": info["n_samples"] if info else 0,
+            "sha256": info["sha256"] if info else None,
+            "error": error,
+        })
+        await websocket.close()
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # client déjà parti
 
 @app.get("/api/{patient_id}/{ecg_id}/fs", response_model=int)
 def get_fs(patient_id: int, ecg_id: int, db: DBSession = Depends(get_db)) -> int:
-    record = (
-        db.query(ECGRecord)
-        .filter(ECGRecord.id == ecg_id, ECGRecord.patient_id == patient_id)
-        .first()
-    )
-    if record is None:
-        raise HTTPException(404, f"ECG {ecg_id} introuvable pour le patient {patient_id}")
+    return get_record_meta(db, patient_id, ecg_id).fs
 
-    return record.frequence_hz
+def is_referenced(db: DBSession, column, value: Optional[str], excluded_ids: list[int]) -> bool:
+    """Vrai si un autre ECG (hors `excluded_ids`) référence encore ce fichier."""
+    if not value:
+        return False
+    return db.query(ECGRecord.id).filter(
+        column == value, ECGRecord.id.notin_(excluded_ids)
+    ).first() is not None
+
+def delete_ecg_files(db: DBSession, record: ECGRecord, excluded_ids: list[int]):
+    """Supprime CSV, signal, artefacts et analyses d'un ECG, sauf ceux encore
+    partagés avec un autre ECG (déduplication par contenu)."""
+    if not is_referenced(db, ECGRecord.fichier_csv, record.fichier_csv, excluded_ids):
+        Path(record.fichier_csv).unlink(missing_ok=True)
+
+    if is_referenced(db, ECGRecord.fichier_signal, record.fichier_signal, excluded_ids):
+        return
+
+    # Signal binaire et artefacts
+    signal_store.delete_signal(record.fichier_signal, record.lead_names)
+
+    # Fichier d'analyse principal
+    if record.analyse_fichier_csv:
+        Path(record.analyse_fichier_csv).unlink(missing_ok=True)
+
+    # Analyses des autres dérivations
+    base = Path(record.fichier_signal or signal_store.signal_base(record.fichier_csv))
+    for lead in record.lead_names:
+        get_analysis_cache_path(base, lead).unlink(missing_ok=True)
 
 @app.delete("/api/{patient_id}/{ecg_id}")
 def delete_ecg(
@@ -488,23 +1485,12 @@ def delete_ecg(
     if record is None:
         raise HTTPException(404, f"ECG {ecg_id} introuvable pour le patient {patient_id}")
     
-    # Supprimer le fichier CSV
-    csv_path = Path(record.fichier_csv)
+    # Supprimer les fichiers (CSV, signal, analyses) qui ne sont plus partagés
     try:
-        if csv_path.exists():
-            csv_path.unlink()
-    except Exception as exc:
+        delete_ecg_files(db, record, [record.id])
+    except OSError:
         pass  # Log l'erreur si nécessaire
 
-    # Supprimer le fichier d'analyse s'il existe
-    if record.analyse_fichier_csv:
-        analysis_path = Path(record.analyse_fichier_csv)
-        try:
-            if analysis_path.exists():
-                analysis_path.unlink()
-        except Exception as exc:
-            pass  # Log l'erreur si nécessaire
-
     # Supprime l'ECG de la base
     try:
         db.delete(record)
@@ -512,6 +1498,7 @@ def delete_ecg(
     except SQLAlchemyError as exc:
         db.rollback()
         raise HTTPException(500, f"Erreur base de données : {exc}")
+    REGISTRY.invalidate(ecg_id)
 
     return JSONResponse({"status": "ok", "message": "ECG supprimé avec succès"})
 
@@ -526,30 +1513,28 @@ def delete_patient(
     if patient is None:
         raise HTTPException(404, f"Patient {patient_id} introuvable")
     
-    # Supprimer tous les fichiers ECG et d'analyse associés
+    # Supprimer tous les fichiers ECG et d'analyse qui ne sont pas partagés
+    # avec l'ECG d'un autre patient
+    ecg_ids = [ecg.id for ecg in patient.ecg_records]
     for ecg in patient.ecg_records:
-        # Supprimer le fichier CSV
-        csv_path = Path(ecg.fichier_csv)
         try:
-            if csv_path.exists():
-                csv_path.unlink()
-        except Exception:
+            delete_ecg_files(db, ecg, ecg_ids)
+        except OSError:
             pass  # Log l'erreur si nécessaire
 
-        # Supprimer le fichier d'analyse
-        if ecg.analyse_fichier_csv:
-            analysis_path = Path(ecg.analyse_fichier_csv)
-            try:
-                if analysis_path.exists():
-                    analysis_path.unlink()
-            except Exception:
-                pass  # Log l'erreur si nécessaire
-
-    # Supprimer le dossier patient
+    # Supprimer le dossier patient, sauf s'il contient encore des fichiers partagés
     try:
         folder = f"{patient.prenom}_{patient.nom}_{patient.date_naissance}"
         patient_dir = UPLOAD_DIR / folder
-        if patient_dir.exists() and patient_dir.is_dir():
+        prefix = str(patient_dir) + os.sep
+        shared = db.query(ECGRecord.id).filter(
+            ECGRecord.id.notin_(ecg_ids),
+            or_(
+                ECGRecord.fichier_signal.startswith(prefix, autoescape=True),
+                ECGRecord.fichier_csv.startswith(prefix, autoescape=True),
+            ),
+        ).first()
+        if shared is None and patient_dir.exists() and patient_dir.is_dir():
             shutil.rmtree(patient_dir)
     except Exception:
         pass  # Log l'erreur si nécessaire
@@ -561,140 +1546,258 @@ def delete_patient(
     except SQLAlchemyError as exc:
         db.rollback()
         raise HTTPException(500, f"Erreur base de données : {exc}")
+    REGISTRY.invalidate_patient(patient_id, ecg_ids)
 
     return JSONResponse({"status": "ok", "message": "Patient supprimé avec succès"})
 
+def run_classification(meta: RecordMeta, lead: str) -> dict:
+    """Classifie tous les battements d'une dérivation et enregistre l'analyse.
+
+    Ouvre sa propre session : appelée dans le pool de threads (single-flight),
+    elle ne doit pas partager celle de la requête, qui n'est pas thread-safe."""
+    ecg_data = read_signal(meta, lead)
+    
+    # Classification des battements (moteur partagé avec batch.py)
+    classification = analysis.classify_signal(ecg_data, meta.fs, meta.ecg_id)
+    
+    # Préparer le résultat
+    result = {
+        "patient_id": meta.patient_id,
+        "ecg_id": meta.ecg_id,
+        "lead": lead,
+        **classification,
+        "analysis_timestamp": pd.Timestamp.now().isoformat(),
+        "artifact_version": analysis.artifact_version("classification"),
+    }
+    
+    # Sauvegarder l'analyse
+    with Session() as db:
+        record = db.get(ECGRecord, meta.ecg_id)
+        save_analysis_to_db(db, record, result, None if lead == meta.default_lead else lead)
+    return result
+
 @app.post("/api/beat-classification/{patient_id}/{ecg_id}")
 async def classify_beat(
+    request: Request,
     patient_id: int,
     ecg_id: int,
     force_refresh: bool = Query(False, description="Force la régénération de l'analyse"),
+    lead: Optional[str] = Query(None, description="Dérivation (par défaut MLII ou la première)"),
     db: DBSession = Depends(get_db)
 ):
-    record = (
-        db.query(ECGRecord)
-        .filter(ECGRecord.id == ecg_id, ECGRecord.patient_id == patient_id)
-        .first()
-    )
-    if record is None:
-        raise HTTPException(404, f"ECG {ecg_id} introuvable pour le patient {patient_id}")
+    meta = refresh_analysis_meta(db, await get_record_meta_async(db, patient_id, ecg_id))
+    lead = resolve_lead(meta, lead)
     
-    # Vérifier si l'analyse existe déjà et si on ne force pas le refresh
+    # Vérifier si l'analyse existe déjà (par dérivation) et si on ne force pas le refresh
     if not force_refresh:
-        cached_result = load_analysis_from_db(record)
+        etag = analysis_etag(meta, lead, analysis_path_for(meta, lead))
+        if etag is not None:
+            cached = http_cache.not_modified(request, etag, http_cache.REVALIDATE)
+            if cached is not None:
+                return cached
+        cached_result = load_analysis_from_db(meta, lead)
+        metrics.cache_result("analysis", bool(cached_result))
         if cached_result:
-            return cached_result
-    
-    # Effectuer l'analyse
-    FS = record.frequence_hz
-    path = Path(record.fichier_csv)
-    
-    if not path.exists():
-        raise HTTPException(404, "Fichier CSV introuvable sur le disque")
-    
-    df = pd.read_csv(path)
-    if "MLII" not in df.columns:
-        raise HTTPException(400, "La dérivation 'MLII' n'existe pas dans ce fichier")
-    
-    values = df["MLII"]
-    ecg_data = values.values
-    
-    # Normalisation des données
-    scaler = MinMaxScaler()
-    ecg_data_normalized = scaler.fit_transform(ecg_data.reshape(-1, 1)).flatten()
-    
-    # Traitement ECG avec NeuroKit
-    signals, info = nk.ecg_process(ecg_data_normalized, sampling_rate=FS, method="neurokit")
-    cleaned_ecg = signals["ECG_Clean"]
-    epochs = nk.ecg_segment(cleaned_ecg, rpeaks=None, sampling_rate=FS, show=False)
-    
-    # Préparation des données pour le modèle
-    X_test = pd.concat([pd.Series(resample(epochs[i]['Signal'], 186)) for i in epochs.keys()], axis=1).T
-    X_test = np.expand_dims(X_test, axis=2)
-    
-    # Prédiction
-    predY = MODEL.predict(X_test)
-    y_pred = np.argmax(predY, axis=1)
-    
-    # Classification des battements
-    Label = {}
-    for j, i in enumerate(epochs.keys()):
-        classify_beat = int(y_pred[j])
-        cases = {
-            0: "Battement normal",
-            1: "Battement ectopique supraventriculaire",
-            2: "Battement ectopique ventriculaire",
-            3: "Battement de fusion",
-            4: "Battement inconnu",
-        }
-        Label[i] = cases.get(classify_beat, "Inconnu")
-    
-    # Préparer le résultat
-    result = {
-        "patient_id": patient_id,
-        "ecg_id": ecg_id,
-        "nombre_de_battements": len(epochs),
-        "beatsPrediction": [[str(i), Label[i]] for i in Label],
-        "analysis_timestamp": pd.Timestamp.now().isoformat()
-    }
-    
-    # Sauvegarder l'analyse
-    save_analysis_to_db(db, record, result)
+            return http_cache.respond(request, cached_result, etag, http_cache.REVALIDATE)
+
+    check_complete(meta)
+
+    # Mode file d'attente : calcul confié à un worker d'analyse, à suivre par /analysis/status
+    if jobqueue.ENABLED:
+        job = jobqueue.submit(
+            "classification", meta.ecg_id, None if lead == meta.default_lead else lead,
+            force=force_refresh, traceparent=tracing.inject(),
+        )
+        status_url = f"/api/{patient_id}/{ecg_id}/analysis/status?lead={lead}"
+        return JSONResponse(
+            {"patient_id": patient_id, "ecg_id": ecg_id, "lead": lead, "job": job, "status_url": status_url},
+            status_code=202, headers={"Location": status_url},
+        )
     
-    return result
+    # Effectuer et sauvegarder l'analyse, une seule fois pour les requêtes
+    # concurrentes (et le précalcul) : les suivantes reçoivent le même résultat
+    lookup = None if force_refresh else (lambda: load_analysis_from_db(meta, lead))
+    result = await singleflight.run_async(
+        ("classification", meta.storage_path, lead), lambda: run_classification(meta, lead), lookup
+    )
+
+    meta = await get_record_meta_async(db, patient_id, ecg_id)
+    etag = analysis_etag(meta, lead, analysis_path_for(meta, lead))
+    if etag is None:
+        return NumpyJSONResponse(result)
+    return http_cache.respond(request, result, etag, http_cache.REVALIDATE)
 
 @app.get("/api/{patient_id}/{ecg_id}/analysis")
 async def get_analysis(
+    request: Request,
     patient_id: int,
     ecg_id: int,
+    lead: Optional[str] = Query(None, description="Dérivation (par défaut MLII ou la première)"),
     db: DBSession = Depends(get_db)
 ):
     """Récupère l'analyse existante d'un ECG"""
-    record = (
-        db.query(ECGRecord)
-        .filter(ECGRecord.id == ecg_id, ECGRecord.patient_id == patient_id)
-        .first()
-    )
-    if record is None:
-        raise HTTPException(404, f"ECG {ecg_id} introuvable pour le patient {patient_id}")
+    meta = refresh_analysis_meta(db, await get_record_meta_async(db, patient_id, ecg_id))
+    lead = resolve_lead(meta, lead)
     
+    etag = analysis_etag(meta, lead, analysis_path_for(meta, lead))
+    if etag is not None:
+        cached = http_cache.not_modified(request, etag, http_cache.REVALIDATE)
+        if cached is not None:
+            return cached
+
     # Charger l'analyse depuis la base
-    analysis = load_analysis_from_db(record)
+    analysis = load_analysis_from_db(meta, lead)
     if analysis is None:
         raise HTTPException(404, "Aucune analyse trouvée pour cet ECG")
     
-    return analysis
+    return http_cache.respond(request, analysis, etag, http_cache.REVALIDATE)
 
 @app.get("/api/{patient_id}/{ecg_id}/analysis/status")
 async def get_analysis_status(
     patient_id: int,
     ecg_id: int,
+    lead: Optional[str] = Query(None, description="Dérivation (par défaut MLII ou la première)"),
     db: DBSession = Depends(get_db)
 ):
     """Vérifie si une analyse existe pour un ECG donné"""
-    record = (
-        db.query(ECGRecord)
-        .filter(ECGRecord.id == ecg_id, ECGRecord.patient_id == patient_id)
-        .first()
-    )
-    if record is None:
-        raise HTTPException(404, f"ECG {ecg_id} introuvable pour le patient {patient_id}")
+    meta = refresh_analysis_meta(db, await get_record_meta_async(db, patient_id, ecg_id))
+    lead = resolve_lead(meta, lead)
+    path = analysis_path_for(meta, lead)
     
-    has_analysis = record.analyse_fichier_csv is not None
-    analysis_path_exists = False
-    
-    if has_analysis:
-        analysis_path = Path(record.analyse_fichier_csv)
-        analysis_path_exists = analysis_path.exists()
+    analysis_path_exists = path is not None and Path(path).exists()
+    has_analysis = meta.analysis_path is not None if lead == meta.default_lead else analysis_path_exists
     
     return {
         "patient_id": patient_id,
         "ecg_id": ecg_id,
+        "lead": lead,
+        "leads": list(meta.leads),
         "has_analysis": has_analysis,
         "analysis_file_exists": analysis_path_exists,
-        "analysis_path": record.analyse_fichier_csv
+        "analysis_path": path,
+        "analysis_state": analysis_state(meta, lead),
+        "precompute": precompute.status(db.get(ECGRecord, ecg_id)),
+        "job": jobqueue.latest(ecg_id, None if lead == meta.default_lead else lead),
     }
 
+# ------------------------------------------------------------------
+#  Précalcul après l'import (voir precompute.py) --------------------
+# ------------------------------------------------------------------
+def analysis_state(meta: RecordMeta, lead: str) -> str:
+    """Analyse enregistrée d'une dérivation : current, stale (autre version) ou missing"""
+    try:
+        with open(analysis_path_for(meta, lead), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (TypeError, OSError, json.JSONDecodeError):
+        return "missing"
+    if isinstance(data, dict) and data.get("artifact_version") == analysis.artifact_version("classification"):
+        return "current"
+    return "stale"
+
+def artifact_states(meta: RecordMeta) -> dict[str, str]:
+    """État (current / stale / missing) de chaque artefact de la dérivation principale"""
+    lead = meta.default_lead
+    states = {
+        kind: signal_store.artifact_state(
+            meta.storage_path, lead, name, analysis.artifact_version(kind), suffix
+        )
+        for kind, name, suffix in (
+            ("rpeaks", "rpeaks", "npy"),
+            ("hrv", hrv_artifact(*default_window(meta)), "json"),
+            ("overview", "overview", "npy"),
+            ("morphology", "morphology", "npz"),
+        )
+    }
+    states["classification"] = analysis_state(meta, lead)
+    return states
+
+@precompute.step("signal")
+def precompute_signal(meta: RecordMeta):
+    if not signal_store.has_signal(meta.storage_path, meta.leads):
+        raise LookupError("Fichier signal introuvable sur le disque")
+
+@precompute.step("rpeaks", after=("signal",))
+def precompute_rpeaks(meta: RecordMeta):
+    get_r_peaks(meta, meta.default_lead)
+
+def default_window_hrv(meta: RecordMeta, lead: str):
+    """HRV de la fenêtre par défaut (artefact), à partir des pics R en cache"""
+    t0, t1 = default_window(meta)
+    r_idx = get_r_peaks(meta, lead)
+    r_seg = r_idx[peaks_in_window(r_idx, meta.fs, t0, t1)]
+    if len(r_seg) >= 3:
+        window_hrv(meta, lead, r_seg, t0, t1)
+
+@precompute.step("hrv", after=("rpeaks",))
+def precompute_hrv(meta: RecordMeta):
+    default_window_hrv(meta, meta.default_lead)
+
+@precompute.step("overview", after=("signal",))
+def precompute_overview(meta: RecordMeta):
+    get_overview(meta, meta.default_lead)
+
+@precompute.step("morphology", after=("rpeaks",))
+def precompute_morphology(meta: RecordMeta):
+    get_morphology(meta, meta.default_lead)
+
+@precompute.step("classification", after=("signal",))
+def precompute_classification(meta: RecordMeta):
+    # Analyse déjà présente (doublon) ou calculée par une requête concurrente : rien à faire
+    singleflight.run(
+        ("classification", meta.storage_path, meta.default_lead),
+        lambda: run_classification(meta, meta.default_lead), lambda: load_analysis_from_db(meta),
+    )
+
+precompute.resume()  # précalculs interrompus par un arrêt du serveur
+
+def job_meta(job: dict) -> RecordMeta:
+    """Métadonnées de l'ECG d'une tâche, relues : il a pu changer dans un autre processus"""
+    with Session() as db:
+        record = db.get(ECGRecord, job["ecg_id"])
+        if record is None:
+            raise LookupError(f"ECG {job['ecg_id']} introuvable")
+        return REGISTRY.refresh(record)
+
+@jobqueue.handler("classification")
+def classification_job(job: dict):
+    """Classification planifiée par l'API en mode file d'attente (exécutée par worker.py)"""
+    meta = job_meta(job)
+    lead = job["lead"] or meta.default_lead
+    lookup = None if job["force"] else (lambda: load_analysis_from_db(meta, lead))
+    singleflight.run(
+        ("classification", meta.storage_path, lead), lambda: run_classification(meta, lead), lookup
+    )
+
+def artifact_job(compute):
+    """Tâche qui calcule un artefact d'une dérivation (planifiée par `schedule_artifact`)"""
+    def run(job: dict):
+        meta = job_meta(job)
+        compute(meta, job["lead"] or meta.default_lead)
+    return run
+
+def window_job(compute):
+    """Tâche qui calcule un résultat sur une fenêtre (planifiée par `window_result`)"""
+    def run(job: dict):
+        meta = job_meta(job)
+        params = {k: v for k, v in job["params"].items() if k not in ("version", "content_hash")}
+        return compute(meta, job["lead"] or meta.default_lead, **params)
+    return run
+
+def segment_hrv(meta: RecordMeta, lead: str, t0: float, t1: float) -> dict:
+    r_idx = get_r_peaks(meta, lead)
+    return analysis.hrv_metrics(r_idx[peaks_in_window(r_idx, meta.fs, t0, t1)], meta.fs)
+
+def beat_job(meta: RecordMeta, lead: str, beat_index: int, pre: float, post: float) -> np.ndarray:
+    return extract_beat(meta, lead, int(get_r_peaks(meta, lead)[beat_index]), pre, post)
+
+for kind, compute in (
+    ("rpeaks", get_r_peaks), ("overview", get_overview), ("morphology", get_morphology),
+    ("hrv", default_window_hrv),
+):
+    jobqueue.handler(kind)(artifact_job(compute))
+jobqueue.handler("segment_hrv")(window_job(segment_hrv))
+jobqueue.handler("beat")(window_job(beat_job))
+
 # ------------------------------------------------------------------
 #  Analyse LLM -----------------------------------------------------
 # ------------------------------------------------------------------
@@ -714,18 +1817,27 @@ def nettoyer_rapport_hrv(texte: str) -> str:
 @app.post("/api/{patient_id}/{ecg_id}/llm_analysis")
 async def llm_analysis(patient_id: int, ecg_id: int, payload: dict):
     """Génère un compte rendu grâce au modèle Mistral 7B"""
-    metrics = payload.get("metrics")
+    hrv_metrics = payload.get("metrics")
     if not MISTRAL_API_KEY:
         raise HTTPException(503, "MISTRAL_API_KEY non configurée")
-    if metrics is None:
+    if hrv_metrics is None:
         raise HTTPException(422, "Champ 'metrics' manquant")
 
     try:
-        text = generate_llm_report(metrics)
+        with metrics.stage("llm", model=MODEL_NAME, ecg_id=ecg_id):
+            text = generate_llm_report(hrv_metrics)
     except Exception as exc:
         raise HTTPException(500, f"Erreur génération LLM : {exc}")
 
     return {"analysis": nettoyer_rapport_hrv(text)}
 
+# ------------------------------------------------------------------
+#  Supervision -----------------------------------------------------
+# ------------------------------------------------------------------
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Métriques au format texte Prometheus (voir metrics.py)"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # -----------------------------------------------------------------------------
 app.mount("/", StaticFiles(directory=".", html=True), name="static")
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""metrics.py
+
+Métriques du backend au format texte Prometheus (`GET /metrics`) et en-tête
+`Server-Timing` sur les réponses HTTP.
+
+* `ecg_http_request_duration_seconds{method, route, status}` : latence par
+  route (modèle de chemin, pas l'URL : cardinalité bornée) ;
+* `ecg_stage_duration_seconds{stage}` : durée des étapes du traitement
+  (chargement du signal, nettoyage, pics, HRV par domaine, epochs,
+  rééchantillonnage, prédiction, sérialisation, appel LLM…) ;
+* `ecg_cache_requests_total{cache, result}` : succès / échecs des caches
+  (registre, pics R, analyses, revalidations HTTP) ;
+* `ecg_model_batch_size` : battements par appel au modèle ;
+* jauges lues au moment de la collecte : requêtes en cours, file du pool de
+  threads, sessions WebSocket, mémoire résidente du processus.
+
+Les étapes chronométrées avec `stage()` pendant une requête sont aussi
+renvoyées dans `Server-Timing` (`load;dur=1.2, clean;dur=35.0, …`), visible
+dans l'onglet réseau du navigateur, et tracées (voir tracing.py).
+
+Implémentation volontairement minimale (pas de dépendance à
+`prometheus_client`) : quelques compteurs protégés par un verrou.
+"""
+from __future__ import annotations
+
+import contextvars
+import bisect
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+import anyio.to_thread
+
+import tracing
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BATCH_BUCKETS = (1, 8, 32, 128, 512, 1024, 2048, 4096, 8192)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_lock = threading.Lock()
+_metrics: list["_Metric"] = []
+
+# Étapes de la requête en cours : liste de (étape, secondes)
+_timings: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    items = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        items.append(extra)
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        with _lock:
+            _metrics.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} : étiquettes attendues {self.labelnames}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with _lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Jauge ; avec `collect` (→ {tuple d'étiquettes: valeur}), les valeurs sont
+    lues au moment de la collecte."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect: Optional[Callable[[], dict]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> list[str]:
+        if self.collect is not None:
+            try:
+                collected = self.collect()
+            except Exception:  # une jauge illisible ne doit pas casser la collecte
+                collected = {}
+            with _lock:
+                self._values.update(collected)
+        with _lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list[str]:
+        with _lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, inf)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render() -> str:
+    """Toutes les métriques au format texte Prometheus."""
+    with _lock:
+        metrics = list(_metrics)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.header())
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Métriques de l'application
+# ---------------------------------------------------------------------------
+def _rss_bytes() -> dict:
+    try:
+        with open("/proc/self/statm") as f:
+            return {(): int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")}
+    except (OSError, ValueError, IndexError):
+        # Sans /proc : pic de mémoire résidente (Kio sous Linux, octets sous macOS)
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {(): peak if sys.platform == "darwin" else peak * 1024}
+
+
+REQUEST_DURATION = Histogram(
+    "ecg_http_request_duration_seconds", "Durée des requêtes HTTP par route.",
+    ("method", "route", "status"),
+)
+REQUESTS_IN_PROGRESS = Gauge("ecg_http_requests_in_progress", "Requêtes HTTP en cours.")
+STAGE_DURATION = Histogram(
+    "ecg_stage_duration_seconds", "Durée des étapes du traitement ECG.", ("stage",)
+)
+CACHE_REQUESTS = Counter(
+    "ecg_cache_requests_total", "Consultations des caches (hit / miss).", ("cache", "result")
+)
+MODEL_BATCH_SIZE = Histogram(
+    "ecg_model_batch_size", "Battements par appel au modèle de classification.",
+    buckets=BATCH_BUCKETS,
+)
+WEBSOCKET_SESSIONS = Gauge("ecg_websocket_sessions", "Sessions WebSocket ouvertes.", ("kind",))
+PROCESS_RSS = Gauge("process_resident_memory_bytes", "Mémoire résidente du processus.", collect=_rss_bytes)
+
+
+def _threadpool() -> dict:
+    # Pool de threads d'AnyIO (endpoints synchrones, run_in_threadpool) ;
+    # lisible seulement depuis la boucle d'événements
+    stats = anyio.to_thread.current_default_thread_limiter().statistics()
+    return {("busy",): stats.borrowed_tokens, ("waiting",): stats.tasks_waiting,
+            ("limit",): stats.total_tokens}
+
+
+THREADPOOL = Gauge(
+    "ecg_threadpool_tasks", "Pool de threads : tâches en cours, en attente, limite.", ("state",),
+    collect=_threadpool,
+)
+
+
+def cache_result(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def stage(name: str, **attributes) -> Iterator[tracing.Span]:
+    """Chronomètre une étape : histogramme, Server-Timing de la requête en
+    cours et span de trace (attributs complétables via le span retourné)."""
+    start = time.perf_counter()
+    try:
+        with tracing.span(name, **attributes) as span:
+            yield span
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def start_request() -> list:
+    """Ouvre la liste des étapes de la requête courante (middleware)."""
+    timings: list = []
+    _timings.set(timings)
+    return timings
+
+
+def server_timing(timings: list, total: float) -> str:
+    """Valeur de l'en-tête Server-Timing : durées cumulées par étape, en ms."""
+    durations: dict[str, float] = {}
+    for name, elapsed in timings:
+        durations[name] = durations.get(name, 0.0) + elapsed
+    parts = [f"{name};dur={elapsed * 1e3:.1f}" for name, elapsed in durations.items()]
+    parts.append(f"total;dur={total * 1e3:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,137 @@
+"""morphology.py
+
+Caractéristiques morphologiques de tous les battements d'un enregistrement,
+calculées d'un bloc à partir du signal nettoyé et des pics R en cache :
+les fenêtres [R − PRE, R + POST] des battements forment une matrice
+(battements × échantillons, indexation du signal) sur laquelle chaque
+caractéristique est une opération NumPy par ligne — pas de boucle Python
+par battement ni d'appel à `nk.ecg_delineate`.  Les battements sont traités
+par blocs de `CHUNK` : la mémoire de travail (fenêtres, pente, enveloppe)
+reste bornée quelle que soit la durée de l'enregistrement (Holter de 24 h).
+
+Colonnes (une valeur par pic R ; amplitudes dans l'unité du signal) :
+
+* `sample`, `t` : position du pic R (échantillon, s) ;
+* `baseline` : ligne isoélectrique, médiane du segment PR
+  ([R − 120 ms, R − 80 ms]) ;
+* `r_amp`, `q_amp`, `s_amp` : maximum autour de R (± 30 ms), minimum
+  avant R (60 ms) et après R (80 ms), par rapport à la ligne de base ;
+* `qrs_onset`, `qrs_offset`, `qrs_width_ms` : début et fin du QRS, là où
+  l'enveloppe de pente (|dérivée| moyennée sur 20 ms) repasse sous 20 % de
+  son maximum dans le QRS, en remontant avant R / en avançant après R ;
+* `st_level` : niveau du segment ST (point J + 60 ms) par rapport à la
+  ligne de base ;
+* `rr_pre`, `rr_post` (s), `rr_ratio` (pre / post) : NaN aux extrémités ;
+* `complete` : fenêtre entièrement dans l'enregistrement (sinon complétée
+  par les valeurs du bord).
+
+Les paramètres (`PARAMS`) font partie de la version de l'artefact.
+"""
+from __future__ import annotations
+
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+
+PRE = 0.25             # s de signal avant R dans la fenêtre
+POST = 0.40            # s après R
+BASELINE = (-0.12, -0.08)
+R_SEARCH = 0.03        # ± s autour du pic R détecté
+Q_SEARCH = 0.06        # s avant R
+S_SEARCH = 0.08        # s après R
+ONSET_SEARCH = 0.15    # s avant R pour le début du QRS
+OFFSET_SEARCH = 0.20   # s après R pour la fin du QRS
+SLOPE_SMOOTH = 0.02    # s, lissage de l'enveloppe de pente
+SLOPE_THRESHOLD = 0.2  # fraction du maximum de l'enveloppe dans le QRS
+ST_OFFSET = 0.06       # s après le point J
+CHUNK = 4096           # battements traités d'un bloc
+
+PARAMS = {
+    "pre": PRE, "post": POST, "baseline": BASELINE, "r_search": R_SEARCH,
+    "q_search": Q_SEARCH, "s_search": S_SEARCH, "onset_search": ONSET_SEARCH,
+    "offset_search": OFFSET_SEARCH, "slope_smooth": SLOPE_SMOOTH,
+    "slope_threshold": SLOPE_THRESHOLD, "st_offset": ST_OFFSET,
+}
+COLUMNS = (
+    "sample", "t", "baseline", "r_amp", "q_amp", "s_amp", "qrs_onset", "qrs_offset",
+    "qrs_width_ms", "st_level", "rr_pre", "rr_post", "rr_ratio", "complete",
+)
+
+
+def beat_windows(clean: np.ndarray, r_idx: np.ndarray, fs: int) -> np.ndarray:
+    """Matrice des fenêtres [R − PRE, R + POST] (battements × échantillons),
+    complétées par les valeurs du bord du signal."""
+    offsets = np.arange(-round(PRE * fs), round(POST * fs) + 1)
+    index = np.clip(r_idx[:, None] + offsets, 0, len(clean) - 1)
+    return np.asarray(clean[index], dtype=np.float64)
+
+
+def _window_features(windows: np.ndarray, fs: int) -> dict[str, np.ndarray]:
+    """Caractéristiques tirées des fenêtres d'un bloc de battements."""
+    n = len(windows)
+    center = round(PRE * fs)  # colonne du pic R
+
+    def cols(start: float, end: float) -> slice:
+        return slice(center + round(start * fs), center + round(end * fs) + 1)
+
+    baseline = np.median(windows[:, cols(*BASELINE)], axis=1)
+    r_amp = windows[:, cols(-R_SEARCH, R_SEARCH)].max(axis=1) - baseline
+    q_amp = windows[:, cols(-Q_SEARCH, 0)].min(axis=1) - baseline
+    s_amp = windows[:, cols(0, S_SEARCH)].min(axis=1) - baseline
+
+    # Enveloppe de pente : faible sur les segments isoélectriques, forte dans le QRS
+    slope = np.abs(np.gradient(windows, axis=1))
+    envelope = uniform_filter1d(slope, max(round(SLOPE_SMOOTH * fs), 1), axis=1, mode="nearest")
+    peak = envelope[:, cols(-Q_SEARCH, S_SEARCH)].max(axis=1, keepdims=True)
+    flat = envelope < SLOPE_THRESHOLD * peak
+
+    # Début : premier échantillon plat en remontant depuis R ; fin : en avançant
+    lo, hi = center - round(ONSET_SEARCH * fs), center + round(OFFSET_SEARCH * fs)
+    before = flat[:, lo:center + 1][:, ::-1]
+    onset = np.where(before.any(axis=1), center - before.argmax(axis=1), lo)
+    after = flat[:, center:hi + 1]
+    offset = np.where(after.any(axis=1), center + after.argmax(axis=1), hi)
+
+    st_col = np.minimum(offset + round(ST_OFFSET * fs), windows.shape[1] - 1)
+    st_level = windows[np.arange(n), st_col] - baseline
+    return {
+        "baseline": baseline,
+        "r_amp": r_amp,
+        "q_amp": q_amp,
+        "s_amp": s_amp,
+        "onset": onset - center,
+        "offset": offset - center,
+        "st_level": st_level,
+    }
+
+
+def extract(clean: np.ndarray, r_idx: np.ndarray, fs: int) -> dict[str, np.ndarray]:
+    """Caractéristiques de tous les battements (colonnes `COLUMNS`)."""
+    r_idx = np.asarray(r_idx, dtype=np.int64)
+    n = len(r_idx)
+    blocks = [_window_features(beat_windows(clean, r_idx[i:i + CHUNK], fs), fs) for i in range(0, n, CHUNK)]
+    if not blocks:  # aucun pic : colonnes vides
+        blocks = [_window_features(beat_windows(clean, r_idx, fs), fs)]
+    feats = {key: np.concatenate([block[key] for block in blocks]) for key in blocks[0]}
+
+    rr = np.diff(r_idx) / fs
+    rr_pre = np.concatenate(([np.nan], rr)) if n else np.empty(0)
+    rr_post = np.concatenate((rr, [np.nan])) if n else np.empty(0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rr_ratio = rr_pre / rr_post
+
+    return {
+        "sample": r_idx,
+        "t": r_idx / fs,
+        "baseline": feats["baseline"],
+        "r_amp": feats["r_amp"],
+        "q_amp": feats["q_amp"],
+        "s_amp": feats["s_amp"],
+        "qrs_onset": r_idx + feats["onset"],
+        "qrs_offset": r_idx + feats["offset"],
+        "qrs_width_ms": (feats["offset"] - feats["onset"]) / fs * 1000,
+        "st_level": feats["st_level"],
+        "rr_pre": rr_pre,
+        "rr_post": rr_post,
+        "rr_ratio": rr_ratio,
+        "complete": (r_idx - round(PRE * fs) >= 0) & (r_idx + round(POST * fs) < len(clean)),
+    }
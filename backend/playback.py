@@ -0,0 +1,214 @@
+"""playback.py
+
+Lecture « temps réel » (ou accélérée) d'un enregistrement sur WebSocket :
+`/api/{patient_id}/{ecg_id}/stream`.  Une seule connexion remplace les
+appels répétés à `/segment` sur une fenêtre glissante.
+
+Serveur → client
+----------------
+* texte `{"type": "info", ...}` à l'ouverture : fs, dérivation, nombre
+  d'échantillons, format des trames ;
+* trames binaires : en-tête `FRAME_HEADER` (n° de trame uint32, premier
+  échantillon uint64, nombre d'échantillons uint32, little-endian) suivi des
+  échantillons en float32 ;
+* texte `{"type": "rpeaks", "seq", "peaks": [...]}` juste avant la trame qui
+  contient ces pics R (échantillon, temps, n° de battement, classe issue de
+  la dernière classification si elle existe, voir `main.beat_labels`) ;
+* texte `{"type": "state", ...}` après chaque commande, `{"type": "end"}`
+  en fin d'enregistrement (la lecture se met alors en pause).
+
+Refus (connexion fermée avant l'ouverture, motif en clair) : 1008 pour un
+ECG ou une dérivation inconnus, 1011 pour un fichier signal absent ou
+illisible, 1013 quand les pics R sont en cours de calcul (mode file
+d'attente, réessayer plus tard).
+
+Client → serveur (texte JSON)
+-----------------------------
+* `{"action": "pause"}`, `{"action": "resume"}` ;
+* `{"action": "seek", "t": 12.5}` (secondes) ;
+* `{"action": "speed", "value": 4}` ;
+* `{"action": "ack", "seq": n}` : avec `window > 0`, le serveur n'a jamais
+  plus de `window` trames non acquittées en vol (contrôle de flux).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import struct
+from typing import Optional
+
+import numpy as np
+from fastapi import WebSocket, WebSocketDisconnect
+
+FRAME_HEADER = struct.Struct("<IQI")
+FRAME_DTYPE = np.dtype("<f4")
+MAX_SPEED = 64.0
+
+
+class PlaybackSession:
+    """État d'une lecture : position, vitesse, pause et acquittements."""
+
+    def __init__(
+        self,
+        signal,
+        fs: int,
+        r_idx: np.ndarray,
+        labels: Optional[np.ndarray],
+        speed: float = 1.0,
+        frame_ms: int = 100,
+        window: int = 0,
+        position: int = 0,
+    ):
+        self.signal = signal
+        self.n_samples = len(signal)
+        self.fs = fs
+        self.r_idx = np.asarray(r_idx, dtype=np.int64)
+        self.labels = labels
+        self.speed = speed
+        self.frame_ms = frame_ms
+        self.window = window
+        self.position = min(max(position, 0), self.n_samples)
+        self.paused = False
+        self.closed = False
+        self.seq = 0      # prochaine trame
+        self.acked = -1   # dernière trame acquittée
+        self._wake = asyncio.Event()
+        self._reset = False
+        self._send_lock = asyncio.Lock()
+
+    # ------------------------------------------------------------------
+    def info(self, lead: str) -> dict:
+        return {
+            "type": "info",
+            "lead": lead,
+            "sampling_rate": self.fs,
+            "n_samples": self.n_samples,
+            "duration": self.n_samples / self.fs,
+            "position": self.position,
+            "speed": self.speed,
+            "frame_ms": self.frame_ms,
+            "window": self.window,
+            "frame_header": "<IQI (seq, premier échantillon, nombre)",
+            "dtype": FRAME_DTYPE.str,
+        }
+
+    def state(self) -> dict:
+        return {
+            "type": "state",
+            "paused": self.paused,
+            "position": self.position,
+            "t": self.position / self.fs,
+            "speed": self.speed,
+        }
+
+    async def _send_json(self, websocket: WebSocket, message: dict):
+        async with self._send_lock:
+            await websocket.send_text(json.dumps(message))
+
+    async def _send_frame(self, websocket: WebSocket, i0: int, i1: int):
+        lo, hi = np.searchsorted(self.r_idx, [i0, i1])
+        peaks = [
+            {
+                "sample": int(self.r_idx[k]),
+                "t": float(self.r_idx[k] / self.fs),
+                "beat_index": int(k),
+                "label": None if self.labels is None else self.labels[k],
+            }
+            for k in range(lo, hi)
+        ]
+        if peaks:
+            await self._send_json(websocket, {"type": "rpeaks", "seq": self.seq, "peaks": peaks})
+        samples = np.asarray(self.signal[i0:i1], dtype=FRAME_DTYPE)
+        async with self._send_lock:
+            await websocket.send_bytes(FRAME_HEADER.pack(self.seq, i0, i1 - i0) + samples.tobytes())
+        self.seq += 1
+
+    # ------------------------------------------------------------------
+    def _handle(self, message: dict) -> None:
+        action = message.get("action")
+        if action == "ack":
+            self.acked = max(self.acked, int(message["seq"]))
+            return
+        if action == "pause":
+            self.paused = True
+        elif action == "resume":
+            self.paused = self.position >= self.n_samples
+        elif action == "seek":
+            self.position = min(max(int(float(message["t"]) * self.fs), 0), self.n_samples)
+        elif action == "speed":
+            self.speed = min(max(float(message["value"]), 1.0 / MAX_SPEED), MAX_SPEED)
+        else:
+            raise ValueError(f"Action inconnue : {action}")
+        self._reset = True
+
+    async def _receive(self, websocket: WebSocket):
+        try:
+            while True:
+                raw = await websocket.receive_text()
+                try:
+                    message = json.loads(raw)
+                    self._handle(message)
+                except (ValueError, KeyError, TypeError) as exc:
+                    await self._send_json(websocket, {"type": "error", "detail": str(exc)})
+                    continue
+                if message.get("action") != "ack":
+                    await self._send_json(websocket, self.state())
+                self._wake.set()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.closed = True
+            self._wake.set()
+
+    def _blocked(self) -> bool:
+        in_flight = self.seq - (self.acked + 1)
+        return (
+            self.paused
+            or self.position >= self.n_samples
+            or (self.window > 0 and in_flight >= self.window)
+        )
+
+    async def _wait(self, timeout: Optional[float] = None):
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, websocket: WebSocket):
+        """Envoie les trames au rythme demandé jusqu'à la déconnexion du client."""
+        receiver = asyncio.create_task(self._receive(websocket))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        try:
+            while not self.closed:
+                if self._reset:
+                    self._reset = False
+                    deadline = loop.time()
+                if self._blocked():
+                    await self._wait()
+                    deadline = loop.time()
+                    continue
+
+                interval = self.frame_ms / 1000
+                count = max(1, round(self.fs * interval * self.speed))
+                i0 = self.position
+                i1 = min(i0 + count, self.n_samples)
+                await self._send_frame(websocket, i0, i1)
+                self.position = i1
+                if i1 >= self.n_samples:
+                    self.paused = True
+                    await self._send_json(websocket, {"type": "end", "seq": self.seq - 1})
+
+                # Attente jusqu'à la trame suivante ; un acquittement réveille
+                # la boucle sans avancer l'horloge, une commande la recale
+                deadline += interval
+                while not self.closed and not self._reset:
+                    delay = deadline - loop.time()
+                    if delay <= 0:
+                        break
+                    await self._wait(delay)
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # client parti pendant un envoi
+        finally:
+            receiver.cancel()
@@ -0,0 +1,186 @@
+"""precompute.py
+
+Précalcul en arrière-plan après l'import : la première vue d'un ECG trouve
+ses données prêtes au lieu de payer conversion, nettoyage, pics R, HRV et
+classification sur la requête de l'utilisateur.
+
+Les étapes forment un graphe de dépendances, déclaré par l'application
+(main.py) avec le décorateur `step` :
+
+    @precompute.step("hrv", after=("rpeaks",))
+    def precompute_hrv(meta): ...
+
+`enqueue(ecg_id)` (après le commit de l'import) planifie toutes les étapes
+de l'ECG dans l'ordre topologique, dans un pool de `ECG_PRECOMPUTE_WORKERS`
+threads (1 par défaut : le précalcul ne doit pas affamer les requêtes).
+Ce sont des threads et non des processus : la classification utilise le
+modèle déjà chargé par l'application.  Une étape dont une dépendance a
+échoué est marquée `skipped`.
+
+L'état de chaque étape (`pending`, `running`, `ready`, `error`,
+`skipped`, avec sa durée ou son erreur) est enregistré sur l'ECG
+(colonne `precalcul`, JSON) et lisible par `status()`.  Au démarrage,
+`resume()` replanifie les ECG dont le précalcul a été interrompu.
+
+En mode file d'attente (`ECG_ANALYSIS_MODE=queue`, voir jobqueue.py),
+`enqueue` planifie une tâche `precompute` exécutée par un worker
+d'analyse (`python worker.py`) au lieu du pool de threads.
+
+`ECG_PRECOMPUTE=0` désactive le précalcul (les données sont alors
+calculées à la première vue, comme avant).
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from graphlib import TopologicalSorter
+from typing import Callable, Optional
+
+from sqlalchemy import select
+
+import jobqueue
+import metrics
+import tracing
+from ecg_database import ECGRecord, Session
+from registry import REGISTRY, RecordMeta
+
+ENABLED = os.environ.get("ECG_PRECOMPUTE", "1") != "0"
+WORKERS = int(os.environ.get("ECG_PRECOMPUTE_WORKERS", "1"))
+UNFINISHED = ("pending", "running")
+
+_steps: dict[str, tuple[Callable[[RecordMeta], None], tuple[str, ...]]] = {}
+_lock = threading.Lock()
+_queued: set[int] = set()
+_pool: Optional[ThreadPoolExecutor] = None
+
+QUEUE = metrics.Gauge(
+    "ecg_precompute_queue", "ECG en attente ou en cours de précalcul.",
+    collect=lambda: {(): len(_queued)},
+)
+
+
+def step(name: str, after: tuple[str, ...] = ()):
+    """Déclare une étape `fonction(meta)` exécutée après les étapes `after`."""
+    def register(fn: Callable[[RecordMeta], None]):
+        _steps[name] = (fn, tuple(after))
+        return fn
+    return register
+
+
+def order() -> list[str]:
+    return list(TopologicalSorter({name: deps for name, (_, deps) in _steps.items()}).static_order())
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="precompute")
+    return _pool
+
+
+def _parse(raw: Optional[str]) -> dict:
+    try:
+        return json.loads(raw or "{}")
+    except json.JSONDecodeError:
+        return {}
+
+
+def _update(ecg_id: int, **states: dict) -> None:
+    with _lock, Session() as db:
+        record = db.get(ECGRecord, ecg_id)
+        if record is None:
+            return
+        data = _parse(record.precalcul)
+        data.update(states)
+        record.precalcul = json.dumps(data)
+        db.commit()
+
+
+def status(record: ECGRecord) -> dict:
+    """État des étapes d'un ECG (vide s'il n'a jamais été précalculé)."""
+    return _parse(record.precalcul)
+
+
+def enqueue(ecg_id: int) -> bool:
+    """Planifie le précalcul d'un ECG (sans effet s'il est déjà planifié)."""
+    if not ENABLED or not _steps:
+        return False
+    if jobqueue.ENABLED:
+        # Exécuté par un worker d'analyse ; une tâche déjà en attente est réutilisée
+        job = jobqueue.submit("precompute", ecg_id, traceparent=tracing.inject())
+        if job["state"] == "queued":
+            _update(ecg_id, **{name: {"state": "pending"} for name in order()})
+        return True
+    with _lock:
+        if ecg_id in _queued:
+            return False
+        _queued.add(ecg_id)
+    _update(ecg_id, **{name: {"state": "pending"} for name in order()})
+    _get_pool().submit(_run, ecg_id, tracing.inject())
+    return True
+
+
+def _run(ecg_id: int, traceparent: Optional[str]) -> None:
+    try:
+        with tracing.span("precompute", traceparent=traceparent, ecg_id=ecg_id):
+            with Session() as db:
+                meta = REGISTRY.load(db, ecg_id)
+            if meta is None:
+                return  # supprimé entre-temps
+            failed: set[str] = set()
+            for name in order():
+                fn, deps = _steps[name]
+                if failed.intersection(deps):
+                    failed.add(name)
+                    _update(ecg_id, **{name: {"state": "skipped"}})
+                    continue
+                _update(ecg_id, **{name: {"state": "running"}})
+                start = time.perf_counter()
+                try:
+                    with metrics.stage(f"precompute_{name}", ecg_id=ecg_id):
+                        fn(REGISTRY.get(ecg_id) or meta)
+                except Exception as exc:
+                    failed.add(name)
+                    _update(ecg_id, **{name: {
+                        "state": "error", "error": f"{type(exc).__name__}: {exc}",
+                    }})
+                    continue
+                _update(ecg_id, **{name: {
+                    "state": "ready", "duration": round(time.perf_counter() - start, 3),
+                }})
+    finally:
+        with _lock:
+            _queued.discard(ecg_id)
+
+
+@jobqueue.handler("precompute")
+def precompute_job(job: dict) -> None:
+    # Registre du worker relu : l'ECG a pu changer dans un autre processus
+    with Session() as db:
+        record = db.get(ECGRecord, job["ecg_id"])
+        if record is not None:
+            REGISTRY.refresh(record)
+    with _lock:
+        _queued.add(job["ecg_id"])
+    # Span enfant de la tâche, elle-même rattachée à la requête d'import
+    _run(job["ecg_id"], tracing.inject() or job["traceparent"])
+
+
+def resume() -> int:
+    """Replanifie les ECG dont le précalcul n'est pas terminé (arrêt du serveur)."""
+    if not ENABLED or jobqueue.ENABLED:  # la file d'attente est déjà durable
+        return 0
+    with Session() as db:
+        rows = db.execute(
+            select(ECGRecord.id, ECGRecord.precalcul).where(ECGRecord.precalcul.isnot(None))
+        ).all()
+    pending = [
+        ecg_id for ecg_id, raw in rows
+        if any(s.get("state") in UNFINISHED for s in _parse(raw).values())
+    ]
+    for ecg_id in pending:
+        enqueue(ecg_id)
+    return len(pending)
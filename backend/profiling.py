@@ -0,0 +1,168 @@
+"""profiling.py
+
+Profilage à la demande d'une requête, pour reproduire en production la
+lenteur d'un enregistrement précis (fichier bruité qui fait ramper
+`ecg_peaks`…).
+
+Activation
+----------
+* `ECG_PROFILING=1` active le mode ; sinon le middleware n'est même pas
+  installé (aucun surcoût) et les endpoints de consultation répondent 404 ;
+* une requête est profilée si elle porte l'en-tête `X-Profile: 1` ou le
+  paramètre `?profile=1` ; avec `ECG_PROFILE_TOKEN`, la valeur doit être ce
+  jeton plutôt que `1`.
+
+Profil
+------
+Un thread échantillonne toutes les `ECG_PROFILE_INTERVAL` secondes (1 ms par
+défaut) les piles de tous les threads (`sys._current_frames`), en ignorant
+ceux qui attendent (pool de threads inactif, boucle d'événements en
+`select`).  Le résultat est au format « folded stacks »
+(`thread;module.fonction;… n`), lu par flamegraph.pl, speedscope ou
+inferno.  Les requêtes concurrentes apparaissent aussi dans le profil :
+chaque pile est préfixée par le nom de son thread.
+
+Chaque profil est enregistré dans `ECG_PROFILE_DIR` (`<id>.folded` +
+`<id>.json` : route, méthode, paramètres, patient / ECG, statut, durée,
+nombre d'échantillons) ; seuls les `ECG_PROFILE_KEEP` plus récents sont
+conservés.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Request
+
+ENABLED = os.environ.get("ECG_PROFILING", "0") == "1"
+TOKEN = os.environ.get("ECG_PROFILE_TOKEN") or None
+PROFILE_DIR = Path(os.environ.get("ECG_PROFILE_DIR", "profiles"))
+INTERVAL = float(os.environ.get("ECG_PROFILE_INTERVAL", "0.001"))
+KEEP = int(os.environ.get("ECG_PROFILE_KEEP", "50"))
+
+PROFILE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$")
+
+# Feuilles de pile d'un thread qui attend : ignorées
+_IDLE = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+}
+
+
+def requested(request: Request) -> bool:
+    """La requête demande-t-elle un profil (et y est-elle autorisée) ?"""
+    value = request.headers.get("x-profile") or request.query_params.get("profile")
+    if not value:
+        return False
+    return value == TOKEN if TOKEN else value == "1"
+
+
+def _frame_label(frame) -> str:
+    # Sans numéro de ligne : les appels d'une même fonction se regroupent
+    code = frame.f_code
+    module = frame.f_globals.get("__name__") or Path(code.co_filename).stem
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class SamplingProfiler:
+    """Échantillonneur de piles de tous les threads, dans un thread dédié."""
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if (Path(code.co_filename).name, code.co_name) in _IDLE:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def save(profiler: SamplingProfiler, request: Request, status: int, duration: float) -> dict:
+    """Enregistre le profil et ses métadonnées ; retourne les métadonnées."""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    route = request.scope.get("route")
+    path_params = request.scope.get("path_params") or {}
+    meta = {
+        "id": profile_id,
+        "created": time.time(),
+        "method": request.method,
+        "route": getattr(route, "path", None),
+        "path": request.url.path,
+        "params": {k: v for k, v in request.query_params.items() if k != "profile"},
+        "patient_id": path_params.get("patient_id"),
+        "ecg_id": path_params.get("ecg_id"),
+        "status": status,
+        "duration": duration,
+        "interval": profiler.interval,
+        "samples": profiler.samples,
+    }
+    (PROFILE_DIR / f"{profile_id}.folded").write_text(profiler.folded(), encoding="utf-8")
+    (PROFILE_DIR / f"{profile_id}.json").write_text(json.dumps(meta), encoding="utf-8")
+    _prune()
+    return meta
+
+
+def _prune() -> None:
+    for meta_path in sorted(PROFILE_DIR.glob("*.json"))[:-KEEP or None]:
+        meta_path.unlink(missing_ok=True)
+        meta_path.with_suffix(".folded").unlink(missing_ok=True)
+
+
+def list_profiles(limit: int = 50) -> list[dict]:
+    """Métadonnées des profils, du plus récent au plus ancien."""
+    if not PROFILE_DIR.is_dir():
+        return []
+    profiles = []
+    for meta_path in sorted(PROFILE_DIR.glob("*.json"), reverse=True)[:limit]:
+        try:
+            profiles.append(json.loads(meta_path.read_text(encoding="utf-8")))
+        except (OSError, json.JSONDecodeError):
+            continue
+    return profiles
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """Fichier `.folded` d'un profil (None si l'id est invalide ou inconnu)."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = PROFILE_DIR / f"{profile_id}.folded"
+    return path if path.exists() else None
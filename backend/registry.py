@@ -0,0 +1,206 @@
+"""registry.py
+
+Registre en mémoire des métadonnées d'enregistrements ECG.
+
+Chaque entrée résume un `ECGRecord` (patient propriétaire, fréquence, nombre
+d'échantillons, durée, chemin de stockage, dérivations, empreinte du contenu)
+afin que les endpoints puissent vérifier l'appartenance et les bornes
+temporelles sans requête SQL ni lecture du fichier.
+
+Cycle de vie
+------------
+* rempli à l'import (`put`) ou, à défaut, au premier accès (`load`) ;
+* rafraîchi après chaque écriture (`publish`) ;
+* invalidé à la suppression (`invalidate`, `invalidate_patient`).
+
+Plusieurs processus
+-------------------
+Chaque processus (workers uvicorn, workers d'analyse) a son propre
+registre.  Une écriture (`publish`) ou une suppression d'un ECG remplace
+son fichier témoin (`<ECG_REGISTRY_STAMPS>/<ecg_id>`, par défaut
+`data_csv/.registry/`) ; chaque lecture d'une entrée compare l'inode et la
+date du témoin (un `stat`, sans SQL) à ceux vus au chargement et, s'ils ont
+changé, recharge cette seule entrée depuis la base.  `refresh` et `put` ne
+mettent à jour que la copie locale (relecture sans écriture).
+
+Les versions des artefacts dérivés ne sont pas suivies ici : elles sont
+portées par le nom des fichiers (`analysis.artifact_version`) et par les
+ETag des endpoints.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.orm import Session as DBSession
+
+import metrics
+import signal_store
+from ecg_database import ECGRecord
+from sniff import PREFERRED_LEAD
+
+# Un fichier témoin par ECG, remplacé à chaque écriture (voir « Plusieurs processus »)
+STAMP_DIR = Path(os.environ.get("ECG_REGISTRY_STAMPS", "data_csv/.registry"))
+
+
+@dataclass
+class RecordMeta:
+    ecg_id: int
+    patient_id: int
+    fs: int
+    n_samples: int
+    storage_path: str
+    leads: tuple[str, ...] = ()
+    analysis_path: Optional[str] = None
+    content_hash: Optional[str] = None
+    recording: bool = False  # import en direct en cours : signal partiel
+
+    @property
+    def duration(self) -> float:
+        """Durée de l'enregistrement en secondes."""
+        return self.n_samples / self.fs if self.fs else 0.0
+
+    @property
+    def default_lead(self) -> str:
+        """Dérivation analysée par défaut : MLII si présente, sinon la première."""
+        if PREFERRED_LEAD in self.leads or not self.leads:
+            return PREFERRED_LEAD
+        return self.leads[0]
+
+
+def meta_from_record(record: ECGRecord) -> RecordMeta:
+    leads = tuple(record.lead_names)
+    return RecordMeta(
+        ecg_id=record.id,
+        patient_id=record.patient_id,
+        fs=record.frequence_hz,
+        n_samples=record.nb_echantillons or 0,
+        storage_path=record.fichier_signal or str(signal_store.signal_base(record.fichier_csv)),
+        leads=leads,
+        analysis_path=record.analyse_fichier_csv,
+        content_hash=record.hash_contenu,
+        recording=bool(record.en_direct),
+    )
+
+
+def fill_signal_info(record: ECGRecord) -> bool:
+    """Convertit une fois le CSV d'un ancien enregistrement en signal binaire.
+
+    Complète `fichier_signal`, `nb_echantillons`, `derivations` et
+    `hash_contenu`. Retourne True si l'enregistrement a été modifié (à
+    committer par l'appelant).
+    """
+    if signal_store.has_signal(record.fichier_signal, record.lead_names):
+        return False
+    path = Path(record.fichier_csv)
+    if not path.exists():
+        return False
+    try:
+        info = signal_store.convert_csv(path)
+    except (ValueError, LookupError):
+        return False  # l'erreur sera renvoyée à la lecture du signal
+    record.fichier_signal = info["signal_base"]
+    record.nb_echantillons = info["n_samples"]
+    record.derivations = ",".join(info["leads"])
+    record.hash_contenu = info["sha256"]
+    record.format_csv = json.dumps(info["format"])
+    return True
+
+
+def _stamp(ecg_id: int) -> Optional[tuple[int, int]]:
+    try:
+        stat = (STAMP_DIR / str(ecg_id)).stat()
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _touch(ecg_id: int) -> Optional[tuple[int, int]]:
+    """Signale aux autres processus une écriture sur un ECG (nouveau fichier témoin)."""
+    try:
+        if STAMP_DIR.is_file():
+            STAMP_DIR.unlink()  # ancien témoin unique pour tout le registre
+        STAMP_DIR.mkdir(exist_ok=True)
+        with signal_store.atomic_open(STAMP_DIR / str(ecg_id), "w", encoding="ascii") as f:
+            f.write(uuid.uuid4().hex)
+    except OSError:
+        pass  # répertoire de données absent : un seul processus, rien à signaler
+    return _stamp(ecg_id)
+
+
+class RecordRegistry:
+    """Cache thread-safe `ecg_id → RecordMeta`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Entrée et témoin de l'ECG vu lors de son chargement
+        self._records: dict[int, tuple[RecordMeta, Optional[tuple[int, int]]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, ecg_id: int) -> Optional[RecordMeta]:
+        entry = self._records.get(ecg_id)
+        if entry is None:
+            return None
+        meta, stamp = entry
+        if _stamp(ecg_id) != stamp:
+            # Écrit ou supprimé par un autre processus depuis le chargement
+            with self._lock:
+                if self._records.get(ecg_id) is entry:
+                    del self._records[ecg_id]
+            return None
+        return meta
+
+    def put(self, meta: RecordMeta, stamp: Optional[tuple[int, int]] = None) -> RecordMeta:
+        with self._lock:
+            self._records[meta.ecg_id] = (meta, stamp)
+        return meta
+
+    def refresh(self, record: ECGRecord) -> RecordMeta:
+        """Recharge l'entrée à partir de l'objet ORM (copie locale seulement)."""
+        return self.put(meta_from_record(record), _stamp(record.id))
+
+    def publish(self, record: ECGRecord) -> RecordMeta:
+        """Après une écriture en base : met l'entrée à jour et prévient les autres processus."""
+        return self.put(meta_from_record(record), _touch(record.id))
+
+    def load(self, db: DBSession, ecg_id: int) -> Optional[RecordMeta]:
+        """Retourne l'entrée, en la chargeant depuis la base en cas d'absence.
+
+        Un ancien enregistrement est converti en signal binaire au passage
+        (`fill_signal_info`) : à appeler hors de la boucle d'événements.
+        """
+        meta = self.get(ecg_id)
+        metrics.cache_result("registry", meta is not None)
+        if meta is not None:
+            return meta
+        stamp = _stamp(ecg_id)  # avant la lecture : une écriture concurrente sera vue
+        record = db.get(ECGRecord, ecg_id)
+        if record is None:
+            return None
+        if fill_signal_info(record):
+            db.commit()
+            return self.publish(record)
+        return self.put(meta_from_record(record), stamp)
+
+    def invalidate(self, ecg_id: int) -> None:
+        _touch(ecg_id)
+        with self._lock:
+            self._records.pop(ecg_id, None)
+
+    def invalidate_patient(self, patient_id: int, ecg_ids: list[int]) -> None:
+        """Les autres processus ne connaissent les ECG du patient que par leur id."""
+        for ecg_id in ecg_ids:
+            _touch(ecg_id)
+        with self._lock:
+            for ecg_id in [k for k, (m, _) in self._records.items() if m.patient_id == patient_id]:
+                del self._records[ecg_id]
+
+
+REGISTRY = RecordRegistry()
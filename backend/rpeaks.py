@@ -0,0 +1,147 @@
+"""rpeaks.py
+
+Détection incrémentale des pics R, bloc par bloc, à état borné.
+
+Portage en flux de `nk.ecg_clean` + `nk.ecg_peaks(method="neurokit")` :
+
+1. passe-haut Butterworth 0,5 Hz d'ordre 5 — causal (`sosfilt`), son état
+   est conservé entre les blocs (le batch est à phase nulle, l'écart de
+   phase est négligeable dans la bande du QRS) ;
+2. filtre secteur : le `filtfilt` d'une moyenne mobile d'une période à
+   50 Hz est une convolution centrée par un noyau triangulaire ;
+3. gradient absolu lissé (boxcar 0,1 s) comparé à 1,5 × sa moyenne sur
+   0,75 s : les zones au-dessus du seuil sont les QRS ;
+4. dans chaque QRS assez long, le maximum local le plus proéminent est le
+   pic R, à plus de 0,3 s du précédent.
+
+Les étapes 2 et 3 sont des filtres centrés de support fini : elles sont
+recalculées sur un petit tampon (contexte + bloc) et on ne décide que
+jusqu'à `lookahead` échantillons de la fin, là où le résultat est
+identique au batch.  Le travail par bloc est O(bloc) et l'état borné
+(tampon de quelques centaines d'échantillons, état du passe-haut, zone QRS
+en cours, moyenne des longueurs de QRS).  Un pic est émis au plus tard
+`lookahead` échantillons après la fin de son QRS.
+
+Seule différence de fond avec le batch : la longueur minimale d'un QRS
+(`minlenweight` × longueur moyenne) utilise la moyenne des QRS déjà vus et
+non celle de tout l'enregistrement.
+"""
+from __future__ import annotations
+
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+from scipy.signal import butter, find_peaks, sosfilt, sosfilt_zi
+
+
+class StreamingRPeakDetector:
+    """`process(bloc)` retourne les index absolus des pics R confirmés."""
+
+    def __init__(
+        self,
+        fs: float,
+        smoothwindow: float = 0.1,
+        avgwindow: float = 0.75,
+        gradthreshweight: float = 1.5,
+        minlenweight: float = 0.4,
+        mindelay: float = 0.3,
+        powerline: float = 50,
+        max_qrs: float = 1.0,
+    ):
+        self.fs = fs
+        self.sos = butter(5, 0.5, btype="highpass", output="sos", fs=fs)
+        width = int(fs / powerline) if fs >= 100 else 2
+        box = np.ones(width) / width
+        self.powerline = np.convolve(box, box)  # filtfilt(moyenne mobile) = triangle
+        self.k_smooth = int(np.rint(smoothwindow * fs))
+        self.k_avg = int(np.rint(avgwindow * fs))
+        self.weight = gradthreshweight
+        self.minlenweight = minlenweight
+        self.mindelay = int(np.rint(mindelay * fs))
+        self.max_qrs = int(max_qrs * fs)
+        # Échantillons à droite nécessaires pour que les filtres centrés soient exacts
+        self.lookahead = len(self.powerline) // 2 + 1 + self.k_smooth // 2 + self.k_avg // 2 + 1
+        self.context = 2 * self.lookahead
+        self.reset()
+
+    def reset(self) -> None:
+        self.n_samples = 0
+        self._zi = None
+        self._buf = np.empty(0)
+        self._buf_start = 0      # index absolu du premier échantillon du tampon
+        self._settled = 0        # échantillons déjà évalués
+        self._prev_q = None      # état « dans un QRS » du dernier échantillon évalué
+        self._qrs_beg = None     # début du QRS en cours (absolu)
+        self._len_sum = 0
+        self._len_count = 0
+        self._last_peak = 0      # comme le batch, qui part de peaks = [0]
+
+    @property
+    def state_size(self) -> int:
+        """Taille du tampon conservé entre deux blocs (échantillons)."""
+        return len(self._buf)
+
+    def process(self, chunk: np.ndarray, final: bool = False) -> np.ndarray:
+        """Ajoute un bloc ; `final=True` évalue aussi la fin du signal."""
+        x = np.asarray(chunk, dtype=np.float64)
+        if len(x):
+            if self._zi is None:
+                self._zi = sosfilt_zi(self.sos) * x[0]
+            hp, self._zi = sosfilt(self.sos, x, zi=self._zi)
+            self._buf = np.concatenate((self._buf, hp))
+            self.n_samples += len(x)
+
+        bs = self._buf_start
+        hi = self.n_samples if final else self.n_samples - self.lookahead
+        if hi <= self._settled or len(self._buf) < 3:
+            return np.empty(0, dtype=np.int64)
+
+        clean = np.convolve(self._buf, self.powerline, mode="same")
+        smooth = uniform_filter1d(np.abs(np.gradient(clean)), self.k_smooth, mode="nearest")
+        avg = uniform_filter1d(smooth, self.k_avg, mode="nearest")
+        q = smooth[self._settled - bs:hi - bs] > self.weight * avg[self._settled - bs:hi - bs]
+
+        # Transitions : comme le batch, début = dernier échantillon hors QRS,
+        # fin = dernier échantillon dans le QRS ; une zone déjà ouverte au
+        # premier échantillon est ignorée
+        prev = np.empty_like(q)
+        prev[0] = q[0] if self._prev_q is None else self._prev_q
+        prev[1:] = q[:-1]
+        begs = np.flatnonzero(~prev & q) + self._settled - 1
+        ends = np.flatnonzero(prev & ~q) + self._settled - 1
+        events = sorted([(int(b), True) for b in begs] + [(int(e), False) for e in ends])
+
+        peaks = []
+        for pos, is_beg in events:
+            if is_beg:
+                self._qrs_beg = pos
+                continue
+            if self._qrs_beg is None:
+                continue
+            beg, end = self._qrs_beg, pos
+            self._qrs_beg = None
+            self._len_sum += end - beg
+            self._len_count += 1
+            if end - beg < self.minlenweight * self._len_sum / self._len_count:
+                continue
+            data = clean[beg - bs:end - bs]
+            locmax, props = find_peaks(data, prominence=(None, None))
+            if locmax.size:
+                peak = beg + int(locmax[np.argmax(props["prominences"])])
+                if peak - self._last_peak > self.mindelay:
+                    peaks.append(peak)
+                    self._last_peak = peak
+
+        self._prev_q = bool(q[-1])
+        self._settled = hi
+        # QRS anormalement long (artefact) : abandonné pour borner le tampon
+        if self._qrs_beg is not None and hi - self._qrs_beg > self.max_qrs:
+            self._qrs_beg = None
+        keep_from = (self._qrs_beg if self._qrs_beg is not None else hi) - self.context
+        if keep_from > bs:
+            self._buf = self._buf[keep_from - bs:]
+            self._buf_start = keep_from
+        return np.asarray(peaks, dtype=np.int64)
+
+    def flush(self) -> np.ndarray:
+        """Fin du signal : décide les derniers échantillons."""
+        return self.process(np.empty(0), final=True)
@@ -11,6 +11,7 @@ class ECGRecordOut(BaseModel):
     lieu: Optional[str] = None
     frequence_hz: int
     date_prise: Optional[date] = None
+    hash_contenu: Optional[str] = None  # `v=` pour un cache immuable (voir http_cache.py)
 
     class Config:
         orm_mode = True
@@ -32,3 +33,17 @@ class PatientOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class PatientSummaryOut(BaseModel):
+    """Projection légère pour la liste : pas de détail des ECG."""
+    id: int
+    nom: str
+    prenom: str
+    date_naissance: Optional[date] = None
+    age: Optional[int] = None
+    nb_ecg: int = 0
+    derniere_ecg: Optional[date] = None
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,88 @@
+"""serialization.py
+
+Sérialisation JSON en une passe pour les réponses chargées en tableaux
+NumPy (segments, battements).
+
+Avec `orjson` (dépendance optionnelle), dictionnaires, listes et tableaux
+NumPy sont écrits directement en natif ; NaN et ±Inf deviennent `null`.
+Sans `orjson`, repli sur `json` : les tableaux sont convertis en bloc
+(NaN/Inf → None par masque vectoriel), seuls les petits conteneurs Python
+sont parcourus.
+
+Remplace, pour ces endpoints, la chaîne `sanitize` → `jsonable_encoder` →
+`json.dumps` (trois parcours complets de la réponse).
+"""
+from __future__ import annotations
+
+import datetime
+import json
+from typing import Any
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:  # dépendance optionnelle
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _finite_list(array: np.ndarray) -> list:
+    """Tableau → listes Python, NaN/Inf remplacés par None (sans boucle Python)."""
+    if array.dtype.kind != "f":
+        return array.tolist()
+    finite = np.isfinite(array)
+    if finite.all():
+        return array.tolist()
+    out = array.astype(object)
+    out[~finite] = None
+    return out.tolist()
+
+
+def _default(obj: Any):
+    """Types non gérés nativement (tableaux non contigus, scalaires NumPy, dates)."""
+    if isinstance(obj, np.ndarray):
+        return _finite_list(obj)
+    if isinstance(obj, np.generic):
+        value = obj.item()
+        if isinstance(value, float) and not np.isfinite(value):
+            return None
+        return value
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    raise TypeError(f"Type non sérialisable en JSON : {type(obj).__name__}")
+
+
+def _prepare(obj: Any):
+    """Repli sans orjson : NaN/Inf → None dans les conteneurs, tableaux en bloc."""
+    if isinstance(obj, dict):
+        return {k: _prepare(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_prepare(v) for v in obj]
+    if isinstance(obj, float):
+        return obj if np.isfinite(obj) else None
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return _default(obj)
+    return obj
+
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(
+            obj,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+else:  # pragma: no cover
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(
+            _prepare(obj), default=_default, ensure_ascii=False,
+            allow_nan=False, separators=(",", ":"),
+        ).encode("utf-8")
+
+
+class NumpyJSONResponse(JSONResponse):
+    """JSONResponse acceptant directement dicts et tableaux NumPy (sans jsonable_encoder)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,208 @@
+"""shm_cache.py
+
+Cache des signaux décodés et des index de pics R en mémoire partagée
+(`/dev/shm`), commun à tous les processus d'une machine : workers uvicorn,
+précalcul, workers de batch.py.  Un enregistrement ouvert par plusieurs
+workers n'est décodé et gardé en RAM qu'une fois ; chacun le projette en
+lecture seule (`np.memmap`, sans copie).
+
+Entrées
+-------
+Une entrée par fichier source (dérivation `.f64` / `.ecgz`, artefact
+`.npy`) : `<ECG_SHM_DIR>/<empreinte>.bin`, en-tête de 16 octets (dtype)
+puis les données brutes d'un tableau 1-D.  L'empreinte est celle du chemin,
+de la taille et de la date de modification de la source : un fichier
+réécrit donne une nouvelle entrée, l'ancienne vieillit.  Les fichiers en
+cours d'écriture (modifiés depuis moins de `SETTLE` secondes, import en
+direct) ne sont pas mis en cache.
+
+Index et éviction
+-----------------
+Le répertoire sert d'index : taille des entrées et date du dernier accès
+(`utime` à chaque accès) suffisent à l'éviction LRU, sous un verrou
+(`flock`) du répertoire, quand le total dépasserait `ECG_SHM_MAX_MB`.
+Le compteur de références est tenu par le noyau : chaque processus qui
+projette une entrée garde dessus un verrou partagé (`LOCK_SH`, relâché
+quand il l'oublie, et à sa mort) ; une entrée n'est évincée que si un
+verrou exclusif non bloquant réussit, c'est-à-dire si plus personne ne
+l'utilise.  Chaque processus garde au plus `LOCAL_ENTRIES` entrées
+projetées.
+
+Désactivé avec `ECG_SHM_CACHE=0`, ou sans `fcntl` (Windows) : les
+tableaux sont alors lus à chaque fois, comme avant.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+import metrics
+
+try:  # verrous entre processus (POSIX)
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+ENABLED = os.environ.get("ECG_SHM_CACHE", "1") != "0" and fcntl is not None
+SHM_DIR = Path(os.environ.get("ECG_SHM_DIR", "/dev/shm/ecg-cache"))
+MAX_BYTES = int(os.environ.get("ECG_SHM_MAX_MB", "512")) * 2**20
+LOCAL_ENTRIES = 64  # entrées projetées gardées par processus
+SETTLE = 2.0        # s sans modification avant de mettre une source en cache
+HEADER = 16         # octets : dtype NumPy (ex. b"<f8"), complété par des zéros
+
+_lock = threading.Lock()
+_local: OrderedDict[str, tuple[np.ndarray, int]] = OrderedDict()
+
+
+def _usage() -> dict:
+    if not SHM_DIR.is_dir():
+        return {(): 0}
+    return {(): sum(p.stat().st_size for p in SHM_DIR.glob("*.bin"))}
+
+
+SHM_BYTES = metrics.Gauge(
+    "ecg_shm_cache_bytes", "Taille du cache de signaux en mémoire partagée.", collect=_usage
+)
+
+
+def _entry_name(source: Path, stat: os.stat_result) -> str:
+    key = f"{source.resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _source_entry(source: Path | str) -> Optional[str]:
+    """Nom de l'entrée d'une source, ou None si elle ne doit pas être mise en cache."""
+    if not ENABLED:
+        return None
+    try:
+        stat = Path(source).stat()
+    except OSError:
+        return None
+    if time.time() - stat.st_mtime < SETTLE:
+        return None  # fichier encore en cours d'écriture
+    return _entry_name(Path(source), stat)
+
+
+@contextmanager
+def _dir_lock() -> Iterator[None]:
+    fd = os.open(SHM_DIR / ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _attach(name: str) -> Optional[np.ndarray]:
+    """Projette une entrée existante (référence tenue par un verrou partagé)."""
+    with _lock:
+        hit = _local.get(name)
+        if hit is not None:
+            _local.move_to_end(name)
+            return hit[0]
+    path = SHM_DIR / f"{name}.bin"
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        if os.fstat(fd).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)  # évincée puis recréée entre-temps
+        with os.fdopen(os.dup(fd), "rb") as f:
+            dtype = np.dtype(f.read(HEADER).rstrip(b"\0").decode("ascii"))
+            array = np.memmap(f, dtype=dtype, mode="r", offset=HEADER).view(np.ndarray)
+        os.utime(path)  # dernier accès, pour l'éviction LRU
+    except (OSError, ValueError, TypeError):
+        os.close(fd)
+        return None
+    with _lock:
+        _local[name] = (array, fd)
+        while len(_local) > LOCAL_ENTRIES:
+            _, (_, old_fd) = _local.popitem(last=False)
+            os.close(old_fd)  # relâche la référence ; les vues déjà rendues restent valides
+    return array
+
+
+def _evict(needed: int) -> bool:
+    """Libère de la place (LRU, entrées non référencées) ; False si impossible."""
+    entries = []
+    for path in SHM_DIR.glob("*.bin"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total + needed <= MAX_BYTES:
+            break
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            path.unlink(missing_ok=True)
+        except BlockingIOError:
+            continue  # encore projetée par un processus
+        finally:
+            os.close(fd)
+        total -= size
+    return total + needed <= MAX_BYTES
+
+
+def _publish(name: str, array: np.ndarray) -> bool:
+    SHM_DIR.mkdir(parents=True, exist_ok=True)
+    with _dir_lock():
+        if not _evict(array.nbytes + HEADER):
+            return False
+        tmp = SHM_DIR / f".{name}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(array.dtype.str.encode("ascii").ljust(HEADER, b"\0"))
+                array.tofile(f)
+            os.replace(tmp, SHM_DIR / f"{name}.bin")
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+    return True
+
+
+def peek(source: Path | str) -> Optional[np.ndarray]:
+    """Tableau de `source` s'il est déjà en mémoire partagée, sinon None."""
+    name = _source_entry(source)
+    return _attach(name) if name is not None else None
+
+
+def get_array(source: Path | str, load: Callable[[], np.ndarray]) -> np.ndarray:
+    """Tableau 1-D décodé de `source` (lecture seule), partagé entre processus.
+
+    `load()` lit et décode la source en cas d'absence ; son résultat est
+    publié pour les autres processus.
+    """
+    name = _source_entry(source)
+    if name is None:
+        return load()
+    array = _attach(name)
+    metrics.cache_result("shm", array is not None)
+    if array is not None:
+        return array
+    array = np.ascontiguousarray(load())
+    if array.ndim != 1 or array.nbytes == 0 or array.nbytes > MAX_BYTES // 4:
+        return array
+    try:
+        published = _publish(name, array)
+    except OSError:
+        return array  # /dev/shm plein ou inaccessible : pas de partage
+    shared = _attach(name) if published else None
+    return shared if shared is not None else array
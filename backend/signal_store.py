@@ -0,0 +1,434 @@
+"""signal_store.py
+
+Stockage binaire des signaux ECG.
+
+Stockage en colonnes : chaque dérivation est écrite dans son propre fichier
+de float64 petit-boutiste (`<base>.<dérivation>.f64`, ex.
+`data_csv/jean_dupont_01-01-1970/101.MLII.f64`), sans en-tête : le nombre
+d'échantillons est la taille du fichier divisée par 8.  Afficher une
+dérivation d'un fichier 12 dérivations ne lit donc que les octets de
+celle-ci, par `np.fromfile` / `np.memmap`, sans reparser le CSV.
+
+Les artefacts dérivés d'une dérivation (index des pics R…) sont rangés à
+côté : `<base>.<dérivation>.<nom>.<version>.npy` (`.json` pour les
+résultats non tabulaires, comme la HRV de la fenêtre par défaut ; `.npz`
+pour les tables en colonnes, comme les caractéristiques des battements).  La
+version est l'empreinte de ce qui a servi à les calculer (voir
+`analysis.artifact_version`) : un artefact d'une autre version est ignoré
+à la lecture et remplacé à l'écriture suivante.
+
+Archivage : une dérivation peut être convertie au format compressé `.ecgz`
+(voir codec.py, ~10× plus petit que le CSV d'origine), à l'import avec
+`ECG_SIGNAL_FORMAT=ecgz` ou après coup avec
+`python signal_store.py archive data_csv`.  Les lectures acceptent
+indifféremment les deux formats.
+
+Les signaux chargés en entier et les artefacts sont partagés entre
+processus (workers uvicorn, précalcul, batch) par `shm_cache.py` : décodés
+une fois, projetés sans copie depuis `/dev/shm`, en lecture seule.
+
+`SignalWriter` convertit un CSV reçu par blocs : chaque bloc est haché
+(SHA-256), éventuellement recopié tel quel, puis ses lignes complètes sont
+parsées et ajoutées au fichier binaire.  La mémoire utilisée ne dépend que
+de la taille des blocs, pas de celle du fichier.  Le format du CSV
+(séparateur, en-tête, colonnes) est détecté au préalable par `sniff.py`.
+"""
+from __future__ import annotations
+
+import glob
+import hashlib
+import io
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+import codec
+import shm_cache
+from sniff import SNIFF_SIZE, CSVFormat, sniff_csv
+
+SIGNAL_DTYPE = np.dtype("<f8")  # identique aux valeurs du CSV (pas d’arrondi)
+CHUNK_SIZE = 1 << 20  # 1 Mio
+SIGNAL_FORMAT = os.environ.get("ECG_SIGNAL_FORMAT", "f64")  # "f64" ou "ecgz"
+SIGNAL_SUFFIXES = ("f64", "ecgz")
+ARTIFACT_SUFFIXES = ("npy", "json", "npz")
+
+
+def signal_base(csv_path: Path) -> Path:
+    """Préfixe des fichiers de signal d'un enregistrement (CSV sans extension)."""
+    return Path(csv_path).with_suffix("")
+
+
+def lead_path(base: Path | str, lead: str) -> Path:
+    base = Path(base)
+    return base.with_name(f"{base.name}.{lead}.f64")
+
+
+def archive_path(base: Path | str, lead: str) -> Path:
+    base = Path(base)
+    return base.with_name(f"{base.name}.{lead}.ecgz")
+
+
+def stored_leads(base: Path | str) -> list[str]:
+    """Dérivations présentes sur le disque (`<base>.<dérivation>.f64|ecgz`),
+    quand l'enregistrement ne les connaît pas encore.
+
+    Seuls les noms sans point sont retenus : `101.v2.MLII.f64` appartient à
+    l'enregistrement `101.v2`, pas à la dérivation `v2.MLII` de `101`.
+    """
+    base = Path(base)
+    leads = []
+    for suffix in SIGNAL_SUFFIXES:
+        for path in base.parent.glob(f"{glob.escape(base.name)}.*.{suffix}"):
+            lead = path.name[len(base.name) + 1:-len(suffix) - 1]
+            if lead and "." not in lead and lead not in leads:
+                leads.append(lead)
+    return leads
+
+
+def has_signal(base: Optional[str], leads: Optional[Iterable[str]] = None) -> bool:
+    """Vrai si au moins une dérivation de l'enregistrement est stockée en binaire.
+
+    `leads` : dérivations connues de l'enregistrement (à défaut, lues sur le disque).
+    """
+    if not base:
+        return False
+    leads = list(leads or ()) or stored_leads(base)
+    return any(lead_path(base, lead).exists() or archive_path(base, lead).exists() for lead in leads)
+
+
+def load_signal(base: Path | str, lead: str) -> np.ndarray:
+    """Charge une dérivation complète en float64."""
+    path = lead_path(base, lead)
+    if path.exists():
+        return shm_cache.get_array(path, lambda: np.fromfile(path, dtype=SIGNAL_DTYPE))
+    archived = archive_path(base, lead)
+    if archived.exists():
+        return shm_cache.get_array(archived, lambda: codec.read(archived))
+    raise LookupError(f"La dérivation '{lead}' n'existe pas dans ce fichier")
+
+
+def open_signal(base: Path | str, lead: str) -> np.ndarray | codec.CompressedSignal:
+    """Vue (lecture seule) d'une dérivation, pour ne lire qu'une fenêtre.
+
+    `np.memmap` pour le format brut ; pour une archive `.ecgz`, le signal
+    déjà décodé en mémoire partagée s'il y est, sinon seuls les blocs
+    couvrant les indices demandés sont décompressés.
+    """
+    path = lead_path(base, lead)
+    if path.exists():
+        return np.memmap(path, dtype=SIGNAL_DTYPE, mode="r")
+    archived = archive_path(base, lead)
+    if archived.exists():
+        shared = shm_cache.peek(archived)
+        return shared if shared is not None else codec.CompressedSignal(archived)
+    raise LookupError(f"La dérivation '{lead}' n'existe pas dans ce fichier")
+
+
+def archive_signal(base: Path | str, leads: list[str]) -> dict[str, str]:
+    """Convertit les dérivations brutes en `.ecgz` lorsque c'est sans perte.
+
+    Une dérivation non quantifiable (trop de décimales, hors int16) reste au
+    format brut. Retourne le format final de chaque dérivation.
+    """
+    formats = {}
+    for lead in leads:
+        path = lead_path(base, lead)
+        if not path.exists():
+            formats[lead] = "ecgz" if archive_path(base, lead).exists() else "absent"
+            continue
+        values = np.fromfile(path, dtype=SIGNAL_DTYPE)
+        try:
+            codec.write(archive_path(base, lead), values)
+        except ValueError:
+            formats[lead] = "f64"
+            continue
+        path.unlink()
+        formats[lead] = "ecgz"
+    return formats
+
+
+@contextmanager
+def atomic_open(path: Path | str, mode: str = "wb", **kwargs) -> Iterator[BinaryIO]:
+    """Écrit dans un fichier temporaire voisin renommé à la fin : un lecteur
+    voit l'ancien fichier ou le nouveau complet, jamais un fichier partiel."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def artifact_path(
+    base: Path | str, lead: str, name: str, suffix: str = "npy", version: Optional[str] = None
+) -> Path:
+    base = Path(base)
+    stamp = f".{version}" if version else ""
+    return base.with_name(f"{base.name}.{lead}.{name}{stamp}.{suffix}")
+
+
+def _artifact_versions(base: Path | str, lead: str, name: str, suffix: str) -> list[Path]:
+    """Fichiers d'un artefact, toutes versions confondues (y compris sans version)."""
+    base = Path(base)
+    paths = list(base.parent.glob(f"{glob.escape(f'{base.name}.{lead}.{name}')}.*.{suffix}"))
+    legacy = artifact_path(base, lead, name, suffix)
+    return paths + [legacy] if legacy.exists() else paths
+
+
+def artifact_state(
+    base: Path | str, lead: str, name: str, version: str, suffix: str = "npy"
+) -> str:
+    """`current` (version courante présente), `stale` (autre version) ou `missing`."""
+    if artifact_path(base, lead, name, suffix, version).exists():
+        return "current"
+    return "stale" if _artifact_versions(base, lead, name, suffix) else "missing"
+
+
+def delete_artifact(base: Path | str, lead: str, name: str, suffix: str = "npy") -> None:
+    for path in _artifact_versions(base, lead, name, suffix):
+        path.unlink(missing_ok=True)
+
+
+def delete_artifacts(base: Path | str, lead: str) -> None:
+    """Supprime tous les artefacts dérivés d'une dérivation (tous noms, toutes
+    versions) ; le signal lui-même est conservé."""
+    prefix = Path(base).with_name(f"{Path(base).name}.{lead}")
+    # Artefacts d'un enregistrement voisin nommé `<base>.<dérivation>` : ignorés
+    nested = tuple(f"{other}." for other in stored_leads(prefix))
+    for suffix in ARTIFACT_SUFFIXES:
+        for path in prefix.parent.glob(f"{glob.escape(prefix.name)}.*.{suffix}"):
+            if not path.name[len(prefix.name) + 1:].startswith(nested):
+                path.unlink(missing_ok=True)
+
+
+def _drop_other_versions(base: Path | str, lead: str, name: str, suffix: str, version: Optional[str]) -> None:
+    current = artifact_path(base, lead, name, suffix, version)
+    for path in _artifact_versions(base, lead, name, suffix):
+        if path != current:
+            path.unlink(missing_ok=True)
+
+
+def load_artifact(
+    base: Path | str, lead: str, name: str, version: Optional[str] = None
+) -> Optional[np.ndarray]:
+    """Artefact de la version demandée ; une autre version compte comme absente."""
+    path = artifact_path(base, lead, name, version=version)
+    if not path.exists():
+        return None
+    try:
+        return shm_cache.get_array(path, lambda: np.load(path, allow_pickle=False))
+    except (OSError, ValueError):
+        return None
+
+
+def save_artifact(
+    base: Path | str, lead: str, name: str, array: np.ndarray, version: Optional[str] = None
+) -> None:
+    with atomic_open(artifact_path(base, lead, name, version=version)) as f:
+        np.save(f, np.asarray(array), allow_pickle=False)
+    _drop_other_versions(base, lead, name, "npy", version)
+
+
+def load_json_artifact(
+    base: Path | str, lead: str, name: str, version: Optional[str] = None
+) -> Optional[dict]:
+    path = artifact_path(base, lead, name, "json", version)
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def save_json_artifact(
+    base: Path | str, lead: str, name: str, data: dict, version: Optional[str] = None
+) -> None:
+    with atomic_open(artifact_path(base, lead, name, "json", version), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    _drop_other_versions(base, lead, name, "json", version)
+
+
+def load_table_artifact(
+    base: Path | str, lead: str, name: str, version: Optional[str] = None
+) -> Optional[dict[str, np.ndarray]]:
+    """Table en colonnes (une colonne = un tableau 1-D de même longueur)."""
+    path = artifact_path(base, lead, name, "npz", version)
+    try:
+        with np.load(path, allow_pickle=False) as table:
+            return {column: table[column] for column in table.files}
+    except (OSError, ValueError):
+        return None
+
+
+def save_table_artifact(
+    base: Path | str, lead: str, name: str, columns: dict[str, np.ndarray],
+    version: Optional[str] = None,
+) -> None:
+    with atomic_open(artifact_path(base, lead, name, "npz", version)) as f:
+        np.savez(f, **{column: np.asarray(values) for column, values in columns.items()})
+    _drop_other_versions(base, lead, name, "npz", version)
+
+
+def delete_signal(base: Optional[str], leads: Optional[Iterable[str]] = None) -> None:
+    """Supprime les dérivations `leads` (à défaut, celles lues sur le disque)
+    et leurs artefacts, sans toucher aux enregistrements de même préfixe."""
+    if not base:
+        return
+    for lead in list(leads or ()) or stored_leads(base):
+        lead_path(base, lead).unlink(missing_ok=True)
+        archive_path(base, lead).unlink(missing_ok=True)
+        delete_artifacts(base, lead)
+
+
+class SignalWriter:
+    """Conversion incrémentale CSV → un fichier binaire par dérivation, avec hachage à la volée."""
+
+    def __init__(self, base: Path, fmt: CSVFormat, csv_copy: Optional[Path] = None):
+        self.base = Path(base)
+        self.fmt = fmt
+        self.csv_copy = csv_copy
+        self.n_samples = 0
+        self._sha = hashlib.sha256()
+        self._rest = b""
+        self._skip_header = fmt.has_header
+        self._cols = [fmt.columns.index(lead) for lead in fmt.leads]
+        self._sep = r"\s+" if fmt.delimiter == " " else fmt.delimiter
+        self._csv: Optional[BinaryIO] = None
+        self._out: list[BinaryIO] = []
+        try:
+            self._csv = csv_copy.open("wb") if csv_copy else None
+            for lead in fmt.leads:
+                self._out.append(lead_path(self.base, lead).open("wb"))
+        except Exception:
+            self.abort()  # fichiers déjà ouverts
+            raise
+
+    def feed(self, chunk: bytes) -> None:
+        self._sha.update(chunk)
+        if self._csv is not None:
+            self._csv.write(chunk)
+        data = self._rest + chunk
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            self._rest = data
+            return
+        self._rest = data[cut + 1:]
+        self._parse(data[:cut + 1])
+
+    def append(self, block: np.ndarray) -> None:
+        """Ajoute des échantillons déjà décodés (n × dérivations, import en
+        direct) sans passer par le texte CSV ; à ne pas mélanger avec `feed`.
+
+        Le hachage porte alors sur les échantillons (float64 petit-boutiste) ;
+        la copie CSV éventuelle est formatée à partir d'eux.
+        """
+        block = np.asarray(block).reshape(-1, len(self.fmt.leads))
+        samples = block.astype(SIGNAL_DTYPE)
+        self._sha.update(samples.tobytes())
+        if self._csv is not None:
+            table = pd.DataFrame(block, columns=self.fmt.leads)  # type reçu : float32 écrit sans décimales parasites
+            if self.fmt.index_column:
+                table.insert(0, self.fmt.index_column, np.arange(self.n_samples, self.n_samples + len(block)))
+            self._csv.write(table[self.fmt.columns].to_csv(
+                header=self.fmt.has_header and self._csv.tell() == 0, index=False, sep=self.fmt.delimiter,
+            ).encode("utf-8"))
+        for k, out in enumerate(self._out):
+            np.ascontiguousarray(samples[:, k]).tofile(out)
+        self.n_samples += len(block)
+
+    def _parse(self, block: bytes) -> None:
+        if self._skip_header:
+            _, _, block = block.partition(b"\n")
+            self._skip_header = False
+        if not block.strip():
+            return
+        table = pd.read_csv(
+            io.BytesIO(block), header=None, sep=self._sep,
+            usecols=self._cols, dtype=np.float64,
+        )
+        for col, out in zip(self._cols, self._out):
+            table[col].to_numpy().astype(SIGNAL_DTYPE).tofile(out)
+        self.n_samples += len(table)
+
+    def flush(self) -> None:
+        """Vide les tampons : les dérivations écrites sont lisibles pendant la conversion."""
+        for f in self._out:
+            f.flush()
+
+    def close(self) -> dict:
+        """Termine la conversion et retourne les métadonnées du signal."""
+        if self._rest.strip():
+            self._parse(self._rest + b"\n")
+        self._rest = b""
+        self._close_files()
+        if self.n_samples == 0:
+            raise ValueError("Aucun échantillon dans ce fichier")
+        if SIGNAL_FORMAT == "ecgz":
+            archive_signal(self.base, self.fmt.leads)
+        return {
+            "leads": self.fmt.leads,
+            "lead": self.fmt.default_lead,
+            "n_samples": self.n_samples,
+            "sha256": self._sha.hexdigest(),
+            "signal_base": str(self.base),
+            "fs": self.fmt.sampling_rate,
+            "format": self.fmt.to_dict(),
+        }
+
+    def abort(self) -> None:
+        """Ferme et supprime tout ce qui a été écrit."""
+        self._close_files()
+        delete_signal(str(self.base), self.fmt.leads)
+        if self.csv_copy is not None:
+            self.csv_copy.unlink(missing_ok=True)
+
+    def _close_files(self) -> None:
+        for f in (*self._out, self._csv):
+            if f is not None and not f.closed:
+                f.close()
+
+
+def convert_csv(csv_path: Path | str) -> dict:
+    """Convertit un CSV déjà sur disque (import en masse, anciens enregistrements)."""
+    csv_path = Path(csv_path)
+    with csv_path.open("rb") as f:
+        head = f.read(SNIFF_SIZE)
+        writer = SignalWriter(signal_base(csv_path), sniff_csv(head))  # nettoie en cas d'échec
+        try:
+            writer.feed(head)
+            while chunk := f.read(CHUNK_SIZE):
+                writer.feed(chunk)
+            return writer.close()
+        except Exception:
+            writer.abort()
+            raise
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != "archive":
+        sys.exit("usage : python signal_store.py archive [répertoire]")
+    root = Path(sys.argv[2] if len(sys.argv) > 2 else "data_csv")
+    bases: dict[Path, list[str]] = {}
+    for path in sorted(root.rglob("*.f64")):
+        base_name, lead, _ = path.name.rsplit(".", 2)
+        bases.setdefault(path.with_name(base_name), []).append(lead)
+    before = after = 0
+    for base, leads in bases.items():
+        before += sum(lead_path(base, l).stat().st_size for l in leads)
+        formats = archive_signal(base, leads)
+        after += sum(
+            (archive_path(base, l) if f == "ecgz" else lead_path(base, l)).stat().st_size
+            for l, f in formats.items()
+        )
+        print(f"{base} : {formats}")
+    print(f"{len(bases)} enregistrement(s) : {before / 1e6:.1f} Mo → {after / 1e6:.1f} Mo")
@@ -0,0 +1,144 @@
+"""singleflight.py
+
+Calculs identiques concurrents regroupés (« single-flight ») : si deux
+médecins ouvrent le même nouvel ECG, la classification, les pics R ou un
+même segment ne sont calculés qu'une fois.
+
+Une clé (`("classification", signal, dérivation)`, `("segment", etag)`…)
+désigne un calcul :
+
+* dans le processus, le premier appelant (meneur) calcule ; les appelants
+  concurrents de même clé attendent son résultat (ou son exception) au lieu
+  de recalculer — `run()` depuis un thread, `run_async()` depuis la boucle
+  d'événements (le calcul du meneur part alors dans le pool de threads) ;
+* entre processus (plusieurs workers uvicorn, précalcul, batch.py), le
+  meneur prend un verrou fichier par clé (`fcntl.flock`, dans
+  `ECG_LOCK_DIR`).  Le meneur d'un autre processus attend ce verrou puis
+  relit le cache (`lookup`) avant de calculer : il trouve le résultat que
+  le premier vient d'écrire.  Sans `lookup` (segment, battement : pas de
+  cache côté serveur) ou sans `fcntl` (Windows), le regroupement reste
+  limité au processus.
+
+Le cache lui-même est l'affaire de l'appelant (artefact sur disque…) ; ses
+écritures doivent être atomiques (voir `signal_store.atomic_open`) pour
+qu'un lecteur ne voie jamais de fichier partiel.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Iterator, Optional, TypeVar
+
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+
+try:  # verrous entre processus (POSIX)
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+LOCK_DIR = Path(os.environ.get("ECG_LOCK_DIR", "locks"))
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_inflight: dict[str, Future] = {}
+
+CALLS = metrics.Counter(
+    "ecg_singleflight_total",
+    "Calculs regroupés : meneur (calcule), attente (résultat d'un autre appel), cache (calculé par un autre processus).",
+    ("kind", "role"),
+)
+
+
+def _name(key: tuple) -> str:
+    return "|".join(str(part) for part in key)
+
+
+@contextmanager
+def file_lock(name: str) -> Iterator[None]:
+    """Verrou exclusif entre processus pour une clé (fichier supprimé à la fin)."""
+    if fcntl is None:
+        yield
+        return
+    LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    path = LOCK_DIR / f"{hashlib.sha256(name.encode('utf-8')).hexdigest()[:32]}.lock"
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        # Le fichier a pu être supprimé par le détenteur précédent pendant
+        # l'attente : on recommence sur le fichier courant
+        try:
+            current = os.fstat(fd).st_ino == os.stat(path).st_ino
+        except FileNotFoundError:
+            current = False
+        if current:
+            break
+        os.close(fd)
+    try:
+        yield
+    finally:
+        path.unlink(missing_ok=True)
+        os.close(fd)
+
+
+def _claim(name: str) -> tuple[Future, bool]:
+    with _lock:
+        future = _inflight.get(name)
+        if future is not None:
+            return future, False
+        future = _inflight[name] = Future()
+        return future, True
+
+
+def _lead(name: str, kind: str, future: Future, compute: Callable[[], T],
+          lookup: Optional[Callable[[], Optional[T]]]) -> T:
+    try:
+        # Sans cache partagé (lookup), attendre un autre processus n'apporte rien
+        with file_lock(name) if lookup is not None else nullcontext():
+            result = lookup() if lookup is not None else None
+            if result is None:
+                CALLS.inc(kind=kind, role="leader")
+                result = compute()
+            else:
+                CALLS.inc(kind=kind, role="cached")
+        future.set_result(result)
+    except BaseException as exc:
+        future.set_exception(exc)
+    finally:
+        with _lock:
+            _inflight.pop(name, None)
+    return future.result()
+
+
+def run(key: tuple, compute: Callable[[], T],
+        lookup: Optional[Callable[[], Optional[T]]] = None) -> T:
+    """Résultat de `compute()`, calculé une seule fois pour les appels concurrents.
+
+    `lookup()` relit le cache une fois le verrou pris (None : absent).
+    """
+    name = _name(key)
+    future, leader = _claim(name)
+    if leader:
+        return _lead(name, str(key[0]), future, compute, lookup)
+    CALLS.inc(kind=str(key[0]), role="waiter")
+    with metrics.stage("coalesced", key=name):
+        return future.result()
+
+
+async def run_async(key: tuple, compute: Callable[[], T],
+                    lookup: Optional[Callable[[], Optional[T]]] = None) -> T:
+    """Comme `run()`, sans bloquer la boucle d'événements."""
+    name = _name(key)
+    future, leader = _claim(name)
+    if leader:
+        return await run_in_threadpool(_lead, name, str(key[0]), future, compute, lookup)
+    CALLS.inc(kind=str(key[0]), role="waiter")
+    with metrics.stage("coalesced", key=name):
+        return await asyncio.wrap_future(future)
@@ -0,0 +1,158 @@
+"""sniff.py
+
+Détection rapide du format d'un CSV ECG à partir de ses premiers Kio.
+
+`sniff_csv` identifie le séparateur, la présence d'un en-tête, les colonnes
+de dérivations, une éventuelle colonne de temps (qui permet de déduire la
+fréquence d'échantillonnage) ou d'index d'échantillon, et le type numérique
+des valeurs.  Un fichier inutilisable lève `ValueError` dès l'import, avant
+toute conversion, de même qu'un en-tête aux colonnes en double ou aux noms
+de dérivations inutilisables comme noms de fichiers (`check_lead_names`).
+"""
+from __future__ import annotations
+
+import csv
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import numpy as np
+
+SNIFF_SIZE = 64 * 1024  # octets inspectés
+MIN_ROWS = 2
+DELIMITERS = ",;\t| "
+PREFERRED_LEAD = "MLII"
+
+TIME_COLUMN = re.compile(r"^(t|time|temps|times?\s*\(?(s|sec|ms)\)?|elapsed.*|sec(onds?)?|ms)$", re.I)
+INDEX_COLUMN = re.compile(r"^('?sample\s*#?'?|index|idx|n|#|echantillon)$", re.I)
+# Les dérivations nomment des fichiers (`<base>.<dérivation>.f64`) et sont
+# enregistrées séparées par des virgules (colonne `derivations`)
+FORBIDDEN_IN_LEAD = re.compile(r"[/\\,\x00-\x1f]")
+
+
+@dataclass
+class CSVFormat:
+    delimiter: str = ","
+    has_header: bool = True
+    columns: list[str] = field(default_factory=list)
+    leads: list[str] = field(default_factory=list)
+    time_column: Optional[str] = None
+    time_unit: Optional[str] = None  # "s" ou "ms"
+    index_column: Optional[str] = None
+    dtype: str = "float"
+    sampling_rate: Optional[float] = None  # déduite de la colonne de temps
+
+    @property
+    def default_lead(self) -> str:
+        """Dérivation analysée par défaut : MLII si présente, sinon la première."""
+        return PREFERRED_LEAD if PREFERRED_LEAD in self.leads else self.leads[0]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _is_number(token: str) -> bool:
+    try:
+        float(token)
+        return True
+    except ValueError:
+        return False
+
+
+def _split(line: str, delimiter: str) -> list[str]:
+    if delimiter == " ":
+        return line.split()
+    return [t.strip().strip('"').strip("'") for t in line.split(delimiter)]
+
+
+def check_lead_names(names: list[str]) -> list[str]:
+    """Vérifie des noms de dérivations (en-tête du CSV, enregistrement en direct).
+
+    Lève ValueError pour un nom vide, un séparateur de chemin, une virgule,
+    un point initial ou un doublon.
+    """
+    seen = set()
+    for name in names:
+        if not name or name.startswith(".") or FORBIDDEN_IN_LEAD.search(name):
+            raise ValueError(f"Nom de dérivation invalide : {name!r}")
+        if name in seen:
+            raise ValueError(f"Dérivation en double : {name!r}")
+        seen.add(name)
+    return names
+
+
+def _detect_delimiter(lines: list[str]) -> str:
+    sample = "\n".join(lines[:50])
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        # Une seule colonne (cas des exports MIT-BIH « MLII » seul) ou séparateur ambigu
+        for delimiter in DELIMITERS:
+            counts = {len(_split(l, delimiter)) for l in lines[1:50]}
+            if len(counts) == 1 and counts.pop() > 1:
+                return delimiter
+        return ","
+
+
+def sniff_csv(head: bytes) -> CSVFormat:
+    """Analyse le début d'un fichier. Lève ValueError si le fichier est inutilisable."""
+    text = head.decode("utf-8-sig", errors="replace")
+    lines = text.splitlines()
+    if len(head) >= SNIFF_SIZE and not text.endswith(("\n", "\r")):
+        lines = lines[:-1]  # dernière ligne tronquée
+    lines = [l for l in lines if l.strip()]
+    if not lines:
+        raise ValueError("Fichier vide")
+
+    fmt = CSVFormat(delimiter=_detect_delimiter(lines))
+    first = _split(lines[0], fmt.delimiter)
+    fmt.has_header = not all(_is_number(t) for t in first if t)
+    if fmt.has_header:
+        fmt.columns = [c or f"col{i}" for i, c in enumerate(first)]
+        if len(set(fmt.columns)) != len(fmt.columns):
+            duplicates = sorted({c for c in fmt.columns if fmt.columns.count(c) > 1})
+            raise ValueError(f"Colonnes en double : {', '.join(duplicates)}")
+        rows = lines[1:]
+    else:
+        fmt.columns = [f"ECG{i + 1}" for i in range(len(first))]
+        rows = lines
+    if len(rows) < MIN_ROWS:
+        raise ValueError("Pas assez de lignes de données")
+
+    table = [_split(l, fmt.delimiter) for l in rows]
+    if any(len(r) != len(fmt.columns) for r in table):
+        raise ValueError("Nombre de colonnes variable d'une ligne à l'autre")
+    try:
+        values = np.array(table, dtype=np.float64)
+    except ValueError as exc:
+        raise ValueError(f"Valeurs non numériques : {exc}") from exc
+
+    for i, name in enumerate(fmt.columns):
+        column = values[:, i]
+        steps = np.diff(column)
+        increasing = len(steps) > 0 and bool(np.all(steps > 0))
+        if fmt.time_column is None and TIME_COLUMN.match(name) and increasing:
+            fmt.time_column = name
+        elif fmt.index_column is None and INDEX_COLUMN.match(name) and increasing:
+            fmt.index_column = name
+        elif not fmt.has_header and i == 0 and increasing and np.allclose(steps, steps[0]):
+            # Sans en-tête : une première colonne à pas constant est un temps ou un index
+            if float(steps[0]) == 1.0 and np.all(column == np.round(column)):
+                fmt.index_column = name
+            else:
+                fmt.time_column = name
+        else:
+            fmt.leads.append(name)
+    if not fmt.leads:
+        raise ValueError("Aucune colonne de dérivation ECG trouvée")
+    check_lead_names(fmt.leads)
+
+    if fmt.time_column is not None:
+        step = float(np.median(np.diff(values[:, fmt.columns.index(fmt.time_column)])))
+        fmt.time_unit = "ms" if "ms" in fmt.time_column.lower() or step >= 0.5 else "s"
+        period = step / 1000 if fmt.time_unit == "ms" else step
+        fmt.sampling_rate = round(1.0 / period, 3)
+
+    lead_values = values[:, [fmt.columns.index(l) for l in fmt.leads]]
+    fmt.dtype = "int" if np.all(lead_values == np.round(lead_values)) else "float"
+    return fmt
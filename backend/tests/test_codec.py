@@ -0,0 +1,95 @@
+"""test_codec.py
+
+Aller-retour sans perte du codec `.ecgz` sur des signaux synthétiques
+(sans les CSV fournis) : lectures complètes, fenêtres à cheval sur les
+blocs, index entiers, et repli sur le format brut des signaux non
+quantifiables.
+
+Usage (depuis backend/) :
+    python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import codec  # noqa: E402
+import signal_store  # noqa: E402
+
+BLOCK = 256  # petits blocs : beaucoup de frontières sur un signal court
+
+
+def synthetic(n: int, decimals: int = 3, step: int = 1, seed: int = 0) -> np.ndarray:
+    """Marche aléatoire à `decimals` décimales, comme les valeurs d'un CSV."""
+    rng = np.random.default_rng(seed)
+    q = np.cumsum(rng.integers(-40, 41, n)).clip(-30000, 30000)
+    return (q * step) / 10.0 ** decimals
+
+
+@pytest.mark.parametrize("compressor", codec.available_compressors())
+@pytest.mark.parametrize("decimals, step", [(0, 1), (3, 1), (3, 5), (6, 2)])
+def test_round_trip(tmp_path, compressor, decimals, step):
+    values = synthetic(10 * BLOCK + 37, decimals, step)
+    q, found_decimals, found_step = codec.quantize(values)
+    assert np.array_equal(codec.dequantize(q, found_decimals, found_step), values)
+
+    path = tmp_path / "s.ecgz"
+    path.write_bytes(codec.encode(values, compressor, block_size=BLOCK))
+    signal = codec.CompressedSignal(path)
+    assert len(signal) == len(values)
+    assert np.array_equal(signal.to_array(), values)
+
+
+def test_random_windows(tmp_path):
+    values = synthetic(20 * BLOCK + 5, seed=1)
+    path = tmp_path / "s.ecgz"
+    path.write_bytes(codec.encode(values, block_size=BLOCK))
+    signal = codec.CompressedSignal(path)
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        i0 = int(rng.integers(0, len(values)))
+        i1 = i0 + int(rng.integers(1, 3 * BLOCK))  # souvent plusieurs blocs, parfois au-delà de la fin
+        assert np.array_equal(signal[i0:i1], values[i0:i1])
+    # Fenêtres exactement aux frontières des blocs
+    for b in range(1, 20):
+        edge = b * BLOCK
+        assert np.array_equal(signal[edge - 1:edge + 1], values[edge - 1:edge + 1])
+    indices = rng.integers(0, len(values), 500)
+    assert np.array_equal(signal[indices], values[indices])
+    assert signal[-1] == values[-1]
+
+
+def test_wrapping_deltas(tmp_path):
+    # Sauts de pleine échelle : les deltas int16 débordent, le cumul modulaire doit rester exact
+    values = np.tile([-32768.0, 32767.0, 0.0, 32767.0], BLOCK)
+    path = tmp_path / "s.ecgz"
+    path.write_bytes(codec.encode(values, block_size=BLOCK))
+    assert np.array_equal(codec.CompressedSignal(path).to_array(), values)
+
+
+@pytest.mark.parametrize("values", [
+    np.random.default_rng(3).normal(size=1000),  # trop de décimales
+    np.array([0.0, 40000.0, 1.0]),                # hors int16
+    np.array([0.0, np.nan, 1.0]),                 # non fini
+])
+def test_not_quantizable(values):
+    with pytest.raises(ValueError):
+        codec.quantize(values)
+
+
+def test_archive_falls_back_to_f64(tmp_path):
+    base = tmp_path / "101"
+    exact = synthetic(5 * BLOCK)
+    noisy = np.random.default_rng(4).normal(size=5 * BLOCK)
+    exact.astype(signal_store.SIGNAL_DTYPE).tofile(signal_store.lead_path(base, "MLII"))
+    noisy.astype(signal_store.SIGNAL_DTYPE).tofile(signal_store.lead_path(base, "V5"))
+
+    assert signal_store.archive_signal(base, ["MLII", "V5"]) == {"MLII": "ecgz", "V5": "f64"}
+    assert not signal_store.lead_path(base, "MLII").exists()
+    assert not signal_store.archive_path(base, "V5").exists()
+    assert np.array_equal(signal_store.load_signal(base, "MLII"), exact)
+    assert np.array_equal(signal_store.load_signal(base, "V5"), noisy)
+    assert not list(tmp_path.glob("*.tmp"))
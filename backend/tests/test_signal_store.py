@@ -0,0 +1,73 @@
+"""test_signal_store.py
+
+Fichiers d'un enregistrement (`<base>.<dérivation>.f64`, artefacts) :
+`has_signal`, `delete_signal` et `delete_artifacts` ne touchent pas aux
+enregistrements voisins dont le nom commence par le même préfixe ;
+`SignalWriter.append` (import en direct) écrit les mêmes échantillons que sa
+copie CSV relue.
+
+Usage (depuis backend/) :
+    python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import ingest  # noqa: E402
+import signal_store  # noqa: E402
+
+
+def store(base: Path, leads=("MLII", "V5")) -> None:
+    for lead in leads:
+        np.arange(10.0).astype(signal_store.SIGNAL_DTYPE).tofile(signal_store.lead_path(base, lead))
+        signal_store.save_artifact(base, lead, "rpeaks", np.array([1, 5]), "v1")
+
+
+def test_prefixed_records_are_separate(tmp_path):
+    base, other = tmp_path / "101", tmp_path / "101.v2"
+    store(other)
+    assert not signal_store.has_signal(str(base))
+    assert not signal_store.has_signal(str(base), ["MLII"])
+    assert sorted(signal_store.stored_leads(other)) == ["MLII", "V5"]
+
+    store(base)
+    signal_store.delete_signal(str(base), ["MLII", "V5"])
+    assert not signal_store.has_signal(str(base))
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        f"101.v2.{lead}.{suffix}" for lead in ("MLII", "V5") for suffix in ("f64", "rpeaks.v1.npy")
+    )
+
+    store(base)
+    signal_store.delete_signal(str(base))  # dérivations lues sur le disque
+    signal_store.delete_artifacts(base, "v2")
+    assert len(list(tmp_path.iterdir())) == 4
+
+
+def test_unique_path_avoids_prefixes(tmp_path):
+    store(tmp_path / "101")
+    assert ingest.unique_path(tmp_path / "101.v2.csv").name == "101_v2.csv"
+    assert ingest.unique_path(tmp_path / "101.csv").name == "101_1.csv"
+    assert ingest.unique_path(tmp_path / "[ab].csv").name == "[ab].csv"
+
+
+def test_append_matches_csv_feed(tmp_path):
+    import live
+    fmt = live.live_format(["MLII", "V5"])
+    block = np.column_stack((np.linspace(-1, 1, 50), np.linspace(0, 2, 50))).astype("<f4")
+    writer = signal_store.SignalWriter(tmp_path / "live", fmt, csv_copy=tmp_path / "live.csv")
+    writer.append(block[:20])
+    writer.append(block[20:])
+    assert writer.close()["n_samples"] == 50
+
+    copy = signal_store.SignalWriter(tmp_path / "copy", fmt)
+    copy.feed((tmp_path / "live.csv").read_bytes())
+    copy.close()
+    for k, lead in enumerate(fmt.leads):
+        stored = np.fromfile(signal_store.lead_path(tmp_path / "live", lead))
+        assert np.array_equal(stored, block[:, k].astype(np.float64))
+        # Copie CSV : mêmes valeurs float32 que les échantillons reçus
+        parsed = np.fromfile(signal_store.lead_path(tmp_path / "copy", lead))
+        assert np.array_equal(parsed.astype("<f4"), block[:, k])
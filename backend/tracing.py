@@ -0,0 +1,231 @@
+"""tracing.py
+
+Traces légères : spans imbriqués avec attributs, exportés au format OTLP/JSON.
+
+* chaque requête HTTP ouvre un span racine (middleware de main.py) ; les
+  étapes chronométrées par `metrics.stage()` en sont les enfants, avec leurs
+  attributs (ecg_id, n_samples, n_beats, batch_size…) ;
+* le parent courant suit le contexte (`contextvars`) : les spans ouverts
+  dans le pool de threads (`run_in_threadpool`) sont rattachés à la requête ;
+* un en-tête W3C `traceparent` entrant est repris (même trace côté client,
+  passerelle ou autre processus) et la réponse porte son identifiant
+  (`X-Trace-Id`) ; `inject()` fournit le `traceparent` courant à transmettre
+  à un autre processus.
+
+Export
+------
+Désactivé par défaut (`span()` ne fait alors rien).  Les spans terminés sont
+regroupés et écrits par un thread toutes les `FLUSH_INTERVAL` secondes :
+
+* `ECG_TRACE_FILE=traces.jsonl` : une requête OTLP/JSON
+  (`{"resourceSpans": [...]}`) par ligne, comme l'exporteur fichier du
+  collecteur OpenTelemetry ;
+* `ECG_OTLP_ENDPOINT=http://collecteur:4318` : POST sur `/v1/traces`.
+
+Le service et le pid figurent dans les attributs de ressource : les traces
+de plusieurs processus se regroupent par `traceId`.
+"""
+from __future__ import annotations
+
+import atexit
+import contextvars
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+import requests
+
+TRACE_FILE = os.environ.get("ECG_TRACE_FILE") or None
+OTLP_ENDPOINT = os.environ.get("ECG_OTLP_ENDPOINT") or None
+SERVICE_NAME = os.environ.get("ECG_SERVICE_NAME", "ecg-backend")
+ENABLED = bool(TRACE_FILE or OTLP_ENDPOINT)
+FLUSH_INTERVAL = 1.0
+MAX_BUFFER = 512
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: int
+    attributes: dict = field(default_factory=dict)
+    end: Optional[int] = None
+    error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def rename(self, name: str) -> None:
+        self.name = name
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+class _NoSpan:
+    """Span inactif (traces désactivées) : les attributs sont ignorés."""
+
+    trace_id = None
+    traceparent = None
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def rename(self, name: str) -> None:
+        pass
+
+
+NO_SPAN = _NoSpan()
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("span", default=None)
+
+
+def _hex(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+def set_attributes(**attributes) -> None:
+    """Ajoute des attributs au span courant (sans effet hors d'un span)."""
+    span = _current.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def inject() -> Optional[str]:
+    """`traceparent` du span courant, à transmettre à un autre processus."""
+    span = _current.get()
+    return span.traceparent if span is not None else None
+
+
+@contextmanager
+def span(name: str, traceparent: Optional[str] = None, **attributes) -> Iterator[Span]:
+    """Span enfant du span courant (ou de `traceparent`, ou nouvelle trace)."""
+    if not ENABLED:
+        yield NO_SPAN
+        return
+    parent = _current.get()
+    match = TRACEPARENT.match(traceparent) if traceparent else None
+    if match:
+        trace_id, parent_id = match.group(1), match.group(2)
+    elif parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = _hex(128), None
+    current_span = Span(name, trace_id, _hex(64), parent_id, time.time_ns(), dict(attributes))
+    token = _current.set(current_span)
+    try:
+        yield current_span
+    except BaseException as exc:
+        current_span.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _current.reset(token)
+        current_span.end = time.time_ns()
+        _EXPORTER.add(current_span)
+
+
+# ---------------------------------------------------------------------------
+# Export OTLP/JSON
+# ---------------------------------------------------------------------------
+def _value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(values: dict) -> list[dict]:
+    return [{"key": k, "value": _value(v)} for k, v in values.items() if v is not None]
+
+
+def _otlp_span(s: Span) -> dict:
+    out = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(s.start),
+        "endTimeUnixNano": str(s.end),
+        "attributes": _attributes(s.attributes),
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 0},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+def otlp_request(spans: list[Span]) -> dict:
+    resource = {"service.name": SERVICE_NAME, "process.pid": os.getpid()}
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _attributes(resource)},
+            "scopeSpans": [{"scope": {"name": "ecg"}, "spans": [_otlp_span(s) for s in spans]}],
+        }]
+    }
+
+
+class _Exporter:
+    """Tampon de spans terminés, vidé par un thread ou à l'arrêt du processus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans: list[Span] = []
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, s: Span) -> None:
+        with self._lock:
+            self._spans.append(s)
+            full = len(self._spans) >= MAX_BUFFER
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        if full:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if not spans:
+            return
+        payload = otlp_request(spans)
+        if TRACE_FILE:
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        if OTLP_ENDPOINT:
+            try:
+                requests.post(f"{OTLP_ENDPOINT.rstrip('/')}/v1/traces", json=payload, timeout=5)
+            except requests.RequestException:
+                pass  # collecteur indisponible : les traces sont perdues, pas la requête
+
+
+_EXPORTER = _Exporter()
+
+
+def flush() -> None:
+    """Exporte immédiatement les spans en attente."""
+    _EXPORTER.flush()
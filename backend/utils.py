@@ -1,7 +1,7 @@
 from __future__ import annotations
 from datetime import datetime, date
-import numbers
-import numpy as np
+import base64
+import json
 
 
 def parse_date_flex(value: str) -> date:
@@ -13,21 +13,18 @@ def parse_date_flex(value: str) -> date:
             continue
     raise ValueError(f"Format de date non reconnu : {value}")
 
-def sanitize(obj):
-    if isinstance(obj, dict):
-        return {k: sanitize(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [sanitize(v) for v in obj]
-    if isinstance(obj, (np.integer, int)):
-        return int(obj)
-    if isinstance(obj, (np.floating, float)):
-        if np.isnan(obj) or np.isinf(obj):
-            return None
-        return float(obj)
-    if isinstance(obj, np.ndarray):
-        return sanitize(obj.tolist())
-    if hasattr(obj, "tolist"): 
-        return sanitize(obj.tolist())
-    if isinstance(obj, numbers.Number): 
-        return obj
-    return obj
\ No newline at end of file
+def encode_cursor(values: list) -> str:
+    """Encode la clé de tri de la dernière ligne d'une page (pagination par curseur)."""
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError(f"Curseur invalide : {cursor}") from exc
+    if not isinstance(values, list):
+        raise ValueError(f"Curseur invalide : {cursor}")
+    return values
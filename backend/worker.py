@@ -0,0 +1,87 @@
+"""worker.py
+
+Worker d'analyse pour le mode file d'attente (`ECG_ANALYSIS_MODE=queue`,
+voir jobqueue.py) : exécute les classifications et précalculs planifiés
+par l'API, sur le même stockage (base, signaux, artefacts).
+
+Usage (depuis backend/, avec la même configuration que l'API) :
+    ECG_ANALYSIS_MODE=queue python worker.py           # tourne jusqu'à Ctrl-C
+    python worker.py --processes 4                     # 4 processus worker
+    python worker.py --once                            # vide la file puis s'arrête
+
+Chaque processus charge le modèle une fois, puis prend les tâches une par
+une.  Les processus de l'API n'ont alors besoin ni de TensorFlow ni de
+cœurs pour l'analyse : ajouter des workers suffit à absorber la charge.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from typing import Optional
+
+
+def work(name: str, poll: float, once: bool) -> int:
+    """Boucle d'un processus worker ; retourne le nombre de tâches en erreur."""
+    os.environ["ECG_ANALYSIS_MODE"] = "queue"
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    import analysis
+    import jobqueue
+    jobqueue.WORKER = True
+    import main  # noqa: F401  (déclare les tâches et les étapes de précalcul)
+
+    analysis.get_model()
+    jobqueue.log.info("[%s] prêt", name)
+    failed = 0
+    while True:
+        job = jobqueue.claim(name)
+        if job is None:
+            if once:
+                return failed
+            time.sleep(poll)
+            continue
+        failed += jobqueue.run_job(job) is not None
+
+
+def _run(name: str, poll: float, once: bool) -> None:
+    try:
+        failed = work(name, poll, once)
+    except KeyboardInterrupt:
+        failed = 0
+    sys.exit(1 if failed else 0)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Worker d'analyse (mode file d'attente)")
+    parser.add_argument("--processes", type=int, default=1, help="Processus worker en parallèle")
+    parser.add_argument("--poll", type=float, default=1.0, help="Attente (s) quand la file est vide")
+    parser.add_argument("--once", action="store_true", help="S'arrête quand la file est vide")
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}",
+                        help="Identifiant du worker (suffixé par le numéro de processus)")
+    args = parser.parse_args(argv)
+
+    if args.processes == 1:
+        _run(args.name, args.poll, args.once)
+    # « spawn » : chaque processus importe l'application et charge son propre modèle
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(target=_run, args=(f"{args.name}-{k}", args.poll, args.once))
+        for k in range(args.processes)
+    ]
+    for proc in procs:
+        proc.start()
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.join()
+    return 1 if any(proc.exitcode for proc in procs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,10 @@
 import React, { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { motion } from "framer-motion";
-import { Users, Eye, FileText, PlusCircle, Search, BarChart3, Trash, Plus, X, AlertTriangle, CheckCircle } from "lucide-react";
-import type { Patient, ECG, PatientOut } from "../types";
-import { deleteECG, deletePatient, readCache, writeCache } from "../services/api";
+import { Users, Eye, FileText, PlusCircle, Search, BarChart3, Trash, Plus, X, AlertTriangle, CheckCircle, ChevronDown, ChevronUp } from "lucide-react";
+import type { Patient, ECG } from "../types";
+import { deleteECG, deletePatient, getPatient, listPatientSummaries, writeCache } from "../services/api";
+import type { PatientSummaryOut } from "../services/api";
 
 // -----------------------------------------------------------------------------
 // Composants Toast et Modal
@@ -159,8 +160,13 @@ const mapApiPatient = (api: any): Patient => ({
 const ECGListPage: React.FC = () => {
   const navigate = useNavigate();
   const { toast, showToast, hideToast } = useToast();
-  const [patients, setPatients] = useState<Patient[]>([]);
+  const [patients, setPatients] = useState<PatientSummaryOut[]>([]);
+  // ECG des patients dépliés, chargés à la demande (la liste n'en donne que le nombre)
+  const [details, setDetails] = useState<Record<number, Patient>>({});
+  const [openIds, setOpenIds] = useState<Set<number>>(new Set());
   const [searchTerm, setSearchTerm] = useState<string>("");
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
 
@@ -180,42 +186,64 @@ const ECGListPage: React.FC = () => {
   });
 
   // ---------------------------------------------------------------------------
-  // Fetch patients (au montage)
+  // Fetch patients par pages (pagination par curseur, filtre côté serveur)
   // ---------------------------------------------------------------------------
-  const fetchPatients = async () => {
-    const cached = readCache<Patient[]>("patients");
-    if (cached) {
-      setPatients(cached);
-      setLoading(false);
-    }
+  const PAGE_SIZE = 50;
+
+  const fetchPatients = async (cursor: string | null = null) => {
     try {
-      const res = await fetch("http://localhost:8000/api/patients");
-      if (!res.ok) {
-        throw new Error(`Erreur serveur : ${res.status}`);
-      }
-      const raw: PatientOut[] = await res.json();
-      const data: Patient[] = raw.map(mapApiPatient);
-      setPatients(data);
-      writeCache("patients", data);
-      raw.forEach((p) => writeCache(`patient-${p.id}`, p));
+      const page = await listPatientSummaries({
+        limit: PAGE_SIZE,
+        cursor,
+        sort: "nom",
+        q: searchTerm.trim(),
+      });
+      setPatients((prev) => (cursor ? [...prev, ...page.items] : page.items));
+      setNextCursor(page.nextCursor);
     } catch (err) {
       setError((err as Error).message);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
   useEffect(() => {
-    fetchPatients();
-  }, []);
+    const timer = setTimeout(() => fetchPatients(), 250);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  const fetchDetails = async (patientId: number) => {
+    try {
+      const raw = await getPatient(patientId);
+      writeCache(`patient-${raw.id}`, raw);
+      setDetails((prev) => ({ ...prev, [patientId]: mapApiPatient(raw) }));
+    } catch (e: any) {
+      showToast(`Impossible de charger les ECG : ${e?.response?.data?.detail || e.message}`, 'error');
+    }
+  };
+
+  const toggleECGs = (patientId: number) => {
+    const next = new Set(openIds);
+    if (next.has(patientId)) {
+      next.delete(patientId);
+    } else {
+      next.add(patientId);
+      if (!details[patientId]) fetchDetails(patientId);
+    }
+    setOpenIds(next);
+  };
+
+  const handleLoadMore = () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    fetchPatients(nextCursor);
+  };
 
   // ---------------------------------------------------------------------------
   // Handlers & helpers
   // ---------------------------------------------------------------------------
-  const filteredPatients = patients.filter((patient) => {
-    const fullName = `${patient.firstName} ${patient.lastName}`.toLowerCase();
-    return fullName.includes(searchTerm.toLowerCase());
-  });
+  const filteredPatients = patients;
 
   const handleNavigateToImport = () => navigate("/");
   const handleNavigateToVisualization = (patientId: string | number, ecgId: string | number) =>
@@ -252,6 +280,7 @@ const ECGListPage: React.FC = () => {
       if (confirmModal.type === 'ecg' && confirmModal.patientId && confirmModal.ecgId) {
         await deleteECG(Number(confirmModal.patientId), Number(confirmModal.ecgId));
         showToast('ECG supprimé avec succès !', 'success');
+        fetchDetails(Number(confirmModal.patientId));
       } else if (confirmModal.type === 'patient' && confirmModal.patientId) {
         await deletePatient(Number(confirmModal.patientId));
         showToast('Patient supprimé avec succès !', 'success');
@@ -333,17 +362,32 @@ const ECGListPage: React.FC = () => {
                   <div>
                     <div className="flex items-center">
                       <h3 className="text-lg font-medium text-gray-900 dark:text-white">
-                        {patient.firstName} {patient.lastName}
+                        {patient.prenom} {patient.nom}
                       </h3>
-                      {patient.age !== undefined && (
+                      {patient.age != null && (
                         <span className="ml-2 text-sm text-gray-800 dark:text-gray-200">
                           {patient.age} ans
                         </span>
                       )}
                     </div>
+                    <p className="text-xs text-gray-500 dark:text-gray-400">
+                      {patient.nb_ecg} ECG
+                      {patient.derniere_ecg && ` · dernier le ${new Date(patient.derniere_ecg).toLocaleDateString("fr-FR")}`}
+                    </p>
                   </div>
                 </div>
                 <div className="flex items-center space-x-2">
+                  {patient.nb_ecg > 0 && (
+                    <button
+                      className="p-2 rounded hover:bg-gray-100 dark:hover:bg-gray-700 transition-colors"
+                      title={openIds.has(patient.id) ? "Masquer les ECG" : "Afficher les ECG"}
+                      onClick={() => toggleECGs(patient.id)}
+                    >
+                      {openIds.has(patient.id)
+                        ? <ChevronUp size={22} className="text-gray-600 dark:text-gray-400" />
+                        : <ChevronDown size={22} className="text-gray-600 dark:text-gray-400" />}
+                    </button>
+                  )}
                   <button
                     className="p-2 rounded hover:bg-gray-100 dark:hover:bg-gray-700 transition-colors"
                     title="Ajouter un ECG pour ce patient"
@@ -361,10 +405,13 @@ const ECGListPage: React.FC = () => {
                 </div>
               </div>
 
-              {/* ECG list */}
+              {/* ECG list (chargée au dépliage) */}
+              {(patient.nb_ecg === 0 || openIds.has(patient.id)) && (
               <div className="divide-y divide-gray-100 dark:divide-gray-700">
-                {patient.ecgs.length > 0 ? (
-                  patient.ecgs.map((ecg) => (
+                {patient.nb_ecg > 0 && !details[patient.id] ? (
+                  <div className="p-4 text-center text-sm text-gray-500 dark:text-gray-400">Chargement…</div>
+                ) : patient.nb_ecg > 0 && details[patient.id].ecgs.length > 0 ? (
+                  details[patient.id].ecgs.map((ecg) => (
                     <div key={ecg.id} className="p-4 hover:bg-gray-50 dark:hover:bg-gray-700 transition-colors">
                       <div className="flex items-center justify-between">
                         <div className="flex items-center">
@@ -435,8 +482,18 @@ const ECGListPage: React.FC = () => {
                   </div>
                 )}
               </div>
+              )}
             </motion.div>
           ))}
+          {nextCursor && (
+            <button
+              className="btn btn-outline mx-auto border-gray-300 dark:border-gray-600 text-gray-700 dark:text-gray-200"
+              onClick={handleLoadMore}
+              disabled={loadingMore}
+            >
+              {loadingMore ? "Chargement…" : "Afficher plus de patients"}
+            </button>
+          )}
         </div>
       ) : (
         <div className="card p-6 text-center bg-white dark:bg-gray-800 border-gray-200 dark:border-gray-700">
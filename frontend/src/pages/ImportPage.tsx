@@ -118,7 +118,16 @@ const ImportPage: React.FC = () => {
         } as Patient;
       }
 
-      await uploadEcg(patientPayload, files, ecgData, true);
+      const results = await uploadEcg(patientPayload, files, ecgData, true);
+      const failed = results.filter((r) => r.status !== 'ok');
+      if (failed.length) {
+        const imported = results.length - failed.length;
+        setError(
+          `${imported} fichier(s) importé(s), ${failed.length} en erreur :\n`
+          + failed.map((r) => `${r.file} : ${r.detail}`).join('\n'),
+        );
+        return;
+      }
 
       navigate('/ecg-list');
     } catch (err) {
@@ -137,7 +146,7 @@ const ImportPage: React.FC = () => {
       </h1>
 
       {error && (
-        <div className="mb-6 p-3 bg-accent-50 dark:bg-accent-900/50 border border-accent-300 dark:border-accent-700 text-accent-700 dark:text-accent-300 rounded-md">
+        <div className="mb-6 p-3 whitespace-pre-line bg-accent-50 dark:bg-accent-900/50 border border-accent-300 dark:border-accent-700 text-accent-700 dark:text-accent-300 rounded-md">
           {error}
         </div>
       )}
@@ -19,6 +19,7 @@ export interface ECGRecordOut {
   lieu: string;
   frequence_hz: number;
   date_prise: string | null; 
+  hash_contenu?: string | null; // `v=` rend les réponses d'analyse immuables en cache
 }
 /**
  * Interface décrivant l’objet Patient renvoyé par GET /patients et /patients/{id}
@@ -39,16 +40,55 @@ export interface PatientOut{
 }
 
 /**
- * GET patients 
+ * Projection légère renvoyée par GET /patients/summary
+**/
+export interface PatientSummaryOut {
+  id: number;
+  nom: string;
+  prenom: string;
+  date_naissance: string | null;
+  age: number | null;
+  nb_ecg: number;
+  derniere_ecg: string | null;
+}
+
+export interface PatientPage<T> {
+  items: T[];
+  nextCursor: string | null;
+}
+
+export interface ListPatientsParams {
+  limit?: number;
+  cursor?: string | null;
+  sort?: 'id' | 'nom' | 'prenom';
+  order?: 'asc' | 'desc';
+  q?: string;
+}
+
+/**
+ * GET patients (pagination par curseur, curseur suivant dans l'en-tête X-Next-Cursor)
 **/
 export async function listPatients(
-    skip = 0,
-    limit = 1000
-): Promise<PatientOut[]> {
+    params: ListPatientsParams = {},
+): Promise<PatientPage<PatientOut>> {
+    const { limit = 50, cursor, sort, order, q } = params;
     const response = await api.get<PatientOut[]>('/patients',{
-        params: {skip, limit},
+        params: { limit, cursor: cursor || undefined, sort, order, q: q || undefined },
     });
-    return response.data
+    return { items: response.data, nextCursor: response.headers['x-next-cursor'] ?? null };
+}
+
+/**
+ * GET /patients/summary
+**/
+export async function listPatientSummaries(
+    params: ListPatientsParams = {},
+): Promise<PatientPage<PatientSummaryOut>> {
+    const { limit = 50, cursor, sort, order, q } = params;
+    const response = await api.get<PatientSummaryOut[]>('/patients/summary',{
+        params: { limit, cursor: cursor || undefined, sort, order, q: q || undefined },
+    });
+    return { items: response.data, nextCursor: response.headers['x-next-cursor'] ?? null };
 }
 
 /**
@@ -68,9 +108,11 @@ export interface HRVDomainMetrics {
 export interface SegmentResponse {
   patient_id: number;
   ecg_id: number;
+  lead: string;
   sampling_rate: number;
   t0: number;
   t1: number;
+  target_points: number | null;        // sous-échantillonnage LTTB demandé
   ecg_data: [number, number][];       
   r_peaks: [number, number][];         
   rr_intervals: [number, number][];    
@@ -90,10 +132,12 @@ export async function getECGSegment(
     ecg_id : number,
     t0 : number,
     t1 : number,
+    lead? : string,
+    target_points? : number,   // ex. largeur du graphique en pixels
 ): Promise<SegmentResponse> {
     const response = await api.get(`${patient_id}/${ecg_id}/segment`,
         {
-            params : { t0, t1},
+            params : { t0, t1, lead, target_points},
         }
     );
     return response.data
@@ -105,8 +149,9 @@ export async function getECGSegment(
 export async function getData(
     patient_id : number,
     ecg_id : number,
+    lead? : string,
 ): Promise<SegmentResponse> {
-    const response = await api.get(`${patient_id}/${ecg_id}`);
+    const response = await api.get(`${patient_id}/${ecg_id}`, { params: { lead } });
     return response.data
 }
 
@@ -117,6 +162,7 @@ export interface BeatResponse{
     patient_id : number,
     ecg_id : number,
     beat_index : number,
+    lead : string,
     pre : number,
     post : number,
     r_time : number,
@@ -129,11 +175,12 @@ export interface BeatResponse{
 export async function getBeat(
     patient_id : number,
     ecg_id :number,
-    beat_index : number
+    beat_index : number,
+    lead? : string,
 ): Promise<BeatResponse> {
     const response = await api.get(`/${patient_id}/${ecg_id}/beat`, 
         {
-            params: { beat_index },
+            params: { beat_index, lead },
         }
     )
     return response.data;
@@ -147,6 +194,49 @@ export async function getFS( patient_id : number, ecg_id : number){
     return response.data;
 }
 
+/**
+ * WS /{patient_id}/{ecg_id}/stream : lecture temps réel (protocole dans backend/playback.py)
+**/
+export interface StreamOptions {
+    lead? : string,
+    t0? : number,
+    speed? : number,
+    frame_ms? : number,
+    window? : number,
+}
+
+export interface StreamFrame {
+    seq : number,
+    start : number,          // index du premier échantillon
+    samples : Float32Array,
+}
+
+export function openECGStream(
+    patient_id : number,
+    ecg_id : number,
+    options : StreamOptions = {},
+): WebSocket {
+    const params = new URLSearchParams();
+    Object.entries(options).forEach(([k, v]) => {
+        if (v !== undefined) params.set(k, String(v));
+    });
+    const ws = new WebSocket(
+        `${API_BASE.replace(/^http/, "ws")}/${patient_id}/${ecg_id}/stream?${params}`
+    );
+    ws.binaryType = "arraybuffer";
+    return ws;
+}
+
+export function parseStreamFrame(buffer : ArrayBuffer) : StreamFrame {
+    const view = new DataView(buffer);
+    const count = view.getUint32(12, true);
+    return {
+        seq : view.getUint32(0, true),
+        start : Number(view.getBigUint64(4, true)),
+        samples : new Float32Array(buffer.slice(16, 16 + count * 4)),
+    };
+}
+
 /**
  * DELETE /{patient_id}/{ecg_id}/
 **/
@@ -167,6 +257,7 @@ export function deletePatient( patient_id : number){
 export interface BeatClassification{
   patient_id : number,
   ecg_id : number,
+  lead : string,
   nb_beats : number,
   beatsPrediction : Array<[string, string]>,
 }
@@ -177,8 +268,9 @@ export interface BeatClassification{
 export async function getBeatClassification(
   patient_id : number,
   ecg_id :number, 
+  lead? : string,
 ): Promise<BeatClassification> {
-  const response = await api.post(`/beat-classification/${patient_id}/${ecg_id}`, {});
+  const response = await api.post(`/beat-classification/${patient_id}/${ecg_id}`, {}, { params: { lead } });
   return response.data;
 }
 
@@ -205,11 +297,15 @@ export async function uploadEcg(
   files: File[],
   ecg: Pick<ECG, 'date' | 'location' | 'samplingRate'>,
   convertDatesToFr = false,
-): Promise<EcgUploadResponse[]> {
-  const results: EcgUploadResponse[] = [];
+): Promise<BulkImportFileStatus[]> {
+  const results: BulkImportFileStatus[] = [];
 
   const dd = (d: string) => convertDatesToFr && /^\d{4}-\d{2}-\d{2}$/.test(d) ? isoToFr(d) : d;
 
+  if (files.length > 1) {
+    return uploadEcgBulk(patient, files, ecg, convertDatesToFr);
+  }
+
   for (const file of files){
     const fd = new FormData();
       
@@ -240,13 +336,74 @@ export async function uploadEcg(
       throw new Error(`Erreur ${res.status} : ${detail}`);
     }
 
-    results.push(await res.json());
+    const saved: EcgUploadResponse = await res.json();
+    results.push({ file: file.name, ...saved });
   }
   
   
   return results;
 }
 
+export interface BulkImportFileStatus {
+  file: string;
+  status: 'ok' | 'error';
+  detail?: string;
+  patient_id?: number;
+  ecg_id?: number;
+  csv_path?: string;
+}
+
+export interface BulkImportResponse {
+  status: 'ok' | 'partial' | 'error';
+  imported: number;
+  results: BulkImportFileStatus[];
+}
+
+/**
+ * POST /import_ecg/bulk : tous les fichiers (ou une archive zip/tar) en une seule requête
+**/
+export async function importEcgBulk(fd: FormData): Promise<BulkImportResponse> {
+  const res = await fetch(`${API_BASE}/import_ecg/bulk`, { method: 'POST', body: fd });
+  if (!res.ok) {
+    const detail = (await res.json().catch(() => null))?.detail || res.statusText;
+    throw new Error(`Erreur ${res.status} : ${detail}`);
+  }
+  return res.json();
+}
+
+async function uploadEcgBulk(
+  patient: Patient,
+  files: File[],
+  ecg: Pick<ECG, 'date' | 'location' | 'samplingRate'>,
+  convertDatesToFr = false,
+): Promise<BulkImportFileStatus[]> {
+  const dd = (d: string) => convertDatesToFr && /^\d{4}-\d{2}-\d{2}$/.test(d) ? isoToFr(d) : d;
+  const fd = new FormData();
+
+  fd.append('firstName',      patient.firstName);
+  fd.append('lastName',       patient.lastName);
+  fd.append('dateOfBirth',    dd(patient.dateOfBirth));
+  fd.append('age',            String(patient.age));
+  fd.append('weight',         String(patient.weight));
+  fd.append('height',         String(patient.height));
+  fd.append('address',        patient.address);
+  fd.append('medicalHistory', patient.medicalHistory);
+  fd.append('medication',     String(patient.medication));
+  fd.append('allergies',      patient.allergies);
+  fd.append('date',           dd(ecg.date));
+  fd.append('location',       ecg.location);
+  fd.append('samplingRate',   String(ecg.samplingRate));
+
+  for (const file of files) {
+    const isArchive = /\.(zip|tar|tgz|tar\.gz)$/i.test(file.name);
+    fd.append(isArchive ? 'archive' : 'files', file, file.name);
+  }
+
+  // Les fichiers importés sont déjà enregistrés : résultats partiels renvoyés tels quels
+  const response = await importEcgBulk(fd);
+  return response.results;
+}
+
 
 export const writeCache = (key: string, data: unknown) => {
   try {